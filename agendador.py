@@ -0,0 +1,92 @@
+"""Agendamento adaptativo das consultas à API de cotações.
+
+O próximo intervalo depende de quão perto a cotação está do limite de
+alerta mais próximo e da volatilidade recente: supondo um passeio
+aleatório, a cotação leva em torno de (d/σ)² segundos para andar uma
+distância relativa d quando a volatilidade é σ por √s. Longe dos limites
+(ou sem alertas) consulta-se pouco; perto deles, com mais frequência. Um
+orçamento de requisições por hora (janela deslizante) limita o total.
+"""
+import math
+import time
+from collections import deque
+
+# Volatilidade usada antes de haver amostras (≈ 0,5% ao dia, por √s)
+VOLATILIDADE_INICIAL = 0.005 / math.sqrt(86400)
+
+
+class AgendadorAdaptativo:
+    """Calcula o intervalo até a próxima consulta."""
+
+    def __init__(self, intervalo_min=60, intervalo_max=1800, orcamento_por_hora=120,
+                 fator_seguranca=0.25, meia_vida=3600.0, relogio=time.time):
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.orcamento_por_hora = orcamento_por_hora
+        # Fração do tempo esperado até o limite: menor = mais consultas, menos atraso
+        self.fator_seguranca = fator_seguranca
+        self.meia_vida = meia_vida  # Meia-vida (s) da média exponencial da variância
+        self._relogio = relogio
+        self._requisicoes = deque()  # Horários das requisições na última hora
+        self._ultima = {}  # par -> (horario, valor)
+        self._variancia = {}  # par -> variância dos log-retornos por segundo (EWMA)
+
+    # --- Observações ---
+
+    def registrar_requisicao(self, horario=None):
+        """Conta uma requisição à API no orçamento (inclusive as do /cotacao)."""
+        self._requisicoes.append(self._relogio() if horario is None else horario)
+
+    def registrar_cotacao(self, par, valor, horario=None):
+        """Atualiza a volatilidade do par com uma nova amostra."""
+        horario = self._relogio() if horario is None else horario
+        anterior = self._ultima.get(par)
+        self._ultima[par] = (horario, valor)
+        if anterior is None or horario <= anterior[0] or anterior[1] <= 0:
+            return
+        dt = horario - anterior[0]
+        retorno = math.log(valor / anterior[1])
+        taxa = retorno * retorno / dt
+        # Peso cresce com o tempo decorrido: amostras espaçadas valem mais
+        peso = 1 - 0.5 ** (dt / self.meia_vida)
+        atual = self._variancia.get(par)
+        self._variancia[par] = taxa if atual is None else atual + peso * (taxa - atual)
+
+    def volatilidade(self, par):
+        """Desvio padrão estimado dos log-retornos, por √segundo."""
+        variancia = self._variancia.get(par)
+        return math.sqrt(variancia) if variancia else VOLATILIDADE_INICIAL
+
+    # --- Decisão ---
+
+    def requisicoes_na_ultima_hora(self, agora=None):
+        agora = self._relogio() if agora is None else agora
+        while self._requisicoes and self._requisicoes[0] <= agora - 3600:
+            self._requisicoes.popleft()
+        return len(self._requisicoes)
+
+    def intervalo_por_distancia(self, distancia, volatilidade):
+        """Intervalo (s) para uma distância relativa até o limite mais próximo."""
+        if distancia is None or distancia == math.inf:
+            return self.intervalo_max
+        volatilidade = max(volatilidade, 1e-12)
+        esperado = (max(distancia, 0.0) / volatilidade) ** 2
+        return min(self.intervalo_max, max(self.intervalo_min, self.fator_seguranca * esperado))
+
+    def proximo_intervalo(self, distancias, agora=None):
+        """Segundos até a próxima consulta.
+
+        `distancias` é {par: distância relativa até o limite mais próximo}
+        (None ou ausente quando o par não tem alertas).
+        """
+        agora = self._relogio() if agora is None else agora
+        intervalo = self.intervalo_max
+        for par, distancia in distancias.items():
+            intervalo = min(intervalo, self.intervalo_por_distancia(distancia, self.volatilidade(par)))
+
+        # Orçamento esgotado: espera sair da janela de 1 hora o suficiente para caber mais uma
+        excedente = self.requisicoes_na_ultima_hora(agora) - self.orcamento_por_hora
+        if excedente >= 0:
+            liberacao = self._requisicoes[excedente] + 3600 - agora
+            intervalo = max(intervalo, liberacao)
+        return intervalo
@@ -0,0 +1,346 @@
+"""Índice de alertas de preço ordenado por limite.
+
+Os alertas `acima` e `abaixo` de cada par ficam em listas ordenadas pelo
+valor, então cada verificação encontra os alertas cruzados com uma busca
+binária e os remove em bloco: O(log n + k) por tick em vez de varrer todos
+os alertas. Os alertas relativos ao movimento (`recuo` e `variacao`) ficam
+nas estruturas incrementais de alertas_moveis.py, uma por par. Cada alerta
+pertence à conversa (chat_id) que o criou.
+"""
+import logging
+import math
+from collections import Counter
+from itertools import count
+from operator import attrgetter
+
+from sortedcontainers import SortedList
+
+from alertas_moveis import AlertasMoveis
+from cotacao import PAR_PADRAO
+from modelos import TIPOS_FIXOS, TIPOS_MOVEIS, Alerta, TipoAlerta
+
+TIPOS_ALERTA = TIPOS_FIXOS
+_id = attrgetter('id')
+_chat_id = attrgetter('chat_id')
+_chave = Alerta.chave.fget
+
+
+def valor_valido(tipo, valor):
+    """Limite finito e positivo (acima/abaixo) ou percentual entre 0 e 100 (recuo/variação).
+
+    NaN não se compara com nada: dentro de uma lista ordenada ele quebraria
+    a ordem, e com ela as buscas de todos os alertas do par.
+    """
+    return 0 < valor < (100 if tipo in TIPOS_MOVEIS else math.inf)
+
+
+class IndiceAlertas:
+    """Alertas ativos indexados por id, por conversa, por limite e por (chat, par, valor, tipo)."""
+
+    def __init__(self, alertas=(), chat_padrao=None):
+        self._por_id = {}
+        self._por_chat = {}  # chat_id -> {id: alerta}, na ordem de criação (usada no /listar)
+        # (par, tipo) -> SortedList de (valor, id); 'acima' dispara quando
+        # cotação >= valor e 'abaixo' quando cotação <= valor
+        self._limites = {}
+        self._moveis = {}  # par -> AlertasMoveis (recuo e variacao)
+        self._chats_por_par = {}  # par -> Counter {chat_id: alertas da conversa no par}
+        self._chaves = set()  # (chat_id, par, valor, tipo, janela) para detectar duplicados em O(1)
+        # chat_id -> versão, trocada a cada mudança nos alertas da conversa (invalida
+        # caches como as páginas do /listar); o contador nunca volta, então uma
+        # conversa esvaziada e recriada não repete uma versão antiga
+        self._versoes = {}
+        self._contador_versoes = count(1)
+        self._proximo_id = 1
+        self.carregar(alertas, chat_padrao)
+
+    def __len__(self):
+        return len(self._por_id)
+
+    def __bool__(self):
+        return bool(self._por_id)
+
+    def __iter__(self):
+        return iter(self._por_id.values())
+
+    def _lista(self, par, tipo):
+        lista = self._limites.get((par, tipo))
+        if lista is None:
+            lista = self._limites[(par, tipo)] = SortedList()
+        return lista
+
+    def _movel(self, par):
+        moveis = self._moveis.get(par)
+        if moveis is None:
+            moveis = self._moveis[par] = AlertasMoveis()
+        return moveis
+
+    def _registrar(self, alerta):
+        """Indexa o alerta em tudo, exceto nas listas ordenadas."""
+        if alerta.id is None:
+            alerta.id = self._proximo_id
+        if alerta.id >= self._proximo_id:
+            self._proximo_id = alerta.id + 1
+        self._por_id[alerta.id] = alerta
+        self._por_chat.setdefault(alerta.chat_id, {})[alerta.id] = alerta
+        self._chats_por_par.setdefault(alerta.par, Counter())[alerta.chat_id] += 1
+        self._chaves.add(alerta.chave)
+        self._versoes[alerta.chat_id] = next(self._contador_versoes)
+
+    def _desregistrar(self, alerta):
+        del self._por_id[alerta.id]
+        do_chat = self._por_chat[alerta.chat_id]
+        del do_chat[alerta.id]
+        if not do_chat:
+            del self._por_chat[alerta.chat_id]
+            del self._versoes[alerta.chat_id]
+        else:
+            self._versoes[alerta.chat_id] = next(self._contador_versoes)
+        chats = self._chats_por_par[alerta.par]
+        chats[alerta.chat_id] -= 1
+        if not chats[alerta.chat_id]:
+            del chats[alerta.chat_id]
+            if not chats:
+                del self._chats_por_par[alerta.par]
+        self._chaves.discard(alerta.chave)
+
+    @property
+    def proximo_id(self):
+        return self._proximo_id
+
+    def carregar(self, alertas, chat_padrao=None, proximo_id=1, par_padrao=PAR_PADRAO):
+        """Substitui o conteúdo do índice.
+
+        Alertas sem id recebem um novo; alertas do formato antigo sem chat_id
+        ou sem par passam a pertencer a `chat_padrao` e `par_padrao`.
+        """
+        self._proximo_id = proximo_id
+        self._por_id.clear()
+        self._por_chat.clear()
+        self._limites.clear()
+        self._moveis.clear()
+        self._chats_por_par.clear()
+        self._chaves.clear()
+        self._versoes.clear()
+        alertas = list(alertas)
+        for alerta in alertas:
+            if alerta.chat_id is None:
+                alerta.chat_id = chat_padrao
+            if alerta.par is None:
+                alerta.par = par_padrao
+        self.adicionar_varios(alertas)
+
+    def existe(self, chat_id, par, valor, tipo, janela_ms=None):
+        """Indica se a conversa já tem um alerta com o mesmo par, valor e tipo (e janela)."""
+        return (chat_id, par, valor, tipo, janela_ms) in self._chaves
+
+    def adicionar(self, alerta):
+        """Indexa o alerta, atribuindo um id se ele ainda não tiver um; None se o valor for inválido."""
+        if not valor_valido(alerta.tipo, alerta.valor):
+            logging.warning(f"Alerta ignorado (chat {alerta.chat_id}): valor inválido ({alerta.valor!r})")
+            return None
+        self._registrar(alerta)
+        if alerta.tipo in TIPOS_MOVEIS:
+            self._movel(alerta.par).adicionar(alerta)
+        else:
+            self._lista(alerta.par, alerta.tipo).add((alerta.valor, alerta.id))
+        return alerta
+
+    def adicionar_varios(self, alertas):
+        """Indexa um lote de alertas (ids atribuídos aos que não têm) e devolve o lote.
+
+        Cada estrutura é preenchida de uma vez para o lote todo (é o caminho
+        da carga inicial, com até milhões de alertas): ids, chaves e versões
+        saem de map/zip em C, e só as listas por conversa, por par e por limite
+        passam por um laço Python. Alertas com valor inválido (ex.: NaN vindo
+        de um snapshot ou diário) ficam de fora.
+        """
+        alertas = list(alertas)
+        validos = [a for a in alertas if valor_valido(a.tipo, a.valor)]
+        if len(validos) != len(alertas):
+            logging.warning(f"{len(alertas) - len(validos)} alertas ignorados: valor inválido")
+            alertas = validos
+        maior_id = max((a.id for a in alertas if a.id is not None), default=0)
+        self._proximo_id = max(self._proximo_id, maior_id + 1)
+        for alerta in alertas:
+            if alerta.id is None:
+                alerta.id = self._proximo_id
+                self._proximo_id += 1
+        self._por_id.update(zip(map(_id, alertas), alertas))
+        self._chaves.update(map(_chave, alertas))
+        por_chat = self._por_chat
+        chats_por_par = {}  # par -> chat_id de cada alerta do lote
+        pendentes = {}
+        for alerta in alertas:
+            do_chat = por_chat.get(alerta.chat_id)
+            if do_chat is None:
+                do_chat = por_chat[alerta.chat_id] = {}
+            do_chat[alerta.id] = alerta
+            chat_ids = chats_por_par.get(alerta.par)
+            if chat_ids is None:
+                chat_ids = chats_por_par[alerta.par] = []
+            chat_ids.append(alerta.chat_id)
+            if alerta.tipo in TIPOS_MOVEIS:
+                self._movel(alerta.par).adicionar(alerta)
+                continue
+            limites = pendentes.get((alerta.par, alerta.tipo))
+            if limites is None:
+                limites = pendentes[(alerta.par, alerta.tipo)] = []
+            limites.append((alerta.valor, alerta.id))
+        # Counter.update conta a lista de conversas de cada par em C
+        for par, chat_ids in chats_por_par.items():
+            self._chats_por_par.setdefault(par, Counter()).update(chat_ids)
+        # Uma versão nova, a mesma para todas as conversas do lote: basta que cada uma mude
+        self._versoes.update(dict.fromkeys(map(_chat_id, alertas), next(self._contador_versoes)))
+        # Ordenação em lote: bem mais rápida que inserir um a um
+        for (par, tipo), limites in pendentes.items():
+            self._lista(par, tipo).update(limites)
+        return alertas
+
+    def remover(self, alerta_id):
+        """Remove e devolve o alerta com o id informado (ou None)."""
+        alerta = self._por_id.get(alerta_id)
+        if alerta is not None:
+            self._desregistrar(alerta)
+            if alerta.tipo in TIPOS_MOVEIS:
+                self._guardar_extremos(self._moveis[alerta.par], alerta)
+                self._moveis[alerta.par].remover(alerta_id)
+            else:
+                self._lista(alerta.par, alerta.tipo).remove((alerta.valor, alerta_id))
+        return alerta
+
+    def obter(self, alerta_id):
+        """Alerta com o id informado (ou None)."""
+        return self._por_id.get(alerta_id)
+
+    def chats(self):
+        """Conversas que têm alertas ativos."""
+        return self._por_chat.keys()
+
+    def chats_dos_pares(self, pares):
+        """Conversas que têm alertas ativos em algum dos pares."""
+        return set().union(*(self._chats_por_par.get(par, ()) for par in pares))
+
+    def do_chat(self, chat_id):
+        """Alertas da conversa, na ordem de criação."""
+        return list(self._por_chat.get(chat_id, {}).values())
+
+    def quantidade_do_chat(self, chat_id):
+        return len(self._por_chat.get(chat_id, ()))
+
+    def versao_chat(self, chat_id):
+        """Versão dos alertas da conversa (0 sem alertas); muda a cada adição ou remoção."""
+        return self._versoes.get(chat_id, 0)
+
+    def limpar_chat(self, chat_id):
+        """Remove todos os alertas da conversa e devolve quantos eram."""
+        alertas = self.do_chat(chat_id)
+        for alerta in alertas:
+            self.remover(alerta.id)
+        return len(alertas)
+
+    def limpar(self):
+        """Remove todos os alertas."""
+        self.carregar(())
+
+    def distancia_limite(self, par, cotacao):
+        """Distância relativa da cotação até o limite ativo mais próximo do par (None sem alertas)."""
+        candidatos = []
+        acima = self._limites.get((par, TipoAlerta.ACIMA))
+        if acima:
+            candidatos.append(abs(acima[0][0] - cotacao))
+        abaixo = self._limites.get((par, TipoAlerta.ABAIXO))
+        if abaixo:
+            candidatos.append(abs(cotacao - abaixo[-1][0]))
+        if cotacao <= 0:
+            return None
+        candidatos = [c / cotacao for c in candidatos]
+        moveis = self._moveis.get(par)
+        folga = moveis.folga(cotacao) if moveis else None
+        if folga is not None:
+            # Folga em log da cotação: para variações pequenas, o mesmo que a relativa
+            candidatos.append(folga)
+        return min(candidatos) if candidatos else None
+
+    def observar(self, par, cotacao, timestamp_ms):
+        """Registra uma amostra do par nos alertas móveis (picos, fundos e janelas)."""
+        moveis = self._moveis.get(par)
+        if moveis is not None and cotacao > 0:
+            moveis.observar(timestamp_ms, cotacao)
+
+    def disparar(self, par, cotacao):
+        """Remove e devolve os alertas do par atingidos pela cotação.
+
+        Os alertas móveis comparam com o que já foi observado: chame
+        `observar` com a amostra antes.
+        """
+        disparados = []
+        moveis = self._moveis.get(par)
+        if moveis and cotacao > 0:
+            for alerta_id in moveis.disparar(cotacao):
+                alerta = self._por_id[alerta_id]
+                self._desregistrar(alerta)
+                disparados.append(alerta)
+        # Caso comum, nenhum limite cruzado: basta olhar as pontas das listas
+        acima = self._limites.get((par, TipoAlerta.ACIMA))
+        abaixo = self._limites.get((par, TipoAlerta.ABAIXO))
+        if (not acima or acima[0][0] > cotacao) and (not abaixo or abaixo[-1][0] < cotacao):
+            return disparados
+        acima = self._lista(par, TipoAlerta.ACIMA)
+        abaixo = self._lista(par, TipoAlerta.ABAIXO)
+        fim = acima.bisect_right((cotacao, float('inf')))
+        inicio = abaixo.bisect_left((cotacao, float('-inf')))
+        cruzados = list(acima.islice(0, fim)) + list(abaixo.islice(inicio))
+        del acima[:fim]
+        del abaixo[inicio:]
+
+        for _, alerta_id in cruzados:
+            alerta = self._por_id[alerta_id]
+            self._desregistrar(alerta)
+            disparados.append(alerta)
+        return disparados
+
+    @staticmethod
+    def _guardar_extremos(moveis, alerta):
+        pico, fundo = moveis.extremos(alerta.id)
+        if pico is not None:
+            alerta.pico = pico
+        if fundo is not None:
+            alerta.fundo = fundo
+
+    def sincronizar_moveis(self):
+        """Grava nos alertas móveis o pico e o fundo atuais (persistidos no próximo snapshot)."""
+        for moveis in self._moveis.values():
+            for alerta_id in moveis.ids():
+                self._guardar_extremos(moveis, self._por_id[alerta_id])
+
+    def inicio_moveis(self, par):
+        """Criação (ms) do alerta móvel mais antigo do par, ou None."""
+        moveis = self._moveis.get(par)
+        if not moveis:
+            return None
+        return min(self._por_id[alerta_id].criado_ms for alerta_id in moveis.ids())
+
+    def reconstruir_moveis(self, par, amostras):
+        """Refaz o estado dos alertas móveis do par repassando as amostras do histórico.
+
+        Cada alerta entra na simulação no instante da criação, partindo da
+        referência (ou do pico e fundo gravados no snapshot, se maiores);
+        nada dispara durante a reconstrução.
+        """
+        moveis = self._moveis.get(par)
+        if not moveis:
+            return
+        alertas = sorted((self._por_id[alerta_id] for alerta_id in moveis.ids()), key=attrgetter('criado_ms'))
+        moveis = self._moveis[par] = AlertasMoveis()
+        pendentes = iter(alertas)
+        proximo = next(pendentes, None)
+        for timestamp_ms, cotacao in amostras:
+            while proximo is not None and proximo.criado_ms <= timestamp_ms:
+                moveis.adicionar(proximo)
+                proximo = next(pendentes, None)
+            if cotacao > 0:
+                moveis.observar(timestamp_ms, cotacao)
+        while proximo is not None:
+            moveis.adicionar(proximo)
+            proximo = next(pendentes, None)
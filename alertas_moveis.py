@@ -0,0 +1,325 @@
+"""Alertas relativos ao movimento da cotação, avaliados de forma incremental.
+
+- `recuo`: dispara quando a cotação cai `valor`% desde o maior preço
+  visto depois da criação do alerta (trailing stop);
+- `variacao`: dispara quando a cotação se move `valor`%, para cima ou
+  para baixo, dentro de uma janela de `janela_ms`.
+
+As contas são feitas no log da cotação, onde uma porcentagem vira uma
+distância fixa: cair p% desde o pico é log(cotação) <= log(pico) - d, com
+d = -log(1 - p/100). Assim nenhum alerta precisa ser revisto a cada tick:
+
+- `ParadaMovel` agrupa os alertas que compartilham o mesmo pico (todos os
+  criados depois do último topo) e guarda o nível de disparo de cada grupo
+  em uma lista ordenada; um novo topo funde os grupos que superou.
+- Enquanto a janela de um alerta de variação ainda não passou desde a
+  criação, o movimento é medido desde o pico e o fundo após a criação, com
+  as mesmas `ParadaMovel`. Depois ele "amadurece" e passa a comparar com o
+  máximo e o mínimo da janela (`JanelaExtremos`, deques monotônicas),
+  comuns a todos os alertas com a mesma janela.
+
+Cada amostra custa O(log n) mais os alertas disparados (amortizado).
+"""
+import heapq
+import math
+from collections import deque
+from itertools import count
+
+from sortedcontainers import SortedList
+
+from modelos import TipoAlerta
+
+
+def distancia_queda(percentual):
+    """Distância em log de uma queda de `percentual`% (infinita a partir de 100%)."""
+    return -math.log1p(-percentual / 100) if percentual < 100 else math.inf
+
+
+def distancia_alta(percentual):
+    """Distância em log de uma alta de `percentual`%."""
+    return math.log1p(percentual / 100)
+
+
+class _Grupo:
+    __slots__ = ('extremo', 'distancias', 'seq', 'chave')
+
+    def __init__(self, extremo, seq):
+        self.extremo = extremo
+        self.distancias = SortedList()  # (distância, id)
+        self.seq = seq
+        self.chave = None  # (nível de disparo, seq) em ParadaMovel._niveis, None se vazio
+
+
+class ParadaMovel:
+    """Alertas que disparam quando o valor recua uma distância fixa do máximo desde a criação.
+
+    Alertas criados depois do último topo têm o mesmo máximo e formam um
+    grupo; a pilha de grupos tem máximos decrescentes. Um valor acima do
+    topo funde os grupos que ele supera (o menor entra no maior) e os
+    níveis de disparo (máximo menos a menor distância de cada grupo) ficam
+    em uma lista ordenada.
+    """
+
+    def __init__(self):
+        self._pilha = []  # Grupos com extremo decrescente
+        self._grupos = {}  # seq -> grupo
+        self._grupo_de = {}  # id -> grupo
+        self._distancia = {}  # id -> distância
+        self._niveis = SortedList()  # (nível de disparo, seq) dos grupos com alertas
+        self._seq = count()
+
+    def __len__(self):
+        return len(self._grupo_de)
+
+    def __contains__(self, alerta_id):
+        return alerta_id in self._grupo_de
+
+    def __iter__(self):
+        return iter(self._grupo_de)
+
+    def _reindexar(self, grupo):
+        if grupo.chave is not None:
+            self._niveis.remove(grupo.chave)
+            grupo.chave = None
+        if grupo.distancias:
+            grupo.chave = (grupo.extremo - grupo.distancias[0][0], grupo.seq)
+            self._niveis.add(grupo.chave)
+
+    def _descartar_vazios(self):
+        while self._pilha and not self._pilha[-1].distancias:
+            del self._grupos[self._pilha.pop().seq]
+
+    def adicionar(self, alerta_id, distancia, extremo):
+        """Acompanha o alerta a partir do máximo `extremo` (o valor na criação)."""
+        pilha = self._pilha
+        # Primeiro grupo com extremo <= o do alerta (a pilha é decrescente)
+        posicao = next((i for i in range(len(pilha) - 1, -1, -1) if pilha[i].extremo > extremo), -1) + 1
+        if posicao < len(pilha) and pilha[posicao].extremo == extremo:
+            grupo = pilha[posicao]
+        else:
+            grupo = _Grupo(extremo, next(self._seq))
+            self._grupos[grupo.seq] = grupo
+            pilha.insert(posicao, grupo)
+        grupo.distancias.add((distancia, alerta_id))
+        self._grupo_de[alerta_id] = grupo
+        self._distancia[alerta_id] = distancia
+        self._reindexar(grupo)
+
+    def remover(self, alerta_id):
+        """Para de acompanhar o alerta; indica se ele estava aqui."""
+        grupo = self._grupo_de.pop(alerta_id, None)
+        if grupo is None:
+            return False
+        grupo.distancias.remove((self._distancia.pop(alerta_id), alerta_id))
+        self._reindexar(grupo)
+        self._descartar_vazios()
+        return True
+
+    def extremo(self, alerta_id):
+        return self._grupo_de[alerta_id].extremo
+
+    def atualizar(self, valor):
+        """Registra uma amostra: um novo topo passa a ser o máximo dos grupos que ele supera."""
+        pilha = self._pilha
+        if not pilha or pilha[-1].extremo >= valor:
+            return
+        alvo = pilha.pop()
+        while pilha and pilha[-1].extremo <= valor:
+            outro = pilha.pop()
+            if len(outro.distancias) > len(alvo.distancias):
+                alvo, outro = outro, alvo
+            for _, alerta_id in outro.distancias:
+                self._grupo_de[alerta_id] = alvo
+            alvo.distancias.update(outro.distancias)
+            outro.distancias.clear()
+            self._reindexar(outro)
+            del self._grupos[outro.seq]
+        alvo.extremo = valor
+        pilha.append(alvo)
+        self._reindexar(alvo)
+
+    def disparar(self, valor):
+        """Remove e devolve os ids dos alertas cujo recuo desde o máximo chegou à distância."""
+        niveis = self._niveis
+        if not niveis or niveis[-1][0] < valor:
+            return []
+        disparados = []
+        for chave in list(niveis.irange(minimum=(valor, -1))):
+            grupo = self._grupos[chave[1]]
+            distancias = grupo.distancias
+            fim = distancias.bisect_right((grupo.extremo - valor, math.inf))
+            for _, alerta_id in distancias.islice(0, fim):
+                del self._grupo_de[alerta_id]
+                del self._distancia[alerta_id]
+                disparados.append(alerta_id)
+            del distancias[:fim]
+            self._reindexar(grupo)
+        self._descartar_vazios()
+        return disparados
+
+    def folga(self, valor):
+        """Quanto o valor ainda pode recuar até o próximo disparo (None sem alertas)."""
+        return valor - self._niveis[-1][0] if self._niveis else None
+
+
+class JanelaExtremos:
+    """Máximo e mínimo das amostras dos últimos `duracao_ms`, por deques monotônicas."""
+
+    def __init__(self, duracao_ms):
+        self.duracao_ms = duracao_ms
+        self._maximos = deque()  # (timestamp, valor) com valores decrescentes
+        self._minimos = deque()  # (timestamp, valor) com valores crescentes
+
+    def adicionar(self, timestamp_ms, valor):
+        while self._maximos and self._maximos[-1][1] <= valor:
+            self._maximos.pop()
+        self._maximos.append((timestamp_ms, valor))
+        while self._minimos and self._minimos[-1][1] >= valor:
+            self._minimos.pop()
+        self._minimos.append((timestamp_ms, valor))
+        limite = timestamp_ms - self.duracao_ms
+        while self._maximos[0][0] < limite:
+            self._maximos.popleft()
+        while self._minimos[0][0] < limite:
+            self._minimos.popleft()
+
+    @property
+    def maximo(self):
+        return self._maximos[0][1] if self._maximos else None
+
+    @property
+    def minimo(self):
+        return self._minimos[0][1] if self._minimos else None
+
+
+class _Janela:
+    __slots__ = ('extremos', 'quedas', 'altas', 'alertas')
+
+    def __init__(self, duracao_ms):
+        self.extremos = JanelaExtremos(duracao_ms)
+        self.quedas = SortedList()  # (distância, id) dos alertas maduros
+        self.altas = SortedList()
+        self.alertas = 0  # Alertas (jovens ou maduros) que usam a janela
+
+
+class AlertasMoveis:
+    """Alertas `recuo` e `variacao` de um par."""
+
+    def __init__(self):
+        self._quedas = ParadaMovel()  # Sobre log(cotação): recuos e variações jovens
+        self._altas = ParadaMovel()  # Sobre -log(cotação): variações jovens
+        self._janelas = {}  # janela_ms -> _Janela
+        self._variacoes = {}  # id -> (janela_ms, distância de queda, distância de alta)
+        self._maduros = set()
+        self._amadurecer = []  # heap de (criado + janela, id)
+        self._agora = None  # Timestamp da última amostra
+        self._ultimo = None  # log da última cotação
+
+    def __len__(self):
+        return len(self._quedas) + len(self._maduros)
+
+    def ids(self):
+        return list(self._quedas) + list(self._maduros)
+
+    def adicionar(self, alerta):
+        """Acompanha o alerta a partir da cotação de referência (ou do pico/fundo já gravados)."""
+        alerta_id = alerta.id
+        referencia = alerta.referencia
+        queda = distancia_queda(alerta.valor)
+        pico = math.log(max(referencia, alerta.pico or referencia))
+        if alerta.tipo is TipoAlerta.RECUO:
+            self._quedas.adicionar(alerta_id, queda, pico)
+            return
+        janela_ms = alerta.janela_ms
+        alta = distancia_alta(alerta.valor)
+        janela = self._janelas.get(janela_ms)
+        if janela is None:
+            janela = self._janelas[janela_ms] = _Janela(janela_ms)
+        janela.alertas += 1
+        self._variacoes[alerta_id] = (janela_ms, queda, alta)
+        maduro_em = alerta.criado_ms + janela_ms
+        if self._agora is not None and maduro_em <= self._agora:
+            self._maduros.add(alerta_id)
+            janela.quedas.add((queda, alerta_id))
+            janela.altas.add((alta, alerta_id))
+        else:
+            fundo = math.log(min(referencia, alerta.fundo or referencia))
+            self._quedas.adicionar(alerta_id, queda, pico)
+            self._altas.adicionar(alerta_id, alta, -fundo)
+            heapq.heappush(self._amadurecer, (maduro_em, alerta_id))
+
+    def remover(self, alerta_id):
+        """Para de acompanhar o alerta; indica se ele estava aqui."""
+        variacao = self._variacoes.pop(alerta_id, None)
+        if variacao is None:
+            return self._quedas.remover(alerta_id)
+        janela_ms, queda, alta = variacao
+        janela = self._janelas[janela_ms]
+        if alerta_id in self._maduros:
+            self._maduros.discard(alerta_id)
+            janela.quedas.remove((queda, alerta_id))
+            janela.altas.remove((alta, alerta_id))
+        else:
+            # Fica no heap de amadurecimento até a sua vez: lá é ignorado
+            self._quedas.remover(alerta_id)
+            self._altas.remover(alerta_id)
+        janela.alertas -= 1
+        if not janela.alertas:
+            del self._janelas[janela_ms]
+        return True
+
+    def extremos(self, alerta_id):
+        """(pico, fundo) desde a criação, como cotações; None onde não se aplica."""
+        pico = math.exp(self._quedas.extremo(alerta_id)) if alerta_id in self._quedas else None
+        fundo = math.exp(-self._altas.extremo(alerta_id)) if alerta_id in self._altas else None
+        return pico, fundo
+
+    def observar(self, timestamp_ms, cotacao):
+        """Registra uma amostra: picos, fundos, janelas e amadurecimento das variações."""
+        valor = math.log(cotacao)
+        self._agora = timestamp_ms
+        self._ultimo = valor
+        self._quedas.atualizar(valor)
+        self._altas.atualizar(-valor)
+        for janela in self._janelas.values():
+            janela.extremos.adicionar(timestamp_ms, valor)
+        # A janela já cabe inteira depois da criação: passa a usar os extremos da janela
+        while self._amadurecer and self._amadurecer[0][0] <= timestamp_ms:
+            _, alerta_id = heapq.heappop(self._amadurecer)
+            if alerta_id not in self._variacoes or not self._quedas.remover(alerta_id):
+                continue  # Removido ou disparado antes de amadurecer
+            self._altas.remover(alerta_id)
+            janela_ms, queda, alta = self._variacoes[alerta_id]
+            janela = self._janelas[janela_ms]
+            janela.quedas.add((queda, alerta_id))
+            janela.altas.add((alta, alerta_id))
+            self._maduros.add(alerta_id)
+
+    def disparar(self, cotacao):
+        """Remove e devolve os ids dos alertas atingidos pela cotação (já observada)."""
+        valor = math.log(cotacao)
+        disparados = self._quedas.disparar(valor) + self._altas.disparar(-valor)
+        for janela in self._janelas.values():
+            if not janela.quedas or janela.extremos.maximo is None:
+                continue
+            for lista, movimento in ((janela.quedas, janela.extremos.maximo - valor),
+                                     (janela.altas, valor - janela.extremos.minimo)):
+                fim = lista.bisect_right((movimento, math.inf))
+                disparados.extend(alerta_id for _, alerta_id in lista.islice(0, fim))
+        disparados = list(dict.fromkeys(disparados))  # Uma variação pode atingir os dois lados
+        for alerta_id in disparados:
+            # Variações saem também do outro lado e da janela
+            if alerta_id in self._variacoes:
+                self.remover(alerta_id)
+        return disparados
+
+    def folga(self, cotacao):
+        """Menor variação relativa da cotação que dispararia algum alerta (None sem alertas)."""
+        valor = math.log(cotacao)
+        candidatos = [self._quedas.folga(valor), self._altas.folga(-valor)]
+        for janela in self._janelas.values():
+            if janela.quedas and janela.extremos.maximo is not None:
+                candidatos.append(valor - (janela.extremos.maximo - janela.quedas[0][0]))
+                candidatos.append(janela.extremos.minimo + janela.altas[0][0] - valor)
+        candidatos = [c for c in candidatos if c is not None]
+        return max(0.0, min(candidatos)) if candidatos else None
@@ -0,0 +1,343 @@
+"""Persistência dos alertas com diário (journal) e snapshot compactado.
+
+Cada alteração vira uma linha JSON acrescentada ao diário e sincronizada
+no disco: custo O(1) por mudança, independente do total de alertas. Na
+inicialização o snapshot é lido e o diário é reaplicado por cima. A
+compactação grava um novo snapshot em arquivo temporário e o troca de
+lugar com `os.replace` (atômico), então uma queda nunca deixa o snapshot
+pela metade; no diário, no máximo a última linha fica incompleta.
+
+O snapshot é binário e colunar (alertas.bin ao lado do alertas.json): um
+cabeçalho versionado, a tabela de pares e uma coluna `array` por campo,
+lida com `frombytes` sem interpretar texto; os campos dos alertas móveis
+ficam numa seção à parte, só com as linhas deles. Um milhão de alertas
+carrega em uma fração de segundo, contra vários segundos de json.load. O
+snapshot JSON (lista antiga ou {"versao": 2, ...}) continua sendo lido e é
+convertido na inicialização; ele também é o formato de reserva quando algum
+alerta não cabe nas colunas (chat_id que não é inteiro). O diário
+continua em JSON, com os dicts de `Alerta.para_dict`.
+"""
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import struct
+import sys
+from array import array
+from operator import attrgetter
+
+from modelos import TIPOS_MOVEIS, Alerta, TipoAlerta
+
+VERSAO_SNAPSHOT = 3
+VERSAO_SNAPSHOT_JSON = 2
+MAGICO_SNAPSHOT = b'RBAL'
+# Mágico, versão, próximo id, alertas, alertas móveis e bytes da tabela de pares (JSON)
+CABECALHO_SNAPSHOT = struct.Struct('<4sIqqqI')
+SEM_DATA = -2 ** 63  # criado_ms desconhecido
+SEM_JANELA = -1
+# Ordem dos códigos no snapshot: novos tipos só podem entrar no fim
+TIPOS_SNAPSHOT = tuple(TipoAlerta)
+_CODIGOS_TIPO = {tipo: codigo for codigo, tipo in enumerate(TIPOS_SNAPSHOT)}
+LIMITE_INT64 = 2 ** 63
+
+
+def _coluna(codigo, valores):
+    coluna = array(codigo, valores)
+    if sys.byteorder == 'big':  # O arquivo é sempre little-endian
+        coluna.byteswap()
+    return coluna
+
+
+def codificar_snapshot(alertas, proximo_id):
+    """Bytes do snapshot binário, ou None se algum alerta não cabe nas colunas."""
+    alertas = list(alertas)
+    ids = [a.id for a in alertas]
+    chats = [a.chat_id for a in alertas]
+    if not all(type(v) is int and -LIMITE_INT64 <= v < LIMITE_INT64 for v in ids + chats):
+        return None
+    tabela = {}
+    pares = [tabela.setdefault(a.par, len(tabela)) for a in alertas]
+    if len(tabela) > 0xFFFF or not all(isinstance(par, str) for par in tabela):
+        return None
+    moveis = [i for i, a in enumerate(alertas) if a.tipo in TIPOS_MOVEIS]
+    nan = math.nan
+    colunas = [
+        _coluna('q', ids),
+        _coluna('q', chats),
+        _coluna('H', pares),
+        _coluna('B', [_CODIGOS_TIPO[a.tipo] for a in alertas]),
+        _coluna('d', [a.valor for a in alertas]),
+        _coluna('q', [SEM_DATA if a.criado_ms is None else a.criado_ms for a in alertas]),
+        # Seção dos alertas móveis: posição na lista e os campos só deles
+        _coluna('q', moveis),
+        _coluna('d', [alertas[i].referencia for i in moveis]),
+        _coluna('q', [SEM_JANELA if alertas[i].janela_ms is None else alertas[i].janela_ms for i in moveis]),
+        _coluna('d', [nan if alertas[i].pico is None else alertas[i].pico for i in moveis]),
+        _coluna('d', [nan if alertas[i].fundo is None else alertas[i].fundo for i in moveis]),
+    ]
+    nomes = json.dumps(list(tabela), ensure_ascii=False).encode()
+    cabecalho = CABECALHO_SNAPSHOT.pack(MAGICO_SNAPSHOT, VERSAO_SNAPSHOT, proximo_id, len(alertas),
+                                        len(moveis), len(nomes))
+    return b''.join([cabecalho, nomes] + [coluna.tobytes() for coluna in colunas])
+
+
+def decodificar_snapshot(dados):
+    """(alertas, proximo_id) de um snapshot binário; ValueError se estiver truncado ou for de outra versão."""
+    if len(dados) < CABECALHO_SNAPSHOT.size:
+        raise ValueError("snapshot binário truncado")
+    magico, versao, proximo_id, total, moveis, tamanho_nomes = CABECALHO_SNAPSHOT.unpack_from(dados)
+    if magico != MAGICO_SNAPSHOT or versao != VERSAO_SNAPSHOT:
+        raise ValueError(f"snapshot binário de versão desconhecida ({magico!r} v{versao})")
+    visao = memoryview(dados)
+    posicao = CABECALHO_SNAPSHOT.size
+    tabela = [sys.intern(par) for par in json.loads(bytes(visao[posicao:posicao + tamanho_nomes]))]
+    posicao += tamanho_nomes
+
+    def ler(codigo, quantidade):
+        nonlocal posicao
+        coluna = array(codigo)
+        fim = posicao + coluna.itemsize * quantidade
+        if fim > len(dados):
+            raise ValueError("snapshot binário truncado")
+        coluna.frombytes(visao[posicao:fim])
+        if sys.byteorder == 'big':
+            coluna.byteswap()
+        posicao = fim
+        return coluna  # Iterada direto: sem uma lista intermediária por coluna
+
+    ids, chats = ler('q', total), ler('q', total)
+    pares = map(tabela.__getitem__, ler('H', total))
+    tipos = map(TIPOS_SNAPSHOT.__getitem__, ler('B', total))
+    valores, criados = ler('d', total), ler('q', total)
+    if SEM_DATA in criados:
+        criados = [None if c == SEM_DATA else c for c in criados]
+    # Sem o GC durante a criação: milhões de objetos novos disparariam várias
+    # coletas completas no meio da carga, e os alertas não formam ciclos
+    coletor_ativo = gc.isenabled()
+    gc.disable()
+    try:
+        alertas = list(map(Alerta, ids, chats, pares, valores, tipos, criados))
+    finally:
+        if coletor_ativo:
+            gc.enable()
+    posicoes, referencias, janelas = ler('q', moveis), ler('d', moveis), ler('q', moveis)
+    picos, fundos = ler('d', moveis), ler('d', moveis)
+    for i, referencia, janela_ms, pico, fundo in zip(posicoes, referencias, janelas, picos, fundos):
+        alerta = alertas[i]
+        alerta.referencia = referencia
+        alerta.janela_ms = None if janela_ms == SEM_JANELA else janela_ms
+        alerta.pico = None if math.isnan(pico) else pico
+        alerta.fundo = None if math.isnan(fundo) else fundo
+    return alertas, proximo_id
+
+
+class DiarioAlertas:
+    """Snapshot + diário de alterações dos alertas."""
+
+    def __init__(self, caminho, sincronizar=True, minimo_compactacao=1000):
+        self.caminho = caminho  # Snapshot JSON (o alertas.json antigo e o formato de reserva)
+        self.caminho_binario = os.path.splitext(caminho)[0] + '.bin'
+        self.caminho_diario = caminho + '.diario'
+        self.caminho_antigo = caminho + '.diario.antigo'  # Diário em compactação
+        self.sincronizar = sincronizar
+        self.minimo_compactacao = minimo_compactacao
+        self.entradas = 0  # Entradas no diário desde o último snapshot
+        self._arquivo = None
+        self._compactando = False
+        self.migracao_pendente = False  # Snapshot JSON a regravar (no formato binário, se couber)
+
+    # --- Leitura ---
+
+    def _caminho_snapshot(self):
+        """Snapshot mais recente entre o binário e o JSON (None se não há nenhum).
+
+        Os dois só coexistem se uma queda aconteceu entre gravar um e apagar o outro.
+        """
+        existentes = [c for c in (self.caminho_binario, self.caminho) if os.path.exists(c)]
+        return max(existentes, key=os.path.getmtime, default=None)
+
+    def _ler_snapshot(self):
+        caminho = self._caminho_snapshot()
+        if caminho is None:
+            return {}, 1
+        with open(caminho, 'rb') as f:
+            dados = f.read()
+        if dados.startswith(MAGICO_SNAPSHOT):
+            alertas, proximo_id = decodificar_snapshot(dados)
+            return dict(zip(map(attrgetter('id'), alertas), alertas)), proximo_id
+        dados = json.loads(dados)
+        if isinstance(dados, list):  # Formato antigo: lista simples de alertas
+            dados = {'alertas': dados, 'proximo_id': 1}
+        estado = {}
+        sem_id = []
+        for alerta in map(Alerta.de_dict, dados['alertas']):
+            if alerta.id is None:
+                sem_id.append(alerta)
+            else:
+                estado[alerta.id] = alerta
+        # Alertas antigos sem id recebem um no índice; ficam com chave própria aqui
+        # até que um snapshot novo (compactar_agora) grave os ids definitivos
+        self.migracao_pendente = True
+        proximo_id = max(dados.get('proximo_id', 1), max(estado, default=0) + 1)
+        for i, alerta in enumerate(sem_id):
+            estado[('sem_id', i)] = alerta
+        return estado, proximo_id
+
+    def _reaplicar(self, estado, caminho):
+        """Aplica as entradas de um diário ao estado; devolve (entradas lidas, maior id adicionado)."""
+        if not os.path.exists(caminho):
+            return 0, 0
+        lidas = maior_id = 0
+        with open(caminho, 'r') as f:
+            linhas = f.readlines()
+        for numero, linha in enumerate(linhas, 1):
+            try:
+                entrada = json.loads(linha)
+            except ValueError:
+                # Só a última linha pode estar incompleta (queda durante a escrita)
+                nivel = logging.WARNING if numero == len(linhas) else logging.ERROR
+                logging.log(nivel, f"Entrada inválida ignorada em {caminho}:{numero}")
+                continue
+            maior_id = max(maior_id, self._aplicar(estado, entrada))
+            lidas += 1
+        return lidas, maior_id
+
+    @staticmethod
+    def _aplicar(estado, entrada):
+        """Aplica uma entrada do diário; devolve o maior id que ela adicionou (0 se nenhum)."""
+        op = entrada['op']
+        if op == 'adicionar':
+            alerta = Alerta.de_dict(entrada['alerta'])
+            estado[alerta.id] = alerta
+            return alerta.id
+        elif op == 'adicionar_lote':
+            alertas = [Alerta.de_dict(dados) for dados in entrada['alertas']]
+            estado.update((alerta.id, alerta) for alerta in alertas)
+            return max((alerta.id for alerta in alertas), default=0)
+        elif op == 'remover':
+            for alerta_id in entrada['ids']:
+                estado.pop(alerta_id, None)
+        elif op == 'limpar_chat':
+            for chave in [c for c, a in estado.items() if a.chat_id == entrada['chat_id']]:
+                del estado[chave]
+        elif op == 'limpar':
+            estado.clear()
+        return 0
+
+    def carregar(self):
+        """Lê o snapshot e reaplica os diários; devolve (alertas, proximo_id)."""
+        estado, proximo_id = self._ler_snapshot()
+        # O snapshot guarda o próximo id; só os alertas do diário podem passar dele
+        lidas_antigo, maior_antigo = self._reaplicar(estado, self.caminho_antigo)
+        lidas, maior_id = self._reaplicar(estado, self.caminho_diario)
+        self.entradas = lidas_antigo + lidas
+        return list(estado.values()), max(proximo_id, maior_antigo + 1, maior_id + 1)
+
+    # --- Escrita ---
+
+    def _abrir(self):
+        if self._arquivo is None:
+            self._arquivo = open(self.caminho_diario, 'a+b')
+            # Uma queda pode ter deixado a última linha incompleta: começa numa linha nova
+            if self._arquivo.tell() > 0:
+                self._arquivo.seek(-1, os.SEEK_END)
+                if self._arquivo.read(1) != b'\n':
+                    self._arquivo.write(b'\n')
+        return self._arquivo
+
+    def _acrescentar(self, entrada):
+        f = self._abrir()
+        f.write(json.dumps(entrada, separators=(',', ':')).encode() + b'\n')
+        f.flush()
+        if self.sincronizar:
+            os.fsync(f.fileno())
+        self.entradas += 1
+
+    def registrar_adicao(self, alerta):
+        self._acrescentar({'op': 'adicionar', 'alerta': alerta.para_dict()})
+
+    def registrar_adicoes(self, alertas):
+        """Um lote de alertas em uma única entrada (uma escrita e um fsync)."""
+        if alertas:
+            self._acrescentar({'op': 'adicionar_lote', 'alertas': [a.para_dict() for a in alertas]})
+
+    def registrar_remocao(self, ids):
+        if ids:
+            self._acrescentar({'op': 'remover', 'ids': list(ids)})
+
+    def registrar_limpeza_chat(self, chat_id):
+        self._acrescentar({'op': 'limpar_chat', 'chat_id': chat_id})
+
+    def registrar_limpeza(self):
+        self._acrescentar({'op': 'limpar'})
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    # --- Compactação ---
+
+    def precisa_compactar(self, total_alertas):
+        """Compacta quando reaplicar o diário ficaria caro perto de regravar tudo."""
+        return self.entradas >= max(self.minimo_compactacao, total_alertas // 2)
+
+    def _rotacionar(self):
+        """Move o diário atual para o arquivo em compactação (no event loop)."""
+        self.fechar()
+        if not os.path.exists(self.caminho_diario):
+            return
+        if os.path.exists(self.caminho_antigo):
+            # Compactação anterior falhou: junta os dois para não perder nada
+            with open(self.caminho_diario, 'r') as novo, open(self.caminho_antigo, 'a') as antigo:
+                antigo.write(novo.read())
+                antigo.flush()
+                os.fsync(antigo.fileno())
+            os.remove(self.caminho_diario)
+        else:
+            os.replace(self.caminho_diario, self.caminho_antigo)
+        self.entradas = 0
+
+    def _gravar_snapshot(self, alertas, proximo_id):
+        destino, outro = self.caminho_binario, self.caminho
+        dados = codificar_snapshot(alertas, proximo_id)
+        if dados is None:
+            destino, outro = outro, destino
+            dados = json.dumps({'versao': VERSAO_SNAPSHOT_JSON, 'proximo_id': proximo_id,
+                                'alertas': [a.para_dict() for a in alertas]}, separators=(',', ':')).encode()
+        temporario = destino + '.tmp'
+        with open(temporario, 'wb') as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, destino)
+        # O snapshot do outro formato ficou velho (o recém-gravado é o mais recente)
+        if outro != destino and os.path.exists(outro):
+            os.remove(outro)
+        if os.path.exists(self.caminho_antigo):
+            os.remove(self.caminho_antigo)
+
+    def compactar_agora(self, alertas, proximo_id):
+        """Compacta de forma síncrona (usado na inicialização)."""
+        self._rotacionar()
+        self._gravar_snapshot(alertas, proximo_id)
+        self.migracao_pendente = False
+
+    async def compactar(self, alertas, proximo_id):
+        """Grava um snapshot do estado atual em segundo plano.
+
+        `alertas` deve ser uma cópia tirada no event loop; as alterações
+        feitas durante a compactação vão para um diário novo.
+        """
+        if self._compactando:
+            return False
+        self._compactando = True
+        try:
+            self._rotacionar()
+            await asyncio.to_thread(self._gravar_snapshot, alertas, proximo_id)
+            logging.info(f"Alertas compactados: {len(alertas)} alertas no snapshot")
+            return True
+        finally:
+            self._compactando = False
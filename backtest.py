@@ -0,0 +1,269 @@
+"""Backtest: reproduz um histórico de cotações pelas regras de alerta e notificação do bot.
+
+Uso: python backtest.py cotacoes.csv [--alertas alertas.json] [--limiar 0.1%]
+                        [--janela 20] [--par USD-BRL] [--chat-padrao 1]
+                        [--saida eventos.jsonl] [--textos] [--resumo]
+
+Cada tick passa pelos mesmos Indicadores, IndiceAlertas e regras
+(regras.py) do `notificar_mudanca`, sem rede, Telegram nem escrita no
+diário dos alertas. Saída em JSON Lines: um evento `alerta` para cada
+alerta disparado e um `notificacao` para cada mensagem que seria
+enviada (já divididas no limite de tamanho do Telegram); no fim, um resumo vai para a saída de erro.
+
+Formatos de entrada (lidos em streaming):
+- CSV com cabeçalho: timestamp (epoch em s ou ms, ou ISO 8601), valor
+  (ou bid/cotacao/close) e, opcionalmente, par;
+- JSON Lines com as mesmas chaves;
+- arquivo .serie do histórico do bot (o par vem do nome do arquivo).
+Linhas consecutivas com o mesmo timestamp formam um único tick, como
+uma requisição que traz vários pares.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from alertas import IndiceAlertas
+from armazenamento import DiarioAlertas
+from cotacao import PAR_PADRAO, normalizar_par
+from indicadores import Indicadores
+import regras
+from serie_temporal import SerieTemporal
+
+COLUNAS_TIMESTAMP = ('timestamp', 'data', 'horario', 'time', 'date')
+COLUNAS_VALOR = ('valor', 'bid', 'cotacao', 'close', 'fechamento', 'price')
+COLUNAS_PAR = ('par', 'pair')
+
+
+def timestamp_ms(valor):
+    """Epoch em segundos ou milissegundos, ou data ISO 8601, em milissegundos."""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return int(datetime.fromisoformat(valor).timestamp() * 1000)
+    return int(numero if numero >= 1e11 else numero * 1000)
+
+
+def _coluna(nomes, opcoes, caminho, obrigatoria=True):
+    for opcao in opcoes:
+        if opcao in nomes:
+            return nomes.index(opcao)
+    if obrigatoria:
+        raise ValueError(f"{caminho}: coluna {'/'.join(opcoes)} não encontrada")
+    return None
+
+
+def ler_csv(caminho, par_padrao):
+    with open(caminho, newline='') as f:
+        leitor = csv.reader(f)
+        nomes = [nome.strip().lower() for nome in next(leitor, [])]
+        i_ts = _coluna(nomes, COLUNAS_TIMESTAMP, caminho)
+        i_valor = _coluna(nomes, COLUNAS_VALOR, caminho)
+        i_par = _coluna(nomes, COLUNAS_PAR, caminho, obrigatoria=False)
+        pares = {}  # Texto da coluna -> par normalizado
+        for linha in leitor:
+            if not linha:
+                continue
+            if i_par is None:
+                par = par_padrao
+            else:
+                par = pares.get(linha[i_par])
+                if par is None:
+                    par = pares[linha[i_par]] = normalizar_par(linha[i_par])
+            yield timestamp_ms(linha[i_ts]), par, float(linha[i_valor])
+
+
+def ler_jsonl(caminho, par_padrao):
+    with open(caminho) as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            dados = json.loads(linha)
+            ts = next((dados[c] for c in COLUNAS_TIMESTAMP if c in dados), None)
+            valor = next((dados[c] for c in COLUNAS_VALOR if c in dados), None)
+            if ts is None or valor is None:
+                raise ValueError(f"{caminho}: linha sem timestamp ou valor: {linha.strip()}")
+            par = next((dados[c] for c in COLUNAS_PAR if c in dados), None)
+            yield timestamp_ms(ts), normalizar_par(par) if par else par_padrao, float(valor)
+
+
+def ler_serie(caminho, par_padrao):
+    par = normalizar_par(os.path.splitext(os.path.basename(caminho))[0]) or par_padrao
+    serie = SerieTemporal(caminho)
+    try:
+        for i in range(len(serie)):
+            amostra = serie[i]
+            yield amostra.timestamp_ms, par, amostra.valor
+    finally:
+        serie.fechar()
+
+
+def ler_cotacoes(caminho, par_padrao=PAR_PADRAO):
+    """(timestamp_ms, par, valor) de cada linha do arquivo, na ordem."""
+    if not os.path.exists(caminho):
+        raise ValueError(f"{caminho} não existe")
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.serie':
+        return ler_serie(caminho, par_padrao)
+    if extensao in ('.jsonl', '.ndjson', '.json'):
+        return ler_jsonl(caminho, par_padrao)
+    return ler_csv(caminho, par_padrao)
+
+
+def agrupar_ticks(linhas):
+    """Agrupa linhas consecutivas com o mesmo timestamp em (timestamp_ms, {par: valor})."""
+    atual, cotacoes = None, {}
+    for ts, par, valor in linhas:
+        if ts != atual and cotacoes:
+            yield atual, cotacoes
+            cotacoes = {}
+        atual = ts
+        cotacoes[par] = valor
+    if cotacoes:
+        yield atual, cotacoes
+
+
+def carregar_alertas(caminho, chat_padrao):
+    """Alertas de um snapshot do bot (com o diário ao lado, se houver) ou de uma lista JSON."""
+    diario = DiarioAlertas(caminho)
+    if not os.path.exists(caminho) and not os.path.exists(diario.caminho_binario):
+        raise ValueError(f"{caminho} não existe")
+    alertas, _ = diario.carregar()
+    return IndiceAlertas(alertas, chat_padrao=chat_padrao)
+
+
+class Backtest:
+    """Estado de uma simulação: indicadores por par, alertas ativos e contadores."""
+
+    def __init__(self, alertas, limiar='0.1%', janela=20, chat_padrao=None):
+        self.alertas = alertas
+        self.sigmas, self.percentual = regras.interpretar_limiar(limiar)
+        self.janela = janela
+        self.chat_padrao = chat_padrao
+        self.indicadores = {}
+        self.pares = []  # Na ordem em que aparecem (ordem dos blocos nas mensagens)
+        self.ticks = 0
+        self.mudancas = 0
+        self.disparados = 0
+        self.notificacoes = 0
+
+    def _indicadores(self, par):
+        indicadores = self.indicadores.get(par)
+        if indicadores is None:
+            indicadores = self.indicadores[par] = Indicadores(self.janela)
+            self.pares.append(par)
+        return indicadores
+
+    def processar(self, timestamp, cotacoes):
+        """Aplica um tick; devolve (disparados, [Notificacao])."""
+        self.ticks += 1
+        pares_com_mudanca = set()
+        disparados = []
+        for par, cotacao in cotacoes.items():
+            # Mesma ordem do bot: indicadores na busca, depois regra de mudança e alertas
+            indicadores = self._indicadores(par)
+            indicadores.atualizar(cotacao)
+            if regras.mudanca_relevante(indicadores, cotacao, self.percentual, self.sigmas):
+                pares_com_mudanca.add(par)
+            self.alertas.observar(par, cotacao, timestamp)
+            disparados.extend(self.alertas.disparar(par, cotacao))
+        if not pares_com_mudanca and not disparados:
+            return disparados, []
+
+        self.mudancas += bool(pares_com_mudanca)
+        self.disparados += len(disparados)
+        # Como o bot: conversa padrão e conversas com alertas nos pares que mudaram
+        conversas = self.alertas.chats_dos_pares(pares_com_mudanca)
+        if pares_com_mudanca and self.chat_padrao is not None:
+            conversas.add(self.chat_padrao)
+        # Mensagens montadas sempre: a divisão em partes de até 4096 caracteres depende do texto
+        horario = datetime.fromtimestamp(timestamp / 1000).strftime("%H:%M:%S")
+        notificacoes = regras.montar_notificacoes(cotacoes, self.indicadores.__getitem__, pares_com_mudanca,
+                                                  disparados, conversas, horario, self.pares)
+        self.notificacoes += len(notificacoes)
+        return disparados, notificacoes
+
+
+def executar(args, saida):
+    alertas = carregar_alertas(args.alertas, args.chat_padrao) if args.alertas else IndiceAlertas()
+    backtest = Backtest(alertas, args.limiar, args.janela, args.chat_padrao)
+    total_alertas = len(alertas)
+    linhas = 0
+
+    def contar(iteravel):
+        nonlocal linhas
+        for linha in iteravel:
+            linhas += 1
+            yield linha
+
+    inicio = time.perf_counter()
+    for ts, cotacoes in agrupar_ticks(contar(ler_cotacoes(args.arquivo, args.par))):
+        disparados, notificacoes = backtest.processar(ts, cotacoes)
+        if args.resumo or not (disparados or notificacoes):
+            continue
+        quando = datetime.fromtimestamp(ts / 1000).isoformat(timespec='seconds')
+        for alerta in disparados:
+            evento = {'evento': 'alerta', 'timestamp': quando, 'id': alerta.id, 'chat_id': alerta.chat_id,
+                      'par': alerta.par, 'tipo': alerta.tipo, 'valor': alerta.valor,
+                      'cotacao': cotacoes[alerta.par]}
+            saida.write(json.dumps(evento, ensure_ascii=False) + '\n')
+        for notificacao in notificacoes:
+            evento = {'evento': 'notificacao', 'timestamp': quando, 'chat_id': notificacao.chat_id,
+                      'cotacoes': cotacoes, 'alertas': [a.id for a in notificacao.alertas]}
+            if args.textos:
+                evento['texto'] = notificacao.texto
+            saida.write(json.dumps(evento, ensure_ascii=False) + '\n')
+    duracao = time.perf_counter() - inicio
+
+    return {
+        'linhas': linhas,
+        'ticks': backtest.ticks,
+        'ticks_com_mudanca': backtest.mudancas,
+        'alertas': total_alertas,
+        'alertas_disparados': backtest.disparados,
+        'notificacoes': backtest.notificacoes,
+        'limiar': args.limiar,
+        'janela': args.janela,
+        'segundos': round(duracao, 3),
+        'linhas_por_s': round(linhas / duracao) if duracao > 0 else None,
+    }
+
+
+def conversa(texto):
+    """chat_id numérico ou nome de canal, como o CHAT_ID do bot."""
+    return int(texto) if texto.lstrip('-').isdigit() else texto
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('arquivo', help='cotações em CSV, JSON Lines ou .serie')
+    parser.add_argument('--alertas', help='snapshot de alertas do bot (ex.: alertas.json; lê o alertas.bin ao lado)')
+    parser.add_argument('--limiar', default=os.getenv('LIMIAR_MUDANCA', '0.1%'),
+                        help="mudança que gera notificação: '0.1%%' ou '2sigma'")
+    parser.add_argument('--janela', type=int, default=int(os.getenv('INDICADORES_JANELA', 20)))
+    parser.add_argument('--par', type=normalizar_par, default=PAR_PADRAO, help='par das linhas sem coluna par')
+    # Como o CHAT_PADRAO do bot: sem uma conversa padrão, as mudanças só chegariam a quem tem
+    # alertas e, depois que todos disparam, nenhuma notificação de mudança seria contada
+    parser.add_argument('--chat-padrao', type=conversa, default=os.getenv('CHAT_ID', 'padrao'),
+                        help="conversa padrão, que recebe as mudanças (padrão: CHAT_ID do bot ou 'padrao')")
+    parser.add_argument('--saida', help='arquivo de eventos (padrão: saída padrão)')
+    parser.add_argument('--textos', action='store_true', help='inclui o texto de cada mensagem')
+    parser.add_argument('--resumo', action='store_true', help='só o resumo, sem eventos')
+    args = parser.parse_args()
+
+    saida = open(args.saida, 'w', encoding='utf-8') if args.saida else sys.stdout
+    try:
+        resumo = executar(args, saida)
+    except (ValueError, KeyError, IndexError) as e:
+        parser.error(f"entrada inválida: {e}")
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    print(json.dumps(resumo, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
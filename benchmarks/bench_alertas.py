@@ -0,0 +1,96 @@
+"""Micro-benchmark da verificação de alertas: varredura linear x índice ordenado.
+
+Uso: python benchmarks/bench_alertas.py [--alertas 1000000] [--ticks 100]
+
+Gera alertas sintéticos com limites em torno de 5.00 e mede a construção
+do índice, um tick sem disparos, um tick que dispara ~0,01% dos alertas e
+a checagem de duplicados do /alerta.
+"""
+import argparse
+import json
+import random
+import time
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from alertas import IndiceAlertas
+from modelos import Alerta
+
+
+def gerar_alertas(quantidade, semente=42):
+    # "acima" em (5, 6] e "abaixo" em [4, 5): a cotação 5.00 não dispara nenhum
+    aleatorio = random.Random(semente)
+    alertas = []
+    for _ in range(quantidade):
+        if aleatorio.random() < 0.5:
+            alertas.append({'valor': round(aleatorio.uniform(5.000001, 6.0), 6), 'tipo': 'acima'})
+        else:
+            alertas.append({'valor': round(aleatorio.uniform(4.0, 4.999999), 6), 'tipo': 'abaixo'})
+    for alerta in alertas:
+        alerta['chat_id'] = aleatorio.randrange(10000)
+        alerta['par'] = 'USD-BRL'
+        alerta['criado_em'] = '2025-01-01T00:00:00'
+    return alertas
+
+
+def verificar_linear(alertas_ativos, cotacao_atual):
+    # Algoritmo anterior do verificar_alertas
+    alertas_disparados = []
+    for alerta in alertas_ativos[:]:
+        if (alerta['tipo'] == 'acima' and cotacao_atual >= alerta['valor']) or \
+           (alerta['tipo'] == 'abaixo' and cotacao_atual <= alerta['valor']):
+            alertas_disparados.append(alerta)
+            alertas_ativos.remove(alerta)
+    return alertas_disparados
+
+
+def existe_linear(alertas_ativos, chat_id, valor, tipo):
+    return any(a['chat_id'] == chat_id and a['valor'] == valor and a['tipo'] == tipo
+               for a in alertas_ativos)
+
+
+def cronometrar(funcao, repeticoes=1):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def main(args):
+    alertas = gerar_alertas(args.alertas)
+    calmo = 5.0
+    # Cotação que atinge ~0,01% dos alertas "acima" (os de limite mais baixo)
+    limites_acima = sorted(a['valor'] for a in alertas if a['tipo'] == 'acima')
+    cotacao_disparo = limites_acima[max(0, len(limites_acima) // 10000 - 1)]
+
+    linear = [dict(a) for a in alertas]
+    construcao_ms, indice = cronometrar(lambda: IndiceAlertas(Alerta.de_dict(a) for a in alertas))
+
+    resultados = {
+        'alertas': args.alertas,
+        'construcao_indice_ms': round(construcao_ms, 1),
+        'tick_sem_disparo_ms': {
+            'linear': round(cronometrar(lambda: verificar_linear(linear, calmo), 3)[0], 3),
+            'indice': round(cronometrar(lambda: indice.disparar('USD-BRL', calmo), args.ticks)[0], 5),
+        },
+        'duplicado_ms': {
+            'linear': round(cronometrar(lambda: existe_linear(linear, 1, 9.99, 'acima'), 3)[0], 3),
+            'indice': round(cronometrar(lambda: indice.existe(1, 'USD-BRL', 9.99, 'acima'), args.ticks)[0], 6),
+        },
+    }
+
+    t_indice, disparados = cronometrar(lambda: indice.disparar('USD-BRL', cotacao_disparo))
+    resultados['tick_com_disparo'] = {'disparados': len(disparados), 'indice_ms': round(t_indice, 3)}
+    if args.linear_com_disparo:
+        t_linear, _ = cronometrar(lambda: verificar_linear(linear, cotacao_disparo))
+        resultados['tick_com_disparo']['linear_ms'] = round(t_linear, 1)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alertas', type=int, default=1_000_000)
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--linear-com-disparo', action='store_true',
+                        help='também mede o tick com disparos na varredura linear (O(n·k), lento)')
+    main(parser.parse_args())
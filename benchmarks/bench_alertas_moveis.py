@@ -0,0 +1,131 @@
+"""Alertas de recuo e variação: estruturas incrementais x revisão de cada alerta por tick.
+
+Uso: python benchmarks/bench_alertas_moveis.py [--alertas 20000] [--ticks 1000]
+
+Cria alertas `recuo` (1% a 5%) e `variacao` (1% a 5% em 10m, 1h ou 1d)
+ao longo de um passeio aleatório da cotação e mede o custo por tick de:
+
+- incremental: IndiceAlertas.observar + disparar (pilha de picos,
+  níveis ordenados e deques monotônicas por janela);
+- ingenuo: atualizar o pico/fundo de cada alerta e comparar com o máximo e
+  o mínimo da janela, alerta por alerta (as janelas usam as mesmas deques).
+
+Os dois caminhos têm de disparar exatamente os mesmos alertas.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from alertas import IndiceAlertas
+from alertas_moveis import JanelaExtremos
+from modelos import Alerta
+
+JANELAS_MS = (600_000, 3_600_000, 86_400_000)
+INICIO_MS = 1_700_000_000_000
+
+
+def gerar(args):
+    """Ticks [(timestamp, cotação)] e alertas criados ao longo do primeiro terço deles."""
+    aleatorio = random.Random(args.semente)
+    ticks, cotacao, ts = [], 5.0, INICIO_MS
+    for _ in range(args.ticks):
+        ts += 60_000
+        cotacao *= math.exp(aleatorio.gauss(0, 0.001))
+        ticks.append((ts, cotacao))
+    alertas = []
+    for alerta_id in range(1, args.alertas + 1):
+        posicao = aleatorio.randrange(max(1, args.ticks // 3))
+        ts, cotacao = ticks[posicao]
+        alerta = {'id': alerta_id, 'chat_id': aleatorio.randrange(10000), 'par': 'USD-BRL',
+                  'valor': round(aleatorio.uniform(1, 5), 2), 'tipo': aleatorio.choice(('recuo', 'variacao')),
+                  'criado_em': datetime.fromtimestamp(ts / 1000).isoformat(), 'referencia': cotacao,
+                  '_tick': posicao}
+        if alerta['tipo'] == 'variacao':
+            alerta['janela_ms'] = aleatorio.choice(JANELAS_MS)
+        alertas.append(alerta)
+    return ticks, alertas
+
+
+def por_tick(alertas):
+    criados = {}
+    for alerta in alertas:
+        criados.setdefault(alerta['_tick'], []).append(alerta)
+    return criados
+
+
+def incremental(ticks, alertas):
+    indice = IndiceAlertas()
+    criados = por_tick(alertas)
+    disparados, duracao = [], 0.0
+    for posicao, (ts, cotacao) in enumerate(ticks):
+        inicio = time.perf_counter()
+        indice.observar('USD-BRL', cotacao, ts)
+        disparados.extend(a.id for a in indice.disparar('USD-BRL', cotacao))
+        duracao += time.perf_counter() - inicio
+        for alerta in criados.get(posicao, ()):
+            indice.adicionar(Alerta.de_dict(alerta))
+    return disparados, duracao
+
+
+def ingenuo(ticks, alertas):
+    criados = por_tick(alertas)
+    ativos = {}  # id -> [alerta, pico, fundo, criado_ms]
+    janelas = {janela_ms: JanelaExtremos(janela_ms) for janela_ms in JANELAS_MS}
+    disparados, duracao = [], 0.0
+    for posicao, (ts, cotacao) in enumerate(ticks):
+        inicio = time.perf_counter()
+        for janela in janelas.values():
+            janela.adicionar(ts, cotacao)
+        for alerta_id, estado in list(ativos.items()):
+            alerta = estado[0]
+            estado[1] = max(estado[1], cotacao)
+            estado[2] = min(estado[2], cotacao)
+            fator = alerta['valor'] / 100
+            if alerta['tipo'] == 'recuo':
+                atingido = math.log(cotacao) <= math.log(estado[1]) + math.log1p(-fator)
+            else:
+                janela = janelas[alerta['janela_ms']]
+                if ts - estado[3] < alerta['janela_ms']:
+                    maximo, minimo = estado[1], estado[2]
+                else:
+                    maximo, minimo = janela.maximo, janela.minimo
+                atingido = (math.log(cotacao) <= math.log(maximo) + math.log1p(-fator)
+                            or math.log(cotacao) >= math.log(minimo) + math.log1p(fator))
+            if atingido:
+                del ativos[alerta_id]
+                disparados.append(alerta_id)
+        duracao += time.perf_counter() - inicio
+        for alerta in criados.get(posicao, ()):
+            criado = int(datetime.fromisoformat(alerta['criado_em']).timestamp() * 1000)
+            ativos[alerta['id']] = [alerta, alerta['referencia'], alerta['referencia'], criado]
+    return disparados, duracao
+
+
+def main(args):
+    ticks, alertas = gerar(args)
+    disparados_incremental, duracao_incremental = incremental(ticks, alertas)
+    disparados_ingenuo, duracao_ingenuo = ingenuo(ticks, alertas)
+    iguais = sorted(disparados_incremental) == sorted(disparados_ingenuo)
+    print(json.dumps({
+        'parametros': vars(args),
+        'disparados': len(disparados_incremental),
+        'mesmos_disparos': iguais,
+        'incremental_us_por_tick': round(duracao_incremental / len(ticks) * 1e6, 1),
+        'ingenuo_us_por_tick': round(duracao_ingenuo / len(ticks) * 1e6, 1),
+        'aceleracao': round(duracao_ingenuo / duracao_incremental, 1),
+    }, indent=2))
+    if not iguais:
+        raise SystemExit("os dois caminhos dispararam alertas diferentes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alertas', type=int, default=20000)
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--semente', type=int, default=42)
+    main(parser.parse_args())
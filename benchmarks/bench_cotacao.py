@@ -0,0 +1,59 @@
+"""Latência do /cotacao sob carga concorrente: busca bloqueante x cliente assíncrono.
+
+Uso: python benchmarks/bench_cotacao.py [--usuarios 50] [--latencia 0.2]
+
+Simula N comandos /cotacao chegando ao mesmo tempo contra um servidor stub
+local. "antes" reproduz o caminho antigo (requisição HTTP síncrona dentro do
+handler async); "depois" usa o ClienteCotacao com pool de conexões.
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+
+from stubs import ServidorStub, resumo_latencias
+
+from cotacao import ClienteCotacao
+
+
+async def comando_bloqueante(url):
+    # Mesmo comportamento do buscar_cotacao_atual antigo: bloqueia o event loop
+    with urllib.request.urlopen(url, timeout=10) as resposta:
+        return float(json.load(resposta)['USDBRL']['bid'])
+
+
+async def simular(usuarios, buscar):
+    """Dispara `usuarios` comandos simultâneos e mede a latência de cada um."""
+    # Todos os comandos chegam no mesmo instante: a latência conta a espera na fila do loop
+    inicio = time.perf_counter()
+
+    async def comando():
+        await buscar()
+        return time.perf_counter() - inicio
+
+    latencias = await asyncio.gather(*(comando() for _ in range(usuarios)))
+    total = time.perf_counter() - inicio
+    return {'total_s': round(total, 3), **resumo_latencias(latencias)}
+
+
+async def main(args):
+    with ServidorStub(latencia=args.latencia) as stub:
+        antes = await simular(args.usuarios, lambda: comando_bloqueante(stub.url))
+
+        cliente = ClienteCotacao(stub.url, max_conexoes=args.usuarios)
+        await cliente.iniciar()
+        try:
+            depois = await simular(args.usuarios, cliente.buscar_cotacao)
+        finally:
+            await cliente.fechar()
+
+    print(json.dumps({'usuarios': args.usuarios, 'latencia_stub_s': args.latencia,
+                      'antes': antes, 'depois': depois}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=50)
+    parser.add_argument('--latencia', type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Fan-out de notificações contra uma Bot API falsa local.
+
+Uso: python benchmarks/bench_envio.py [--conversas 2000] [--limite-global 200]
+
+"antes" envia com `await bot.send_message` em série, como o
+notificar_mudanca antigo; "depois" usa a FilaEnvio. A Bot API falsa aplica
+o limite global e o de 1 mensagem/s por conversa, respondendo 429 quando
+excedidos. Use --limite-global 30 para reproduzir o limite real (mais lento).
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from stubs import ServidorStub, TelegramFalso
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
+
+from envio import FilaEnvio
+
+
+async def em_serie(bot, conversas):
+    erros_429 = 0
+    for chat_id in conversas:
+        try:
+            await bot.send_message(chat_id=chat_id, text='Alerta')
+        except RetryAfter:
+            erros_429 += 1  # No código antigo a exceção interrompia o job inteiro
+    return {'erros_429': erros_429}
+
+
+async def com_fila(bot, conversas, limite_global, concorrencia):
+    fila = FilaEnvio(bot.send_message, limite_global=limite_global, concorrencia=concorrencia)
+    futuros = [fila.enviar(chat_id, 'Alerta') for chat_id in conversas]
+    resultados = await asyncio.gather(*futuros, return_exceptions=True)
+    await fila.fechar()
+    return {**fila.estatisticas(), 'erros': sum(isinstance(r, Exception) for r in resultados)}
+
+
+async def medir(args, executar):
+    falso = TelegramFalso(limite_global=args.limite_global)
+    with ServidorStub(latencia=args.latencia, responder=falso) as stub:
+        # Mesmo tamanho de pool que o Application.builder() usa por padrão
+        bot = Bot('123:falso', base_url=f"{stub.url}/bot", request=HTTPXRequest(connection_pool_size=256))
+        async with bot:
+            inicio = time.perf_counter()
+            detalhes = await executar(bot)
+            total = time.perf_counter() - inicio
+    return {
+        'total_s': round(total, 2),
+        'entregues': len(falso.mensagens),
+        'mensagens_por_s': round(len(falso.mensagens) / total, 1),
+        'respostas_429_servidor': falso.respostas_429,
+        'detalhes': detalhes,
+    }
+
+
+async def main(args):
+    conversas = list(range(1, args.conversas + 1))
+    resultados = {'conversas': args.conversas, 'limite_global': args.limite_global}
+    if not args.sem_serie:
+        resultados['antes'] = await medir(args, lambda bot: em_serie(bot, conversas))
+    resultados['depois'] = await medir(
+        args, lambda bot: com_fila(bot, conversas, args.limite_global, args.concorrencia))
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversas', type=int, default=2000)
+    parser.add_argument('--limite-global', type=int, default=200)
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--latencia', type=float, default=0.02, help='latência da Bot API falsa (s)')
+    parser.add_argument('--sem-serie', action='store_true', help='não mede o envio em série')
+    asyncio.run(main(parser.parse_args()))
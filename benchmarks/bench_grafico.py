@@ -0,0 +1,116 @@
+"""/grafico concorrente: renderização no event loop x pool de processos x cache de file_id.
+
+Uso: python benchmarks/bench_grafico.py [--pedidos 20] [--amostras 100000]
+                                        [--processos 1] [--upload 0.05]
+
+Grava uma série de `--amostras` cotações (uma por minuto) e dispara
+`--pedidos` /grafico simultâneos de períodos diferentes, enquanto uma
+tarefa de pulsação mede o atraso do event loop a cada 5 ms (o que outro
+update qualquer esperaria). Mesmo caminho do comando: velas da série,
+renderização e upload (simulado com `--upload` segundos) do PNG.
+
+- no_loop: renderiza direto no handler, como seria sem o pool;
+- processos: ProcessPoolExecutor + CacheGraficos, todos os pedidos novos;
+- cache: os mesmos pedidos de novo, servidos pelo file_id guardado.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from stubs import resumo_latencias
+
+import graficos
+from graficos import CacheGraficos
+from serie_temporal import SerieTemporal
+
+PULSACAO = 0.005
+
+
+async def pulsacao(atrasos, parar):
+    """Registra quanto cada acordar de um sleep de 5 ms atrasou."""
+    while not parar.is_set():
+        esperado = time.perf_counter() + PULSACAO
+        await asyncio.sleep(PULSACAO)
+        atrasos.append(max(0.0, time.perf_counter() - esperado))
+
+
+async def cenario(pedidos, atender):
+    atrasos, parar = [], asyncio.Event()
+    tarefa = asyncio.create_task(pulsacao(atrasos, parar))
+    await asyncio.sleep(0.05)
+    inicio = time.perf_counter()
+
+    async def pedido(numero):
+        await atender(numero)
+        return time.perf_counter() - inicio
+
+    latencias = await asyncio.gather(*(pedido(n) for n in range(pedidos)))
+    total = time.perf_counter() - inicio
+    parar.set()
+    await tarefa
+    return {'total_s': round(total, 2), 'pedidos': resumo_latencias(latencias),
+            'atraso_loop': resumo_latencias(atrasos)}
+
+
+def main(args):
+    if not graficos.disponivel():
+        raise SystemExit("matplotlib não instalado: pip install -r requirements.txt")
+    with tempfile.TemporaryDirectory() as diretorio:
+        serie = SerieTemporal(os.path.join(diretorio, 'USD-BRL.serie'), args.amostras)
+        inicio_ms = int(time.time() * 1000) - args.amostras * 60_000
+        for i in range(args.amostras):
+            serie.adicionar(5 + 0.2 * ((i * 7919) % 1000) / 1000 + i / args.amostras, inicio_ms + i * 60_000)
+        fim_ms = inicio_ms + args.amostras * 60_000
+        # Períodos diferentes: cada pedido é um gráfico novo
+        periodos = [3_600_000 * (6 + 6 * n) for n in range(args.pedidos)]
+
+        def velas(numero):
+            periodo = periodos[numero]
+            return serie.velas(fim_ms - periodo, fim_ms + 1, max(1, periodo // graficos.MAX_PONTOS))
+
+        def argumentos(lista):
+            return ("USD-BRL", [v.inicio_ms for v in lista], [v.fechamento for v in lista])
+
+        async def upload(png):
+            await asyncio.sleep(args.upload)
+            return f"arquivo-{len(png)}"
+
+        async def no_loop(numero):
+            await upload(graficos.renderizar_png(*argumentos(velas(numero))))
+
+        executor = ProcessPoolExecutor(args.processos, mp_context=multiprocessing.get_context('fork'))
+        executor.submit(graficos.aquecer).result()
+        cache = CacheGraficos()
+
+        async def processos(numero):
+            async def gerar():
+                png = await asyncio.get_running_loop().run_in_executor(
+                    executor, graficos.renderizar_png, *argumentos(velas(numero)))
+                return await upload(png)
+            await cache.obter(('USD-BRL', periodos[numero], fim_ms), gerar)
+
+        graficos.aquecer()  # Import do matplotlib fora da medição do no_loop
+        resultados = {
+            'parametros': vars(args),
+            'no_loop': asyncio.run(cenario(args.pedidos, no_loop)),
+            'processos': asyncio.run(cenario(args.pedidos, processos)),
+            'cache': asyncio.run(cenario(args.pedidos, processos)),
+            'cache_estatisticas': cache.estatisticas(),
+        }
+        executor.shutdown()
+        serie.fechar()
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=20)
+    parser.add_argument('--amostras', type=int, default=100000)
+    parser.add_argument('--processos', type=int, default=1)
+    parser.add_argument('--upload', type=float, default=0.05, help='segundos do upload simulado')
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+"""Memória e consultas do histórico: lista de dicts x SerieTemporal.
+
+Uso: python benchmarks/bench_historico.py [--amostras 1000000]
+
+Mede a memória de N cotações guardadas como no formato antigo (dict com
+timestamp ISO em uma lista) e na série mapeada em arquivo, além do tempo
+de acréscimo e das consultas de velas de 1m/1h/1d usadas pelo /historico.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from serie_temporal import SerieTemporal, BUCKETS_MS
+
+INICIO_MS = 1_700_000_000_000
+
+
+def memoria_lista(amostras, passo_ms):
+    tracemalloc.start()
+    historico = []
+    for i in range(amostras):
+        historico.append({
+            'valor': 5.0 + random.random(),
+            'timestamp': datetime.fromtimestamp((INICIO_MS + i * passo_ms) / 1000).isoformat(),
+        })
+    atual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return atual
+
+
+def main(args):
+    passo_ms = args.passo * 1000
+    resultados = {'amostras': args.amostras}
+    resultados['lista_dicts_mb'] = round(memoria_lista(args.amostras, passo_ms) / 2**20, 1)
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'USD-BRL.serie')
+        serie = SerieTemporal(caminho, capacidade=args.amostras)
+        inicio = time.perf_counter()
+        for i in range(args.amostras):
+            serie.adicionar(5.0 + random.random(), INICIO_MS + i * passo_ms)
+        duracao = time.perf_counter() - inicio
+        resultados['serie_arquivo_mb'] = round(os.path.getsize(caminho) / 2**20, 1)
+        resultados['acrescimos_por_s'] = round(args.amostras / duracao)
+
+        fim = INICIO_MS + args.amostras * passo_ms
+        for nome, periodo in (('1m', 3_600_000), ('1h', 2 * 86_400_000), ('1d', 365 * 86_400_000)):
+            inicio = time.perf_counter()
+            velas = serie.velas(fim - periodo, fim, BUCKETS_MS[nome])
+            resultados[f'velas_{nome}'] = {
+                'velas': len(velas),
+                'ms': round((time.perf_counter() - inicio) * 1000, 2),
+            }
+        serie.fechar()
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--amostras', type=int, default=1_000_000)
+    parser.add_argument('--passo', type=int, default=10, help='segundos entre amostras')
+    main(parser.parse_args())
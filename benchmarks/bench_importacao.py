@@ -0,0 +1,98 @@
+"""Importação de alertas: um /alerta por vez x lote da API (/api/alertas).
+
+Uso: python benchmarks/bench_importacao.py [--alertas 20000] [--existentes 100000]
+                                           [--um-a-um 2000] [--sem-fsync]
+
+Mede o caminho de persistência de cada forma, sem HTTP nem Telegram:
+
+- um_a_um: checagem de duplicado, IndiceAlertas.adicionar e uma entrada
+  (com fsync) no diário por alerta, como N comandos /alerta. Medido em
+  `--um-a-um` alertas e extrapolado para `--alertas`;
+- lote: leitura do JSON, validação, deduplicação por hash,
+  adicionar_varios e uma única entrada no diário, como o POST da API;
+- lote_sqlite: o mesmo lote no EstadoCompartilhado (ESTADO_DB).
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+import importacao
+from alertas import IndiceAlertas
+from armazenamento import DiarioAlertas
+from modelos import Alerta
+from replicas import EstadoCompartilhado
+
+PARES = ('USD-BRL', 'EUR-BRL')
+
+
+def gerar(quantidade, semente):
+    aleatorio = random.Random(semente)
+    return [{'chat_id': aleatorio.randrange(10000), 'par': aleatorio.choice(PARES),
+             'valor': round(aleatorio.uniform(3, 9), 4), 'tipo': aleatorio.choice(('acima', 'abaixo'))}
+            for _ in range(quantidade)]
+
+
+def indice_com(existentes):
+    return IndiceAlertas([Alerta.de_dict(dict(a, criado_em='2025-01-01T00:00:00')) for a in gerar(existentes, 1)])
+
+
+def um_a_um(args, diretorio):
+    indice = indice_com(args.existentes)
+    diario = DiarioAlertas(os.path.join(diretorio, 'um_a_um.json'), sincronizar=not args.sem_fsync)
+    alertas, _ = importacao.validar(gerar(args.um_a_um, 2), PARES)
+    inicio = time.perf_counter()
+    for alerta in alertas:
+        if indice.existe(*alerta.chave):
+            continue
+        indice.adicionar(alerta)
+        diario.registrar_adicao(alerta)
+    duracao = time.perf_counter() - inicio
+    diario.fechar()
+    return {'medidos': len(alertas), 'segundos': round(duracao, 3),
+            'segundos_estimados': round(duracao * args.alertas / len(alertas), 2),
+            'alertas_por_s': round(len(alertas) / duracao)}
+
+
+def lote(args, diario):
+    indice = indice_com(args.existentes)
+    corpo = json.dumps(gerar(args.alertas, 2)).encode()
+    inicio = time.perf_counter()
+    registros = importacao.ler_registros(corpo, 'application/json')
+    alertas, erros = importacao.validar(registros, PARES)
+    novos, duplicados = importacao.deduplicar(alertas, indice.existe)
+    if hasattr(diario, 'novos_ids'):
+        for alerta, alerta_id in zip(novos, diario.novos_ids(len(novos))):
+            alerta.id = alerta_id
+    indice.adicionar_varios(novos)
+    diario.registrar_adicoes(novos)
+    duracao = time.perf_counter() - inicio
+    diario.fechar()
+    return {'importados': len(novos), 'duplicados': duplicados, 'invalidos': len(erros),
+            'segundos': round(duracao, 3), 'alertas_por_s': round(len(novos) / duracao)}
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as diretorio:
+        resultados = {
+            'parametros': vars(args),
+            'um_a_um': um_a_um(args, diretorio),
+            'lote': lote(args, DiarioAlertas(os.path.join(diretorio, 'lote.json'),
+                                             sincronizar=not args.sem_fsync)),
+            'lote_sqlite': lote(args, EstadoCompartilhado(os.path.join(diretorio, 'estado.db'))),
+        }
+    resultados['aceleracao'] = round(resultados['um_a_um']['segundos_estimados'] / resultados['lote']['segundos'], 1)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alertas', type=int, default=20000)
+    parser.add_argument('--existentes', type=int, default=100000, help='alertas já ativos no índice')
+    parser.add_argument('--um-a-um', type=int, default=2000, help='alertas medidos no caminho um a um')
+    parser.add_argument('--sem-fsync', action='store_true', help='diário sem fsync a cada entrada')
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+"""Custo dos indicadores: atualização incremental por tick x recálculo em lote.
+
+Uso: python benchmarks/bench_indicadores.py [--amostras 1000000] [--janela 20]
+
+Mede o tempo por tick do `Indicadores.atualizar` (deve ser constante,
+independente da janela) e o recálculo completo de `calcular_em_lote`
+sobre um histórico longo, com NumPy quando instalado.
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from indicadores import Indicadores, calcular_em_lote, _importar_numpy
+
+
+def serie_sintetica(amostras, semente=3):
+    aleatorio = random.Random(semente)
+    valor, serie = 5.0, []
+    for _ in range(amostras):
+        serie.append(valor)
+        valor *= math.exp(aleatorio.gauss(0, 0.0005))
+    return serie
+
+
+def main(args):
+    serie = serie_sintetica(args.amostras)
+    resultados = {'amostras': args.amostras, 'numpy': _importar_numpy() is not None}
+
+    for janela in (args.janela, args.janela * 10):
+        indicadores = Indicadores(janela)
+        inicio = time.perf_counter()
+        for valor in serie:
+            indicadores.atualizar(valor)
+        duracao = time.perf_counter() - inicio
+        resultados[f'incremental_janela_{janela}_us_por_tick'] = round(duracao / len(serie) * 1e6, 2)
+
+    inicio = time.perf_counter()
+    calcular_em_lote(serie, args.janela)
+    resultados['lote_s'] = round(time.perf_counter() - inicio, 3)
+
+    indicadores = Indicadores(args.janela)
+    inicio = time.perf_counter()
+    indicadores.aquecer(serie)
+    resultados['aquecimento_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--amostras', type=int, default=1_000_000)
+    parser.add_argument('--janela', type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""Custo da instrumentação: operações das métricas e caminhos quentes com e sem elas.
+
+Uso: python benchmarks/bench_metricas.py [--repeticoes 200000] [--alertas 100000]
+
+Mede em nanossegundos por operação o Contador.inc, o Histograma.observar
+e o par perf_counter + observar usado em volta dos trechos medidos; depois
+compara um tick de verificação de alertas (IndiceAlertas.disparar) e um
+handler assíncrono trivial com e sem o cronômetro, e o tempo de exportar
+o /metrics.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from alertas import IndiceAlertas
+from metricas import Registro, cronometrar
+from modelos import Alerta, TipoAlerta
+
+
+def ns_por_operacao(funcao, repeticoes):
+    inicio = time.perf_counter_ns()
+    for _ in range(repeticoes):
+        funcao()
+    return round((time.perf_counter_ns() - inicio) / repeticoes, 1)
+
+
+def indice_com_alertas(quantidade):
+    aleatorio = random.Random(5)
+    alertas = []
+    for _ in range(quantidade):
+        tipo = aleatorio.choice(('acima', 'abaixo'))
+        valor = aleatorio.uniform(5.0, 6.0) if tipo == 'acima' else aleatorio.uniform(4.0, 5.0)
+        alertas.append(Alerta(None, 1, 'USD-BRL', valor, TipoAlerta(tipo)))
+    return IndiceAlertas(alertas)
+
+
+async def handler_trivial():
+    return None
+
+
+async def medir_handlers(repeticoes, histograma):
+    medido = cronometrar(histograma)(handler_trivial)
+    resultados = {}
+    for nome, funcao in (('sem_metricas', handler_trivial), ('com_metricas', medido)):
+        inicio = time.perf_counter_ns()
+        for _ in range(repeticoes):
+            await funcao()
+        resultados[nome] = round((time.perf_counter_ns() - inicio) / repeticoes, 1)
+    return resultados
+
+
+def main(args):
+    registro = Registro()
+    contador = registro.contador('teste_total', 'Contador de teste')
+    histograma = registro.histograma('teste_segundos', 'Histograma de teste')
+    resultados = {
+        'contador_inc_ns': ns_por_operacao(contador.inc, args.repeticoes),
+        'histograma_observar_ns': ns_por_operacao(lambda: histograma.observar(0.003), args.repeticoes),
+        'cronometro_completo_ns': ns_por_operacao(
+            lambda: histograma.observar(time.perf_counter() - time.perf_counter()), args.repeticoes),
+    }
+
+    # Tick sem disparos (o caso comum) em um índice grande, com e sem a medição em volta
+    indice = indice_com_alertas(args.alertas)
+    verificacao = registro.histograma('verificar_segundos', 'Verificação')
+
+    def tick_medido():
+        inicio = time.perf_counter()
+        indice.disparar('USD-BRL', 5.0)
+        verificacao.observar(time.perf_counter() - inicio)
+
+    resultados['tick_verificacao_ns'] = {
+        'sem_metricas': ns_por_operacao(lambda: indice.disparar('USD-BRL', 5.0), args.repeticoes),
+        'com_metricas': ns_por_operacao(tick_medido, args.repeticoes),
+    }
+    resultados['handler_async_ns'] = asyncio.run(medir_handlers(args.repeticoes, histograma))
+
+    # Exportação com ~20 famílias, como o /metrics do bot
+    for i in range(20):
+        registro.histograma('comando_segundos', 'Handlers', rotulos={'comando': f'c{i}'}).observar(0.01)
+    resultados['exportar_us'] = round(ns_por_operacao(registro.exportar, 1000) / 1000, 1)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=200_000)
+    parser.add_argument('--alertas', type=int, default=100_000)
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+"""Latência de cauda das buscas: uma fonte de cotação x várias com hedging e disjuntor.
+
+Uso: python benchmarks/bench_provedores.py [--requisicoes 200] [--cauda 0.5]
+                                           [--prob-cauda 0.05] [--prob-erro 0.02]
+
+Duas awesomeapi falsas locais com latência de cauda longa (a maioria das
+respostas em poucos ms, uma fração em `--cauda` segundos) e respostas 503
+sorteadas. As buscas são sequenciais, como no ciclo do bot, com o mesmo
+ClienteCotacao (timeout e novas tentativas) do index.py:
+
+- unica: só a fonte principal, com novas tentativas (o comportamento sem reservas);
+- hedge: principal + reserva, uma tentativa em cada por rodada; a reserva é
+  consultada quando a principal passa do seu p90 ou falha;
+- principal_fora: a principal responde sempre 503; o disjuntor a desliga
+  e as buscas vão direto para a reserva.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from stubs import CotacoesFalsas, ServidorStub, com_falhas, latencia_com_cauda, resumo_latencias
+
+from cotacao import ClienteCotacao
+from provedores import Provedor, ProvedoresCotacao
+
+PAR = 'USD-BRL'
+
+
+async def medir(args, urls):
+    # Como no index.py: com mais de uma fonte, as novas tentativas são rodadas sobre as fontes
+    tentativas = 3 if len(urls) == 1 else 1
+    provedores = [Provedor(nome, ClienteCotacao(url, pares=(PAR,), timeout=5.0, tentativas=tentativas))
+                  for nome, url in urls]
+    conjunto = ProvedoresCotacao(provedores, percentil=args.percentil, tentativas=3 if len(urls) > 1 else 1)
+    await conjunto.iniciar()
+    latencias, erros = [], 0
+    try:
+        for _ in range(args.requisicoes):
+            inicio = time.perf_counter()
+            try:
+                await conjunto.buscar()
+            except Exception:
+                erros += 1
+                continue
+            latencias.append(time.perf_counter() - inicio)
+    finally:
+        await conjunto.fechar()
+    resultado = resumo_latencias(latencias)
+    resultado['p95_ms'] = round(sorted(latencias)[int(len(latencias) * 0.95)] * 1000, 2) if latencias else None
+    resultado['erros'] = erros
+    resultado['reservas'] = conjunto.reservas
+    resultado['fontes'] = {nome: p.estatisticas() for nome, p in zip((n for n, _ in urls), provedores)}
+    return resultado
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.ERROR)
+    cotacoes = CotacoesFalsas({PAR: 5.0})
+
+    def servidor(semente, prob_erro):
+        return ServidorStub(latencia=latencia_com_cauda(args.base, args.cauda, args.prob_cauda, semente),
+                            responder=com_falhas(cotacoes, prob_erro, semente))
+
+    with servidor(1, args.prob_erro) as principal, servidor(2, args.prob_erro) as reserva, \
+            servidor(3, 1.0) as fora:
+        resultados = {
+            'parametros': {k: v for k, v in vars(args).items()},
+            'unica': asyncio.run(medir(args, [('principal', principal.url)])),
+            'hedge': asyncio.run(medir(args, [('principal', principal.url), ('reserva', reserva.url)])),
+            'principal_fora': asyncio.run(medir(args, [('principal', fora.url), ('reserva', reserva.url)])),
+        }
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--base', type=float, default=0.01, help='latência normal (s)')
+    parser.add_argument('--cauda', type=float, default=0.5, help='latência da cauda (s)')
+    parser.add_argument('--prob-cauda', type=float, default=0.05)
+    parser.add_argument('--prob-erro', type=float, default=0.02, help='fração de respostas 503')
+    parser.add_argument('--percentil', type=float, default=90, help='igual ao HEDGE_PERCENTIL do index.py')
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+"""Partida a frio com muitos alertas: snapshot binário colunar x snapshot JSON.
+
+Uso: python benchmarks/bench_snapshot.py [--alertas 1000000] [--moveis 0.05]
+
+Grava os mesmos alertas (fixos e uma fração `--moveis` de recuo/variação)
+nos dois formatos do DiarioAlertas e mede, para cada um, o tamanho do
+arquivo, a gravação (compactação) e a leitura até a lista de alertas
+(DiarioAlertas.carregar); depois, a indexação no IndiceAlertas, igual
+para os dois (sem o GC, como no carregar_alertas do bot). Também compara a memória de um alerta como dict (formato
+anterior) e como `Alerta`.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import stubs  # noqa: F401  (ajusta o sys.path)
+
+from alertas import IndiceAlertas
+from armazenamento import DiarioAlertas
+from modelos import Alerta, TipoAlerta
+
+PARES = ('USD-BRL', 'EUR-BRL', 'BTC-BRL')
+INICIO_MS = 1_700_000_000_000
+
+
+def gerar(args):
+    aleatorio = random.Random(args.semente)
+    alertas = []
+    for alerta_id in range(1, args.alertas + 1):
+        criado_ms = INICIO_MS + aleatorio.randrange(86_400_000 * 30)
+        chat_id = aleatorio.randrange(1, 100_000)
+        par = aleatorio.choice(PARES)
+        if aleatorio.random() < args.moveis:
+            tipo = aleatorio.choice((TipoAlerta.RECUO, TipoAlerta.VARIACAO))
+            alerta = Alerta(alerta_id, chat_id, par, round(aleatorio.uniform(0.5, 5), 2), tipo, criado_ms,
+                            referencia=5.0, pico=5.1, fundo=4.9)
+            if tipo is TipoAlerta.VARIACAO:
+                alerta.janela_ms = 3_600_000
+        else:
+            tipo = aleatorio.choice((TipoAlerta.ACIMA, TipoAlerta.ABAIXO))
+            alerta = Alerta(alerta_id, chat_id, par, round(aleatorio.uniform(3, 9), 4), tipo, criado_ms)
+        alertas.append(alerta)
+    return alertas
+
+
+def cronometrar(funcao):
+    gc.collect()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+
+def medir_formato(diario, alertas, proximo_id):
+    gravacao, _ = cronometrar(lambda: diario.compactar_agora(alertas, proximo_id))
+    caminho = diario._caminho_snapshot()
+    leitura, (carregados, _) = cronometrar(lambda: DiarioAlertas(diario.caminho).carregar())
+    return {'arquivo': os.path.basename(caminho), 'mb': round(os.path.getsize(caminho) / 2**20, 1),
+            'gravacao_s': round(gravacao, 3), 'leitura_s': round(leitura, 3)}, carregados
+
+
+def gravar_json(diario, alertas, proximo_id):
+    """Snapshot no formato JSON (o anterior, ainda lido e usado como reserva)."""
+    with open(diario.caminho, 'w') as f:
+        json.dump({'versao': 2, 'proximo_id': proximo_id, 'alertas': [a.para_dict() for a in alertas]},
+                  f, separators=(',', ':'))
+
+
+def memoria_por_alerta(criar, quantidade=100_000):
+    gc.collect()
+    tracemalloc.start()
+    itens = [criar(i) for i in range(quantidade)]
+    usado, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del itens
+    return round(usado / quantidade)
+
+
+def main(args):
+    alertas = gerar(args)
+    proximo_id = args.alertas + 1
+    resultados = {'parametros': vars(args)}
+    with tempfile.TemporaryDirectory() as diretorio:
+        diario = DiarioAlertas(os.path.join(diretorio, 'alertas.json'), sincronizar=False)
+        resultados['binario'], carregados = medir_formato(diario, alertas, proximo_id)
+        assert [a.para_dict() for a in carregados] == [a.para_dict() for a in alertas]
+        del carregados
+        os.remove(diario.caminho_binario)
+        gravacao, _ = cronometrar(lambda: gravar_json(diario, alertas, proximo_id))
+        leitura, (carregados, _) = cronometrar(lambda: DiarioAlertas(diario.caminho).carregar())
+        resultados['json'] = {'arquivo': 'alertas.json', 'mb': round(os.path.getsize(diario.caminho) / 2**20, 1),
+                              'gravacao_s': round(gravacao, 3), 'leitura_s': round(leitura, 3)}
+        resultados['aceleracao_leitura'] = round(leitura / resultados['binario']['leitura_s'], 1)
+        gc.disable()
+        indexacao, _ = cronometrar(lambda: IndiceAlertas(carregados))
+        gc.enable()
+        resultados['indexacao_s'] = round(indexacao, 3)
+        resultados['partida_binario_s'] = round(resultados['binario']['leitura_s'] + indexacao, 3)
+        del carregados
+
+    iso = datetime.fromtimestamp(INICIO_MS / 1000).isoformat()
+    resultados['bytes_por_alerta'] = {
+        'dict': memoria_por_alerta(lambda i: {'id': i, 'chat_id': i, 'par': 'USD-BRL', 'valor': i + 0.5,
+                                              'tipo': 'acima', 'criado_em': f"{iso}.{i}"}),
+        'alerta': memoria_por_alerta(lambda i: Alerta(i, i, 'USD-BRL', i + 0.5, TipoAlerta.ACIMA,
+                                                      INICIO_MS + i)),
+    }
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alertas', type=int, default=1_000_000)
+    parser.add_argument('--moveis', type=float, default=0.05, help='fração de alertas de recuo/variação')
+    parser.add_argument('--semente', type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,214 @@
+"""Recuperação dos componentes do bot sob falhas injetadas, sem reiniciar o processo.
+
+Uso: python benchmarks/bench_supervisor.py [--falhas 300] [--alertas 100000]
+
+Sobe uma Application contra a Bot API falsa com os três componentes do
+index.py sob o Supervisor (servidor web, long polling e tarefas da
+JobQueue) e derruba um deles por vez, em rodízio:
+
+- polling: o getUpdates seguinte responde 401, o que aborta o laço do Updater;
+- web: o socket do servidor é fechado por fora;
+- tarefas: o agendador da JobQueue é desligado por fora.
+
+Mede o tempo de recuperação de cada um (até o próximo getUpdates aceito,
+o próximo /health respondido ou a próxima execução do job) e, a cada
+`--amostra` falhas, a memória alocada (tracemalloc), as tarefas asyncio,
+os descritores de arquivo e as threads. Um índice com `--alertas`
+alertas e o contador do job ficam em memória o tempo todo e têm que
+chegar ao fim intactos (nada é recarregado).
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+
+from stubs import ServidorStub, TelegramFalso, porta_livre, resumo_latencias, update_comando
+
+import aiohttp
+from aiohttp import web
+from telegram.ext import Application, CommandHandler
+
+from alertas import IndiceAlertas
+from modelos import Alerta, TipoAlerta
+from servidor_web import ServidorWeb, componente_web
+from supervisor import Supervisor, componente_polling, componente_tarefas, executar_supervisionado
+
+COMPONENTES = ('polling', 'web', 'tarefas')
+
+
+class BotApiComFalhas:
+    """Bot API falsa que responde 401 a um getUpdates quando pedido, e marca quando volta."""
+
+    def __init__(self, falso):
+        self.falso = falso
+        self.falhar = False
+        self.falhou_em = None
+        self.voltou_em = None
+        self._lock = threading.Lock()
+
+    def __call__(self, caminho, corpo):
+        if caminho.endswith('/getUpdates'):
+            with self._lock:
+                if self.falhar:
+                    self.falhar = False
+                    self.falhou_em = time.perf_counter()
+                    return 401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'}
+                if self.falhou_em is not None and self.voltou_em is None:
+                    self.voltou_em = time.perf_counter()
+        return self.falso(caminho, corpo)
+
+
+def amostrar():
+    gc.collect()
+    return {
+        'alocado_kb': round(tracemalloc.get_traced_memory()[0] / 1024, 1),
+        'tarefas': len(asyncio.all_tasks()),
+        'descritores': len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None,
+        'threads': threading.active_count(),
+    }
+
+
+async def aguardar(condicao, limite=30.0, intervalo=0.002):
+    prazo = time.perf_counter() + limite
+    while not condicao():
+        if time.perf_counter() > prazo:
+            raise TimeoutError('componente não se recuperou a tempo')
+        await asyncio.sleep(intervalo)
+
+
+async def executar(args):
+    falso = TelegramFalso(limite_global=10**9, intervalo_chat=0)
+    api = BotApiComFalhas(falso)
+    aleatorio = random.Random(args.semente)
+    indice = IndiceAlertas(Alerta(None, aleatorio.randrange(1, 1000), 'USD-BRL', round(aleatorio.uniform(4, 6), 4),
+                                  aleatorio.choice((TipoAlerta.ACIMA, TipoAlerta.ABAIXO)), 0)
+                           for _ in range(args.alertas))
+    ids_antes = id(indice), len(indice)
+    execucoes_job = [0]
+
+    async def job(context):
+        execucoes_job[0] += 1
+
+    def agendar(job_queue):
+        if not job_queue.get_jobs_by_name('contador'):
+            job_queue.run_repeating(job, interval=args.intervalo_job, first=0, name='contador')
+
+    async def responder(update, context):
+        await update.message.reply_text('ok')
+
+    with ServidorStub(responder=api) as stub:
+        application = Application.builder().token('123:falso').base_url(f"{stub.url}/bot").build()
+        application.add_handler(CommandHandler('start', responder))
+        porta = porta_livre()
+        servidor = ServidorWeb(application, porta=porta, host='127.0.0.1')
+
+        async def health(request):
+            return web.json_response({'status': 'healthy'})
+
+        servidor.rota('/health', health)
+        supervisor = Supervisor([
+            componente_web(servidor),
+            # Long polling curto: a falha injetada é vista na próxima requisição
+            componente_polling(application, drop_pending_updates=True, timeout=args.timeout_polling, poll_interval=0),
+            componente_tarefas(application.job_queue, agendar),
+        ], backoff_base=args.backoff, backoff_max=args.backoff * 8, estavel=args.estavel, intervalo=args.vigia)
+        parar = asyncio.Event()
+        execucao = asyncio.create_task(executar_supervisionado(application, supervisor, parar))
+        await aguardar(lambda: all(supervisor.no_ar(nome) for nome in COMPONENTES))
+
+        respostas = [0]
+        falso.ao_enviar = lambda chat_id, texto: respostas.__setitem__(0, respostas[0] + 1)
+        update_id = [0]
+        recuperacoes = {nome: [] for nome in COMPONENTES}
+        amostras = []
+
+        async with aiohttp.ClientSession() as sessao:
+            async def web_responde():
+                try:
+                    async with sessao.get(f"http://127.0.0.1:{porta}/health") as resposta:
+                        return resposta.status == 200
+                except aiohttp.ClientError:
+                    return False
+
+            async def ida_e_volta():
+                """Um update completo pelo polling: prova que o bot segue respondendo."""
+                update_id[0] += 1
+                antes = respostas[0]
+                # Sempre a mesma conversa: chat_data e user_data novos não contam como vazamento
+                falso.enfileirar_update(update_comando(update_id[0], 1000))
+                await aguardar(lambda: respostas[0] > antes)
+
+            async def derrubar(nome):
+                if nome == 'polling':
+                    api.falhou_em = api.voltou_em = None
+                    api.falhar = True
+                    await aguardar(lambda: api.voltou_em is not None)
+                    await ida_e_volta()
+                    return api.voltou_em - api.falhou_em
+                if nome == 'web':
+                    inicio = time.perf_counter()
+                    servidor._site._server.close()
+                    while not await web_responde():
+                        await asyncio.sleep(0.002)
+                    return time.perf_counter() - inicio
+                execucoes = execucoes_job[0]
+                inicio = time.perf_counter()
+                application.job_queue.scheduler.shutdown(wait=False)
+                await aguardar(lambda: execucoes_job[0] > execucoes and supervisor.no_ar('tarefas'))
+                return time.perf_counter() - inicio
+
+            await ida_e_volta()
+            # Medição desde o início; a primeira amostra só sai depois do aquecimento (caches e pools)
+            tracemalloc.start()
+            for falha in range(args.falhas):
+                if falha >= args.aquecimento and (falha - args.aquecimento) % args.amostra == 0:
+                    amostras.append({'falhas': falha, **amostrar()})
+                nome = COMPONENTES[falha % len(COMPONENTES)]
+                recuperacoes[nome].append(await derrubar(nome))
+                # Deixa o componente ficar estável antes da próxima falha (zera o backoff)
+                await asyncio.sleep(args.estavel)
+            amostras.append({'falhas': args.falhas, **amostrar()})
+            tracemalloc.stop()
+            await ida_e_volta()
+
+        parar.set()
+        await execucao
+
+    inicio, fim = amostras[0], amostras[-1]
+    return {
+        'parametros': vars(args),
+        'recuperacao': {nome: resumo_latencias(tempos) for nome, tempos in recuperacoes.items()},
+        'reinicios': {nome: supervisor.reinicios(nome) for nome in COMPONENTES},
+        'updates_respondidos': respostas[0],
+        'estado_intacto': (id(indice), len(indice)) == ids_antes and execucoes_job[0] > 0,
+        'crescimento': {chave: round(fim[chave] - inicio[chave], 1) for chave in inicio
+                        if chave != 'falhas' and inicio[chave] is not None},
+        'bytes_por_falha': round((fim['alocado_kb'] - inicio['alocado_kb']) * 1024 / (fim['falhas'] - inicio['falhas'])),
+        'amostras': amostras,
+    }
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.CRITICAL)  # Cada falha injetada gera erros no log
+    print(json.dumps(asyncio.run(executar(args)), indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--falhas', type=int, default=300)
+    parser.add_argument('--aquecimento', type=int, default=30, help='falhas antes da primeira amostra de memória')
+    parser.add_argument('--amostra', type=int, default=50, help='falhas entre as amostras de memória')
+    parser.add_argument('--alertas', type=int, default=100_000)
+    parser.add_argument('--backoff', type=float, default=0.01, help='backoff_base do Supervisor (s)')
+    parser.add_argument('--estavel', type=float, default=0.05, help='segundos no ar para zerar o backoff')
+    parser.add_argument('--vigia', type=float, default=0.01, help='intervalo entre as verificações (s)')
+    parser.add_argument('--intervalo-job', type=float, default=0.02)
+    parser.add_argument('--timeout-polling', type=int, default=1)
+    parser.add_argument('--semente', type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,155 @@
+"""Teste de carga: updates via webhook x long polling contra uma Bot API falsa.
+
+Uso: python benchmarks/bench_webhook.py [--updates 2000] [--taxa 100] [--poll-interval 2]
+
+No modo webhook os updates sintéticos são enviados por POST ao
+ServidorWeb local, com os mesmos componentes do index.py (servidor web
+antecipado e registro do webhook sob o Supervisor); no modo
+polling entram na fila do getUpdates falso e são buscados com os mesmos
+parâmetros do polling do index.py. Os dois respondem com o handler
+real do /start. A latência vai da chegada do update até o sendMessage
+da resposta chegar na Bot API falsa. Gerador, bot e API falsa dividem o
+mesmo processo: com taxas altas o limite é a CPU da máquina.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from stubs import ServidorStub, TelegramFalso, porta_livre, resumo_latencias, update_comando
+
+os.environ.setdefault('TELEGRAM_TOKEN', '123:falso')
+os.environ.setdefault('CHAT_ID', '1')
+
+import aiohttp  # noqa: E402
+from telegram.ext import Application, CommandHandler  # noqa: E402
+
+import index  # noqa: E402
+from servidor_web import ServidorWeb, componente_web, componente_webhook  # noqa: E402
+from supervisor import Supervisor, componente_polling, executar_supervisionado  # noqa: E402
+
+SEGREDO = 'segredo-de-teste'
+
+
+class Medidor:
+    """Horário de chegada de cada update e da resposta correspondente (por chat)."""
+
+    def __init__(self, total):
+        self.total = total
+        self.inicio = {}
+        self.fim = {}
+        self._lock = threading.Lock()
+
+    def ao_enviar(self, chat_id, texto):
+        with self._lock:
+            self.fim.setdefault(chat_id, time.perf_counter())
+
+    async def aguardar(self, limite):
+        prazo = time.perf_counter() + limite
+        while len(self.fim) < self.total and time.perf_counter() < prazo:
+            await asyncio.sleep(0.01)
+
+    def resultado(self):
+        latencias = [self.fim[c] - self.inicio[c] for c in self.fim if c in self.inicio]
+        duracao = max(self.fim.values(), default=0) - min(self.inicio.values(), default=0)
+        return {
+            'respondidos': len(self.fim),
+            'updates_por_s': round(len(self.fim) / duracao, 1) if duracao > 0 else None,
+            'latencia': resumo_latencias(latencias),
+        }
+
+
+def construir(stub, args):
+    application = (Application.builder().token('123:falso').base_url(f"{stub.url}/bot")
+                   .concurrent_updates(args.concorrencia).build())
+    application.add_handler(CommandHandler('start', index.comando_start))
+    return application
+
+
+async def gerar(args, medidor, entregar):
+    """Chega um update a cada 1/taxa segundos, cada um de uma conversa diferente."""
+    inicio = time.perf_counter()
+    tarefas = []
+    for i in range(args.updates):
+        atraso = inicio + i / args.taxa - time.perf_counter()
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+        chat_id = 1000 + i
+        medidor.inicio[chat_id] = time.perf_counter()
+        tarefas.append(asyncio.create_task(entregar(update_comando(i + 1, chat_id))))
+    await asyncio.gather(*tarefas)
+
+
+async def modo_webhook(args, stub, medidor):
+    application = construir(stub, args)
+    porta = porta_livre()
+    servidor = ServidorWeb(application, porta=porta, host='127.0.0.1', caminho_webhook='/telegram', segredo=SEGREDO)
+    url = f"http://127.0.0.1:{porta}/telegram"
+    # Como no executar do index.py: o servidor sobe antes e o webhook é registrado depois do start
+    supervisor = Supervisor([componente_web(servidor), componente_webhook(application, url, SEGREDO)])
+    parar = asyncio.Event()
+    execucao = asyncio.create_task(executar_supervisionado(application, supervisor, parar, antecipados=('web',)))
+    while not (application.running and supervisor.no_ar('webhook')):
+        if execucao.done():
+            execucao.result()
+        await asyncio.sleep(0.01)
+
+    conector = aiohttp.TCPConnector(limit=256)
+    async with aiohttp.ClientSession(connector=conector) as sessao:
+        async def entregar(update):
+            async with sessao.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SEGREDO}) as r:
+                r.raise_for_status()
+
+        await gerar(args, medidor, entregar)
+        await medidor.aguardar(args.limite)
+    parar.set()
+    await execucao
+
+
+async def modo_polling(args, stub, falso, medidor):
+    application = construir(stub, args)
+    polling = componente_polling(application, timeout=60, poll_interval=args.poll_interval)
+    await application.initialize()
+    await polling.iniciar()
+    await application.start()
+
+    async def entregar(update):
+        falso.enfileirar_update(update)
+
+    await gerar(args, medidor, entregar)
+    await medidor.aguardar(args.limite)
+    await polling.parar()
+    await application.stop()
+    await application.shutdown()
+
+
+async def medir(args, modo):
+    medidor = Medidor(args.updates)
+    falso = TelegramFalso(limite_global=10**9, intervalo_chat=0, ao_enviar=medidor.ao_enviar)
+    with ServidorStub(responder=falso) as stub:
+        if modo == 'webhook':
+            await modo_webhook(args, stub, medidor)
+        else:
+            await modo_polling(args, stub, falso, medidor)
+    return medidor.resultado()
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.WARNING)  # O index.py configura INFO
+    resultados = {'updates': args.updates, 'taxa_chegada': args.taxa}
+    resultados['webhook'] = asyncio.run(medir(args, 'webhook'))
+    resultados[f'polling_intervalo_{args.poll_interval:g}s'] = asyncio.run(medir(args, 'polling'))
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--taxa', type=float, default=100, help='updates por segundo')
+    parser.add_argument('--concorrencia', type=int, default=index.CONCORRENCIA_UPDATES)
+    parser.add_argument('--poll-interval', type=float, default=2, help='igual ao polling do index.py')
+    parser.add_argument('--limite', type=float, default=60, help='segundos esperando as respostas')
+    main(parser.parse_args())
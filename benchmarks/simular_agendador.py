@@ -0,0 +1,140 @@
+"""Simulação do agendamento: atraso na detecção de alertas x chamadas à API.
+
+Uso: python benchmarks/simular_agendador.py [--serie cotacoes.csv] [--horas 72] [--alertas 50]
+
+Reproduz uma série de preços (CSV `timestamp,valor` em segundos ou uma
+série sintética de passeio aleatório amostrada a cada segundo) e compara
+intervalos fixos com o AgendadorAdaptativo. Para cada estratégia mede
+quantas chamadas à API seriam feitas e quanto tempo cada alerta demora a
+ser detectado depois que a cotação cruza o limite.
+"""
+import argparse
+import bisect
+import csv
+import json
+import math
+import random
+
+from stubs import percentil
+
+from agendador import AgendadorAdaptativo
+from alertas import IndiceAlertas
+from modelos import Alerta
+
+PAR = 'USD-BRL'
+
+
+def serie_sintetica(horas, volatilidade_diaria, semente):
+    aleatorio = random.Random(semente)
+    sigma = volatilidade_diaria / math.sqrt(86400)
+    valor, serie = 5.0, []
+    for _ in range(int(horas * 3600)):
+        serie.append(valor)
+        valor *= math.exp(aleatorio.gauss(0, sigma))
+    return serie
+
+
+def ler_serie(caminho):
+    """Lê CSV timestamp,valor e reamostra para 1 ponto por segundo."""
+    with open(caminho) as f:
+        linhas = [(float(t), float(v)) for t, v in csv.reader(f) if t[:1].isdigit()]
+    linhas.sort()
+    inicio, serie, i = linhas[0][0], [], 0
+    for segundo in range(int(linhas[-1][0] - inicio) + 1):
+        while i + 1 < len(linhas) and linhas[i + 1][0] - inicio <= segundo:
+            i += 1
+        serie.append(linhas[i][1])
+    return serie
+
+
+def gerar_alertas(serie, quantidade, semente):
+    """Limites espalhados na faixa que a série realmente percorre."""
+    aleatorio = random.Random(semente)
+    inicial, minimo, maximo = serie[0], min(serie), max(serie)
+    alertas = []
+    for i in range(quantidade):
+        if i % 2:
+            alertas.append({'chat_id': 1, 'par': PAR, 'tipo': 'acima',
+                            'valor': aleatorio.uniform(inicial, maximo * 1.002)})
+        else:
+            alertas.append({'chat_id': 1, 'par': PAR, 'tipo': 'abaixo',
+                            'valor': aleatorio.uniform(minimo * 0.998, inicial)})
+    return alertas
+
+
+def primeiros_cruzamentos(serie, alertas):
+    """Segundo em que cada alerta cruza o limite pela primeira vez (ou None)."""
+    maximos, minimos_negados = [], []
+    maximo, minimo = -math.inf, math.inf
+    for valor in serie:
+        maximo, minimo = max(maximo, valor), min(minimo, valor)
+        maximos.append(maximo)
+        minimos_negados.append(-minimo)
+    cruzamentos = {}
+    for alerta in alertas:
+        if alerta.tipo == 'acima':
+            t = bisect.bisect_left(maximos, alerta.valor)
+        else:
+            t = bisect.bisect_left(minimos_negados, -alerta.valor)
+        cruzamentos[alerta.id] = t if t < len(serie) else None
+    return cruzamentos
+
+
+def simular(serie, alertas, proximo_intervalo, agendador=None):
+    indice = IndiceAlertas([Alerta.de_dict(a) for a in alertas])
+    cruzamentos = primeiros_cruzamentos(serie, list(indice))
+    atrasos, chamadas, t = [], 0, 10
+    while t < len(serie):
+        cotacao = serie[t]
+        chamadas += 1
+        if agendador is not None:
+            agendador.registrar_requisicao(t)
+            agendador.registrar_cotacao(PAR, cotacao, t)
+        for alerta in indice.disparar(PAR, cotacao):
+            atrasos.append(t - cruzamentos[alerta.id])
+        t += max(1, int(proximo_intervalo(indice, cotacao, t)))
+    cruzados = sum(1 for c in cruzamentos.values() if c is not None)
+    return {
+        'chamadas_api': chamadas,
+        'alertas_cruzados': cruzados,
+        'detectados': len(atrasos),
+        'perdidos': cruzados - len(atrasos),  # Cruzaram e voltaram entre duas consultas
+        'atraso_medio_s': round(sum(atrasos) / len(atrasos), 1) if atrasos else None,
+        'atraso_p50_s': percentil(atrasos, 50),
+        'atraso_p90_s': percentil(atrasos, 90),
+    }
+
+
+def main(args):
+    serie = ler_serie(args.serie) if args.serie else \
+        serie_sintetica(args.horas, args.volatilidade, args.semente)
+    alertas = gerar_alertas(serie, args.alertas, args.semente)
+    for i, alerta in enumerate(alertas, 1):
+        alerta['id'] = i
+
+    resultados = {'segundos': len(serie), 'alertas': len(alertas)}
+    for fixo in (1800, 300, args.intervalo_min):
+        resultados[f'fixo_{int(fixo)}s'] = simular(serie, alertas, lambda i, c, t, f=fixo: f)
+
+    agendador = AgendadorAdaptativo(args.intervalo_min, args.intervalo_max, args.orcamento,
+                                    fator_seguranca=args.fator)
+
+    def adaptativo(indice, cotacao, t):
+        return agendador.proximo_intervalo({PAR: indice.distancia_limite(PAR, cotacao)}, agora=t)
+
+    resultados['adaptativo'] = simular(serie, alertas, adaptativo, agendador)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serie', help='CSV timestamp,valor (padrão: série sintética)')
+    parser.add_argument('--horas', type=float, default=72)
+    parser.add_argument('--volatilidade', type=float, default=0.008, help='volatilidade diária da série sintética')
+    parser.add_argument('--alertas', type=int, default=50)
+    parser.add_argument('--intervalo-min', type=float, default=60)
+    parser.add_argument('--intervalo-max', type=float, default=1800)
+    parser.add_argument('--orcamento', type=int, default=120, help='requisições por hora')
+    parser.add_argument('--fator', type=float, default=0.25, help='fator de segurança do agendador')
+    parser.add_argument('--semente', type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,257 @@
+"""Servidores HTTP locais usados pelos benchmarks no lugar das APIs reais."""
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Permite importar os módulos do bot a partir da pasta benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Servidor(ThreadingHTTPServer):
+    # Backlog maior que o padrão (5) para não descartar conexões simultâneas
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Cliente que desistiu da resposta (ex.: requisição de reserva cancelada) não é erro
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class ServidorStub:
+    """Servidor HTTP em thread que responde com JSON após uma latência configurável.
+
+    `responder(caminho, corpo)` devolve (status, dados); por padrão imita a
+    awesomeapi com uma cotação fixa de USD-BRL. `latencia` pode ser um
+    número de segundos ou uma função sem argumentos que sorteia cada atraso.
+    """
+
+    def __init__(self, latencia=0.0, responder=None):
+        self.latencia = latencia
+        self.responder = responder or (lambda caminho, corpo: (200, {'USDBRL': {'bid': '5.1234'}}))
+        self.requisicoes = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._server.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def _criar_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _responder(self):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                corpo = self.rfile.read(tamanho) if tamanho else b''
+                with stub._lock:
+                    stub.requisicoes += 1
+                atraso = stub.latencia() if callable(stub.latencia) else stub.latencia
+                if atraso:
+                    time.sleep(atraso)
+                status, dados = stub.responder(self.path, corpo)
+                saida = json.dumps(dados).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(saida)))
+                self.end_headers()
+                self.wfile.write(saida)
+
+            do_GET = _responder
+            do_POST = _responder
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def iniciar(self):
+        self._server = _Servidor(('127.0.0.1', 0), self._criar_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+def porta_livre():
+    """Porta TCP livre em 127.0.0.1 (para servidores que não aceitam porta 0)."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação do vizinho mais próximo."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def resumo_latencias(latencias):
+    """Resumo em milissegundos de uma lista de latências em segundos."""
+    return {
+        'n': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+        'max_ms': round(max(latencias, default=0) * 1000, 2),
+    }
+
+
+class CotacoesFalsas:
+    """Responder da API de cotações falsa, no formato da awesomeapi.
+
+    `valores` ({par: valor}) pode ser alterado entre as requisições para
+    simular ticks de preço.
+    """
+
+    def __init__(self, valores=None):
+        self.valores = dict(valores or {'USD-BRL': 5.0})
+
+    def __call__(self, caminho, corpo):
+        pares = urllib.parse.unquote(caminho.rstrip('/').rsplit('/', 1)[-1]).split(',')
+        dados = {par.replace('-', ''): {'bid': f"{self.valores[par]:.4f}"} for par in pares if par in self.valores}
+        if not dados:
+            return 404, {'status': 404, 'code': 'CoinNotExists', 'message': 'moeda nao encontrada'}
+        return 200, dados
+
+
+def latencia_com_cauda(base, cauda, probabilidade, semente=None):
+    """Atraso de `base` segundos, mas de `cauda` segundos com a probabilidade dada."""
+    aleatorio = random.Random(semente)
+    lock = threading.Lock()
+
+    def sortear():
+        with lock:
+            return cauda if aleatorio.random() < probabilidade else base
+    return sortear
+
+
+def com_falhas(responder, probabilidade, semente=None, status=503):
+    """Responder que devolve `status` com a probabilidade dada e delega nos outros casos."""
+    aleatorio = random.Random(semente)
+    lock = threading.Lock()
+
+    def responder_com_falhas(caminho, corpo):
+        with lock:
+            falhou = aleatorio.random() < probabilidade
+        if falhou:
+            return status, {'status': status, 'message': 'falha injetada'}
+        return responder(caminho, corpo)
+    return responder_com_falhas
+
+
+def update_comando(update_id, chat_id, comando='/start'):
+    """Update sintético de uma mensagem com comando, como o Telegram envia."""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': comando,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Teste'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(comando.split()[0])}],
+        },
+    }
+
+
+class TelegramFalso:
+    """Responder da Bot API falsa: getMe, getUpdates, sendMessage e limites com 429.
+
+    Conta mensagens por segundo (global) e por conversa e responde 429 com
+    `retry_after` quando algum limite é excedido, como o Telegram real.
+    `getUpdates` faz long polling sobre os updates de `enfileirar_update`.
+    """
+
+    def __init__(self, limite_global=30, intervalo_chat=1.0, ao_enviar=None):
+        self.limite_global = limite_global
+        self.intervalo_chat = intervalo_chat
+        self.ao_enviar = ao_enviar  # Chamado com (chat_id, texto) a cada mensagem aceita
+        self.mensagens = []  # (chat_id, texto)
+        self.respostas_429 = 0
+        self._janela = []
+        self._ultima_por_chat = {}
+        self._lock = threading.Lock()
+        self._proximo_id = itertools.count(1)
+        self._updates = []
+        self._novos_updates = threading.Condition()
+
+    def enfileirar_update(self, update):
+        with self._novos_updates:
+            self._updates.append(update)
+            self._novos_updates.notify_all()
+
+    def _get_updates(self, parametros):
+        offset = int(parametros.get('offset') or 0)
+        limite = time.monotonic() + float(parametros.get('timeout') or 0)
+        with self._novos_updates:
+            while True:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+                restante = limite - time.monotonic()
+                if self._updates or restante <= 0:
+                    return 200, {'ok': True, 'result': self._updates[:100]}
+                self._novos_updates.wait(restante)
+
+    @staticmethod
+    def _parametros(corpo):
+        if not corpo:
+            return {}
+        try:
+            return json.loads(corpo)
+        except ValueError:
+            return {k: v[0] for k, v in urllib.parse.parse_qs(corpo.decode()).items()}
+
+    def __call__(self, caminho, corpo):
+        metodo = caminho.rsplit('/', 1)[-1]
+        if metodo == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Falso',
+                                                 'username': 'falso_bot'}}
+        parametros = self._parametros(corpo)
+        if metodo == 'getUpdates':
+            return self._get_updates(parametros)
+        if metodo != 'sendMessage':
+            return 200, {'ok': True, 'result': True}
+
+        chat_id = int(parametros['chat_id'])
+        agora = time.monotonic()
+        with self._lock:
+            self._janela = [t for t in self._janela if agora - t < 1.0]
+            anterior = self._ultima_por_chat.get(chat_id)
+            if len(self._janela) >= self.limite_global or \
+                    (anterior is not None and agora - anterior < self.intervalo_chat * 0.9):
+                self.respostas_429 += 1
+                return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                             'parameters': {'retry_after': 1}}
+            self._janela.append(agora)
+            self._ultima_por_chat[chat_id] = agora
+            self.mensagens.append((chat_id, parametros.get('text')))
+            message_id = next(self._proximo_id)
+        if self.ao_enviar is not None:
+            self.ao_enviar(chat_id, parametros.get('text'))
+        return 200, {'ok': True, 'result': {
+            'message_id': message_id, 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'text': parametros.get('text'),
+        }}
@@ -0,0 +1,322 @@
+"""Suíte de benchmarks do bot inteiro, offline, com Telegram e API de cotações falsos.
+
+Uso: python benchmarks/suite.py [--alertas 10,1000,100000,1000000] [--taxa 100]
+                                [--updates 300] [--ticks 10] [--saida resultados.json]
+                                [--comparar resultados_anteriores.json]
+
+Sobe a Application real do index.py (construir_aplicacao + executar, no modo webhook)
+apontada para uma Bot API falsa e uma awesomeapi falsa locais, roda num
+diretório temporário (alertas.json e historico/ descartáveis) e, para cada
+quantidade de alertas:
+
+- carrega os alertas e mede memória (RSS) e tempo de carga;
+- envia updates sintéticos de cada comando ao webhook na taxa pedida e mede
+  vazão e percentis de latência (do POST até a resposta chegar na Bot API);
+- aplica ticks de preço no provedor falso e chama o notificar_mudanca,
+  medindo o cálculo e a entrega das notificações pela fila de envio.
+
+O resultado em JSON inclui o commit e os parâmetros; com --comparar, as
+latências p99 e a memória por alerta são comparadas com uma execução
+anterior e pioras acima da tolerância são listadas.
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import importlib
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from stubs import (CotacoesFalsas, ServidorStub, TelegramFalso, percentil, porta_livre,
+                   resumo_latencias, update_comando)
+
+import aiohttp
+
+from modelos import Alerta, TipoAlerta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAR = 'USD-BRL'
+
+# Comando -> função que gera o texto da mensagem (i: número do update)
+COMANDOS = {
+    'start': lambda i, aleatorio: '/start',
+    'cotacao': lambda i, aleatorio: '/cotacao',
+    'alerta': lambda i, aleatorio: f"/alerta {aleatorio.uniform(5.3, 6.0):.4f} acima",
+    'listar': lambda i, aleatorio: '/listar',
+    'remover': lambda i, aleatorio: '/remover 1',
+    'historico': lambda i, aleatorio: '/historico 1h',
+}
+
+
+def rss_mb():
+    """Memória residente do processo (Linux); None se indisponível."""
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, ValueError):
+        return None
+    return paginas * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def pico_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def versao_codigo():
+    try:
+        saida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                               capture_output=True, text=True, check=True)
+        return saida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def gerar_alertas(quantidade, conversas, semente):
+    aleatorio = random.Random(semente)
+    criado_ms = int(time.time() * 1000)
+    alertas = []
+    for i in range(quantidade):
+        tipo = TipoAlerta.ACIMA if i % 2 else TipoAlerta.ABAIXO
+        valor = aleatorio.uniform(5.0, 6.0) if tipo == 'acima' else aleatorio.uniform(4.0, 5.0)
+        alertas.append(Alerta(None, 1 + i % conversas, PAR, round(valor, 4), tipo, criado_ms))
+    return alertas
+
+
+class Respostas:
+    """Casa cada sendMessage com o update mais antigo pendente da mesma conversa."""
+
+    def __init__(self):
+        self.pendentes = collections.defaultdict(collections.deque)
+        self.latencias = []
+        self.fim = 0.0
+        self._lock = threading.Lock()
+
+    def chegou(self, chat_id):
+        with self._lock:
+            self.pendentes[chat_id].append(time.perf_counter())
+
+    def ao_enviar(self, chat_id, texto):
+        agora = time.perf_counter()
+        with self._lock:
+            fila = self.pendentes.get(chat_id)
+            if fila:
+                self.latencias.append(agora - fila.popleft())
+                self.fim = agora
+
+
+class Suite:
+    def __init__(self, args, index, falso, cotacoes):
+        self.args = args
+        self.index = index
+        self.falso = falso
+        self.cotacoes = cotacoes
+        self.aleatorio = random.Random(args.semente)
+        self.proximo_update = 1
+        self.url = None
+        self.sessao = None
+
+    async def carregar(self, quantidade):
+        alertas_ativos = self.index.alertas_ativos
+        alertas_ativos.limpar()
+        gc.collect()
+        antes = rss_mb()
+        alertas = gerar_alertas(quantidade, self.args.conversas, self.args.semente)
+        inicio = time.perf_counter()
+        alertas_ativos.carregar(alertas)
+        duracao = time.perf_counter() - inicio
+        del alertas
+        gc.collect()
+        depois = rss_mb()
+        memoria = {'carga_s': round(duracao, 3), 'pico_rss_mb': round(pico_rss_mb(), 1)}
+        if antes is not None:
+            memoria['rss_mb'] = round(depois - antes, 1)
+            memoria['bytes_por_alerta'] = round((depois - antes) * 2**20 / quantidade) if quantidade else None
+        return memoria
+
+    async def comando(self, nome):
+        respostas = Respostas()
+        self.falso.ao_enviar = respostas.ao_enviar
+        texto = COMANDOS[nome]
+        tarefas = []
+        inicio = time.perf_counter()
+        for i in range(self.args.updates):
+            atraso = inicio + i / self.args.taxa - time.perf_counter()
+            if atraso > 0:
+                await asyncio.sleep(atraso)
+            chat_id = 1 + i % self.args.conversas
+            update = update_comando(self.proximo_update, chat_id, texto(i, self.aleatorio))
+            self.proximo_update += 1
+            respostas.chegou(chat_id)
+            tarefas.append(asyncio.create_task(self._postar(update)))
+        await asyncio.gather(*tarefas)
+        prazo = time.perf_counter() + self.args.limite
+        while len(respostas.latencias) < self.args.updates and time.perf_counter() < prazo:
+            await asyncio.sleep(0.01)
+        self.falso.ao_enviar = None
+        duracao = respostas.fim - inicio
+        return {
+            'respondidos': len(respostas.latencias),
+            'updates_por_s': round(len(respostas.latencias) / duracao, 1) if duracao > 0 else None,
+            'latencia': resumo_latencias(respostas.latencias),
+        }
+
+    async def _postar(self, update):
+        cabecalhos = {'X-Telegram-Bot-Api-Secret-Token': self.index.WEBHOOK_SECRET}
+        async with self.sessao.post(self.url, json=update, headers=cabecalhos) as resposta:
+            resposta.raise_for_status()
+
+    async def ticks(self):
+        """Ticks de preço pelo notificar_mudanca, esperando a fila de envio esvaziar a cada um."""
+        calculo, entrega, mensagens = [], [], 0
+        disparados_antes = self.index.metrica_disparados.valor
+        preco = self.cotacoes.valores[PAR]
+        for _ in range(self.args.ticks):
+            # Passos de ~0,3%: passam da regra de 0,1% e atravessam alguns limites
+            preco *= 1 + self.aleatorio.choice((-1, 1)) * self.aleatorio.uniform(0.002, 0.004)
+            self.cotacoes.valores[PAR] = preco
+            enviadas = len(self.falso.mensagens)
+            inicio = time.perf_counter()
+            await self.index.notificar_mudanca(None)
+            calculo.append(time.perf_counter() - inicio)
+            await self.index.fila_envio.aguardar()
+            entrega.append(time.perf_counter() - inicio)
+            mensagens += len(self.falso.mensagens) - enviadas
+        tempo_entrega = sum(entrega)
+        return {
+            'ticks': len(calculo),
+            'notificar_p50_ms': round(percentil(calculo, 50) * 1000, 2),
+            'notificar_p99_ms': round(percentil(calculo, 99) * 1000, 2),
+            'entrega_p99_ms': round(percentil(entrega, 99) * 1000, 2),
+            'alertas_disparados': self.index.metrica_disparados.valor - disparados_antes,
+            'mensagens': mensagens,
+            'mensagens_por_s': round(mensagens / tempo_entrega, 1) if tempo_entrega else None,
+        }
+
+    async def executar(self):
+        index = self.index
+        # Uma hora de histórico para o /historico e os indicadores
+        serie = index.serie_do_par(PAR)
+        agora = index.agora_ms()
+        for segundo in range(3600):
+            serie.adicionar(5.0 + 0.01 * random.Random(segundo).random(), agora - (3600 - segundo) * 1000)
+
+        application = index.construir_aplicacao()
+        parar = asyncio.Event()
+        self.url = index.WEBHOOK_URL.rstrip('/') + index.CAMINHO_WEBHOOK
+        execucao = asyncio.create_task(index.executar(application, parar, agendar=None))
+        while not (application.running and index.supervisor.no_ar('web')):
+            if execucao.done():
+                execucao.result()
+            await asyncio.sleep(0.01)
+
+        cenarios = []
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=256)) as self.sessao:
+                for quantidade in self.args.alertas:
+                    logging.warning(f"Cenário com {quantidade} alertas")
+                    cenario = {'alertas': quantidade, 'memoria': await self.carregar(quantidade), 'comandos': {}}
+                    for nome in self.args.comandos:
+                        cenario['comandos'][nome] = await self.comando(nome)
+                    cenario['ticks'] = await self.ticks()
+                    cenarios.append(cenario)
+        finally:
+            parar.set()
+            await execucao
+        return cenarios
+
+
+def comparar(atual, anterior, tolerancia):
+    """Lista as métricas que pioraram mais que `tolerancia` (razão novo/antigo)."""
+    antigos = {c['alertas']: c for c in anterior.get('cenarios', [])}
+    pioras = []
+
+    def verificar(cenario, metrica, novo, antigo):
+        if novo and antigo and novo / antigo > tolerancia:
+            pioras.append({'alertas': cenario, 'metrica': metrica, 'anterior': antigo, 'atual': novo,
+                           'razao': round(novo / antigo, 2)})
+
+    for cenario in atual['cenarios']:
+        antigo = antigos.get(cenario['alertas'])
+        if antigo is None:
+            continue
+        for nome, resultado in cenario['comandos'].items():
+            anterior_cmd = antigo['comandos'].get(nome)
+            if anterior_cmd:
+                verificar(cenario['alertas'], f'{nome}.p99_ms', resultado['latencia']['p99_ms'],
+                          anterior_cmd['latencia']['p99_ms'])
+        verificar(cenario['alertas'], 'ticks.notificar_p99_ms', cenario['ticks']['notificar_p99_ms'],
+                  antigo['ticks']['notificar_p99_ms'])
+        verificar(cenario['alertas'], 'memoria.bytes_por_alerta', cenario['memoria'].get('bytes_por_alerta'),
+                  antigo['memoria'].get('bytes_por_alerta'))
+    return {'versao_anterior': anterior.get('versao'), 'tolerancia': tolerancia, 'pioras': pioras}
+
+
+def main(args):
+    cotacoes = CotacoesFalsas({PAR: 5.0})
+    falso = TelegramFalso(limite_global=10**9, intervalo_chat=0)
+    diretorio_original = os.getcwd()
+    with ServidorStub(responder=cotacoes) as api, ServidorStub(responder=falso) as telegram, \
+            tempfile.TemporaryDirectory() as diretorio:
+        porta = porta_livre()
+        os.environ.update({
+            'TELEGRAM_TOKEN': '123:falso', 'CHAT_ID': '1', 'PARES': PAR,
+            'API_URL': api.url, 'TELEGRAM_BASE_URL': f"{telegram.url}/bot",
+            'PORT': str(porta), 'WEBHOOK_URL': f"http://127.0.0.1:{porta}",
+            'ENVIO_LIMITE_GLOBAL': str(args.limite_envio),
+            # A suíte mede a vazão do bot: limites por usuário/conversa folgados, mas ativos
+            'LIMITE_USUARIO_TAXA': '1000', 'LIMITE_USUARIO_RAJADA': '1000',
+            'LIMITE_CONVERSA_TAXA': '1000', 'LIMITE_CONVERSA_RAJADA': '1000',
+        })
+        os.chdir(diretorio)  # alertas.json e historico/ ficam no diretório temporário
+        try:
+            index = importlib.import_module('index')
+            logging.getLogger().setLevel(logging.WARNING)  # O index.py configura INFO
+            cenarios = asyncio.run(Suite(args, index, falso, cotacoes).executar())
+        finally:
+            os.chdir(diretorio_original)
+
+    resultados = {
+        'versao': versao_codigo(),
+        'python': sys.version.split()[0],
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('saida', 'comparar')},
+        'cenarios': cenarios,
+    }
+    if args.comparar:
+        with open(args.comparar) as f:
+            resultados['comparacao'] = comparar(resultados, json.load(f), args.tolerancia)
+
+    texto = json.dumps(resultados, indent=2)
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            f.write(texto + '\n')
+    print(texto)
+    if args.comparar and resultados['comparacao']['pioras']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alertas', type=lambda t: [int(x) for x in t.split(',')],
+                        default=[10, 1000, 100_000, 1_000_000], help='quantidades separadas por vírgula')
+    parser.add_argument('--conversas', type=int, default=1000, help='conversas entre as quais os alertas se dividem')
+    parser.add_argument('--comandos', type=lambda t: t.split(','), default=list(COMANDOS))
+    parser.add_argument('--taxa', type=float, default=100, help='updates por segundo de cada comando')
+    parser.add_argument('--updates', type=int, default=300, help='updates por comando e cenário')
+    parser.add_argument('--ticks', type=int, default=10)
+    parser.add_argument('--limite-envio', type=int, default=1000, help='mensagens/s da fila de envio')
+    parser.add_argument('--limite', type=float, default=60, help='segundos esperando as respostas')
+    parser.add_argument('--semente', type=int, default=11)
+    parser.add_argument('--saida', help='arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='resultados anteriores para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=1.2, help='razão novo/antigo considerada piora')
+    main(parser.parse_args())
@@ -1,2 +1,5 @@
 # Build script for Render
 pip install -r requirements.txt
+
+# Bytecode dos módulos do bot gerado no build: a primeira partida não precisa compilá-los
+python -m compileall -q .
@@ -0,0 +1,183 @@
+"""Cliente assíncrono da API de cotações (awesomeapi).
+
+Mantém um único pool de conexões keep-alive durante toda a vida da
+aplicação, com timeouts limitados e novas tentativas com backoff. Todos os
+pares configurados (USD-BRL, EUR-BRL, BTC-BRL...) vêm em uma só requisição,
+já que a awesomeapi aceita pares separados por vírgula.
+"""
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+API_BASE_URL = 'https://economia.awesomeapi.com.br/last'
+PAR_PADRAO = 'USD-BRL'
+
+# Respostas que valem uma nova tentativa (limite de requisições e falhas do servidor)
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+
+class ErroCotacao(Exception):
+    """Falha definitiva ao buscar a cotação."""
+
+
+def normalizar_par(texto, moeda_base='BRL'):
+    """'eur' -> 'EUR-BRL'; 'btc-brl' -> 'BTC-BRL'."""
+    texto = texto.strip().upper()
+    return texto if '-' in texto else f"{texto}-{moeda_base}"
+
+
+def chave_resposta(par):
+    """Chave do par no JSON da awesomeapi ('USD-BRL' -> 'USDBRL')."""
+    return par.replace('-', '')
+
+
+class ClienteCotacao:
+    """Busca cotações reaproveitando uma sessão HTTP assíncrona."""
+
+    def __init__(self, base_url=API_BASE_URL, pares=(PAR_PADRAO,), timeout=5.0, tentativas=3,
+                 backoff_base=0.5, backoff_max=4.0, max_conexoes=10):
+        self.pares = tuple(pares)
+        self.url = f"{base_url.rstrip('/')}/{','.join(self.pares)}"
+        self.timeout = timeout
+        self.tentativas = max(1, tentativas)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_conexoes = max_conexoes
+        self._client = None
+
+    def _obter_client(self):
+        """Cria o pool de conexões na primeira utilização."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_conexoes,
+                    max_keepalive_connections=self.max_conexoes,
+                ),
+                headers={'Accept': 'application/json'},
+            )
+        return self._client
+
+    async def iniciar(self):
+        """Abre o pool de conexões (opcional: também é criado sob demanda)."""
+        self._obter_client()
+
+    async def fechar(self):
+        """Fecha o pool de conexões."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _espera_backoff(self, tentativa):
+        """Backoff exponencial com jitter para a tentativa informada."""
+        espera = min(self.backoff_max, self.backoff_base * (2 ** (tentativa - 1)))
+        return random.uniform(espera / 2, espera)
+
+    async def buscar_json(self, url=None):
+        """Faz o GET na API e devolve o JSON, tentando novamente em falhas transitórias."""
+        client = self._obter_client()
+        url = url or self.url
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                response = await client.get(url)
+                if response.status_code in STATUS_RETENTAVEIS:
+                    raise httpx.HTTPStatusError(
+                        f"Status {response.status_code}", request=response.request, response=response
+                    )
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retentavel = not isinstance(e, httpx.HTTPStatusError) or \
+                    e.response.status_code in STATUS_RETENTAVEIS
+                if not retentavel or tentativa == self.tentativas:
+                    raise ErroCotacao(f"{e!r} após {tentativa} tentativa(s)") from e
+                espera = self._espera_backoff(tentativa)
+                logging.warning(f"Falha ao buscar cotação ({e!r}), nova tentativa em {espera:.2f}s")
+                await asyncio.sleep(espera)
+
+    async def buscar_cotacoes(self):
+        """Devolve {par: bid} de todos os pares em uma única requisição."""
+        dados = await self.buscar_json()
+        cotacoes = {}
+        for par in self.pares:
+            try:
+                cotacoes[par] = float(dados[chave_resposta(par)]['bid'])
+            except (KeyError, TypeError, ValueError):
+                logging.warning(f"Par {par} ausente na resposta da API")
+        if not cotacoes:
+            raise ErroCotacao("Nenhum par válido na resposta da API")
+        return cotacoes
+
+    async def buscar_cotacao(self, par=None):
+        """Devolve o valor de compra (bid) de um par (o primeiro configurado por padrão)."""
+        par = par or self.pares[0]
+        cotacoes = await self.buscar_cotacoes()
+        if par not in cotacoes:
+            raise ErroCotacao(f"Par {par} ausente na resposta da API")
+        return cotacoes[par]
+
+
+class CacheCotacao:
+    """Cache com TTL para a cotação, com coalescência de buscas simultâneas.
+
+    Quando o valor expira, apenas uma busca vai à API; as demais chamadas
+    concorrentes aguardam o resultado dessa mesma busca (single-flight).
+    `permitir()`, se informado, é consultado antes de cada busca não
+    forçada: sem saldo (orçamento da API esgotado), o valor expirado é
+    devolvido no lugar de uma nova busca.
+    """
+
+    def __init__(self, buscar, ttl=30.0, relogio=time.monotonic, permitir=None):
+        self._buscar = buscar
+        self.ttl = ttl
+        self._relogio = relogio
+        self._permitir = permitir
+        self._valor = None
+        self._expira_em = 0.0
+        self._em_voo = None
+        self.acertos = 0
+        self.faltas = 0
+        self.coalescidas = 0
+        self.contidas = 0  # Buscas evitadas pelo orçamento (valor expirado devolvido)
+
+    async def _executar(self):
+        try:
+            valor = await self._buscar()
+            self._valor = valor
+            self._expira_em = self._relogio() + self.ttl
+            return valor
+        finally:
+            self._em_voo = None
+
+    async def obter(self, forcar=False):
+        """Devolve a cotação em cache ou busca uma nova (forcar=True ignora o TTL)."""
+        if not forcar and self._valor is not None and self._relogio() < self._expira_em:
+            self.acertos += 1
+            return self._valor
+        if self._em_voo is not None:
+            self.coalescidas += 1
+        elif not forcar and self._valor is not None and self._permitir is not None and not self._permitir():
+            self.contidas += 1
+            return self._valor
+        else:
+            self.faltas += 1
+            self._em_voo = asyncio.ensure_future(self._executar())
+        # shield: o cancelamento de quem espera não cancela a busca compartilhada
+        return await asyncio.shield(self._em_voo)
+
+    def invalidar(self):
+        """Descarta o valor em cache."""
+        self._expira_em = 0.0
+
+    def estatisticas(self):
+        """Contadores de acertos, faltas e buscas coalescidas."""
+        return {
+            'acertos': self.acertos,
+            'faltas': self.faltas,
+            'coalescidas': self.coalescidas,
+            'contidas': self.contidas,
+            'ttl': self.ttl,
+        }
@@ -0,0 +1,197 @@
+"""Fila de envio de mensagens respeitando os limites do Telegram.
+
+O Telegram aceita cerca de 30 mensagens por segundo no total, 1 por segundo
+em cada conversa privada e 20 por minuto em cada grupo. A fila agenda cada
+mensagem no primeiro horário livre da sua conversa, libera os envios por um
+token bucket global e limita quantos `send_message` ficam em voo ao mesmo
+tempo. Respostas 429 (RetryAfter) pausam a fila e a mensagem é reenviada;
+erros de rede transitórios são repetidos com backoff exponencial.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+LIMITE_GLOBAL = 30  # Mensagens por segundo para todo o bot
+INTERVALO_PRIVADO = 1.0  # Segundos entre mensagens na mesma conversa privada
+INTERVALO_GRUPO = 3.0  # 20 mensagens por minuto em grupos
+
+
+class FilaEnvio:
+    """Agenda e envia mensagens com limites global e por conversa."""
+
+    def __init__(self, enviar, limite_global=LIMITE_GLOBAL, concorrencia=8,
+                 intervalo_privado=INTERVALO_PRIVADO, intervalo_grupo=INTERVALO_GRUPO,
+                 rajada=1, max_tentativas_429=5, max_tentativas=3, espera_tentativa=1.0,
+                 relogio=time.monotonic):
+        self._enviar = enviar  # Normalmente bot.send_message
+        self.limite_global = limite_global
+        # Capacidade do bucket: 1 espaça os envios por igual e nunca passa do
+        # limite em qualquer janela de 1s; valores maiores permitem rajadas
+        self.rajada = rajada
+        self.intervalo_privado = intervalo_privado
+        self.intervalo_grupo = intervalo_grupo
+        self.max_tentativas_429 = max_tentativas_429
+        self.max_tentativas = max_tentativas  # Tentativas em erros de rede (timeout, conexão)
+        self.espera_tentativa = espera_tentativa  # Segundos antes da 2ª tentativa (dobra a cada uma)
+        self._relogio = relogio
+        self._semaforo = asyncio.Semaphore(concorrencia)
+        self._agenda = []  # heap de (horario, seq, item)
+        self._seq = itertools.count()
+        self._proximo_por_chat = {}
+        self._tokens = float(rajada)
+        self._tokens_em = relogio()
+        self._pausado_ate = 0.0
+        self._novo_item = asyncio.Event()
+        self._despachante = None
+        self._em_voo = set()
+        self.enviadas = 0
+        self.falhas = 0
+        self.repeticoes = 0
+        self.respostas_429 = 0
+
+    def _intervalo_chat(self, chat_id):
+        # IDs negativos são grupos e canais
+        if isinstance(chat_id, int) and chat_id < 0:
+            return self.intervalo_grupo
+        return self.intervalo_privado
+
+    def _reservar_horario(self, chat_id, agora):
+        """Primeiro horário livre da conversa, já reservando o seguinte."""
+        horario = max(agora, self._proximo_por_chat.get(chat_id, 0.0))
+        self._proximo_por_chat[chat_id] = horario + self._intervalo_chat(chat_id)
+        if len(self._proximo_por_chat) > 10000:
+            # Esquece conversas cujo intervalo já passou (memória limitada)
+            self._proximo_por_chat = {c: t for c, t in self._proximo_por_chat.items() if t > agora}
+        return horario
+
+    def _agendar(self, item, horario):
+        heapq.heappush(self._agenda, (horario, next(self._seq), item))
+        self._novo_item.set()
+
+    def enviar(self, chat_id, texto, **kwargs):
+        """Enfileira uma mensagem e devolve um Future com a Message enviada."""
+        if self._despachante is None:
+            self.iniciar()
+        futuro = asyncio.get_running_loop().create_future()
+        # Falhas já são registradas no log; evita aviso de exceção não lida
+        futuro.add_done_callback(lambda f: f.cancelled() or f.exception())
+        item = {'chat_id': chat_id, 'text': texto, 'kwargs': kwargs, 'futuro': futuro,
+                'tentativas_429': 0, 'tentativas': 1}
+        self._agendar(item, self._reservar_horario(chat_id, self._relogio()))
+        return futuro
+
+    def iniciar(self):
+        """Inicia a tarefa que despacha as mensagens agendadas."""
+        if self._despachante is None or self._despachante.done():
+            self._despachante = asyncio.create_task(self._despachar())
+
+    async def fechar(self):
+        """Aguarda as mensagens pendentes e encerra o despachante."""
+        await self.aguardar()
+        if self._despachante is not None:
+            self._despachante.cancel()
+            try:
+                await self._despachante
+            except asyncio.CancelledError:
+                pass
+            self._despachante = None
+
+    async def aguardar(self):
+        """Espera até que a agenda e os envios em voo terminem."""
+        while self._agenda or self._em_voo:
+            if self._em_voo:
+                await asyncio.wait(set(self._em_voo))
+            else:
+                await asyncio.sleep(0.01)
+
+    async def _esperar_token(self):
+        """Token bucket global (também respeita pausas por 429)."""
+        while True:
+            agora = self._relogio()
+            if agora < self._pausado_ate:
+                await asyncio.sleep(self._pausado_ate - agora)
+                continue
+            self._tokens = min(float(self.rajada),
+                               self._tokens + (agora - self._tokens_em) * self.limite_global)
+            self._tokens_em = agora
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.limite_global)
+
+    async def _despachar(self):
+        while True:
+            if not self._agenda:
+                self._novo_item.clear()
+                await self._novo_item.wait()
+                continue
+            horario = self._agenda[0][0]
+            espera = horario - self._relogio()
+            if espera > 0:
+                # Acorda antes se chegar uma mensagem com horário mais cedo
+                self._novo_item.clear()
+                try:
+                    await asyncio.wait_for(self._novo_item.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, item = heapq.heappop(self._agenda)
+            await self._esperar_token()
+            await self._semaforo.acquire()
+            tarefa = asyncio.create_task(self._enviar_item(item))
+            self._em_voo.add(tarefa)
+            tarefa.add_done_callback(self._em_voo.discard)
+
+    def _falhar(self, item, erro):
+        self.falhas += 1
+        if not item['futuro'].done():
+            item['futuro'].set_exception(erro)
+
+    async def _enviar_item(self, item):
+        futuro = item['futuro']
+        try:
+            mensagem = await self._enviar(chat_id=item['chat_id'], text=item['text'], **item['kwargs'])
+        except RetryAfter as e:
+            self.respostas_429 += 1
+            espera = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._pausado_ate = max(self._pausado_ate, self._relogio() + espera)
+            item['tentativas_429'] += 1
+            if item['tentativas_429'] > self.max_tentativas_429:
+                self._falhar(item, e)
+            else:
+                logging.warning(f"Telegram pediu para aguardar {espera}s (chat {item['chat_id']})")
+                self._agendar(item, self._pausado_ate)
+        except NetworkError as e:
+            # BadRequest (mensagem ou conversa inválida) não melhora com uma nova tentativa
+            if isinstance(e, BadRequest) or item['tentativas'] >= self.max_tentativas:
+                logging.error(f"Erro ao enviar mensagem para {item['chat_id']}: {e}")
+                self._falhar(item, e)
+            else:
+                espera = self.espera_tentativa * 2 ** (item['tentativas'] - 1)
+                item['tentativas'] += 1
+                self.repeticoes += 1
+                logging.warning(f"Erro de rede ao enviar para {item['chat_id']} ({e}); nova tentativa em {espera}s")
+                self._agendar(item, self._relogio() + espera)
+        except Exception as e:
+            logging.error(f"Erro ao enviar mensagem para {item['chat_id']}: {e}")
+            self._falhar(item, e)
+        else:
+            self.enviadas += 1
+            if not futuro.done():
+                futuro.set_result(mensagem)
+        finally:
+            self._semaforo.release()
+
+    def estatisticas(self):
+        """Contadores de envio."""
+        return {
+            'pendentes': len(self._agenda) + len(self._em_voo),
+            'enviadas': self.enviadas,
+            'falhas': self.falhas,
+            'repeticoes': self.repeticoes,
+            'respostas_429': self.respostas_429,
+        }
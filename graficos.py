@@ -0,0 +1,124 @@
+"""Gráficos PNG das cotações para o /grafico, renderizados fora do event loop.
+
+`renderizar_png` é uma função pura (recebe listas, devolve os bytes do
+PNG) feita para rodar em um ProcessPoolExecutor: o matplotlib segura o
+GIL por dezenas de milissegundos por imagem e, no handler, travaria todos
+os outros updates. Ele só é importado nos processos de renderização.
+
+`CacheGraficos` guarda o file_id do Telegram de cada imagem já enviada,
+pela chave (par, período, timestamp da última amostra): enquanto não chega
+cotação nova, pedir o mesmo gráfico só reenvia o file_id, sem renderizar
+nem subir a imagem de novo. Pedidos simultâneos do mesmo gráfico esperam a
+primeira renderização em vez de repeti-la.
+"""
+import asyncio
+import importlib.util
+import io
+from collections import OrderedDict
+from datetime import datetime
+
+from indicadores import calcular_em_lote
+
+MAX_PONTOS = 500  # Pontos por gráfico (velas do período, pelo fechamento)
+MAX_GRAFICOS = 256  # file_ids guardados (os menos usados saem primeiro)
+
+
+def disponivel():
+    """O matplotlib é opcional: sem ele o /grafico avisa que está indisponível."""
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')  # Sem interface gráfica
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def aquecer():
+    """Importa o matplotlib no processo de renderização antes do primeiro pedido."""
+    _pyplot()
+
+
+def renderizar_png(titulo, tempos_ms, valores, janela=20):
+    """PNG com a cotação, MMS, MME, bandas de Bollinger e a reta de tendência (mínimos quadrados)."""
+    plt = _pyplot()
+    import numpy as np  # Dependência do próprio matplotlib
+
+    tempos = [datetime.fromtimestamp(t / 1000) for t in tempos_ms]
+    series = calcular_em_lote(valores, janela)
+    figura, eixo = plt.subplots(figsize=(8, 4.5), dpi=100)
+    try:
+        eixo.fill_between(tempos, series['banda_inferior'], series['banda_superior'],
+                          color='tab:blue', alpha=0.12, label='Bandas de Bollinger')
+        eixo.plot(tempos, valores, color='black', linewidth=1.2, label='Cotação')
+        eixo.plot(tempos, series['mms'], color='tab:blue', linewidth=1, label=f'MMS {janela}')
+        eixo.plot(tempos, series['mme'], color='tab:orange', linewidth=1, label='MME')
+        if len(valores) > 1:
+            x = np.asarray(tempos_ms, dtype=float) - tempos_ms[0]
+            inclinacao, intercepto = np.polyfit(x, valores, 1)
+            eixo.plot(tempos, intercepto + inclinacao * x, '--', color='tab:red', linewidth=1, label='Tendência')
+        eixo.set_title(titulo)
+        eixo.grid(alpha=0.3)
+        eixo.legend(loc='upper left', fontsize=8)
+        figura.autofmt_xdate()
+        saida = io.BytesIO()
+        figura.savefig(saida, format='png', bbox_inches='tight')
+    finally:
+        plt.close(figura)
+    return saida.getvalue()
+
+
+class CacheGraficos:
+    """file_id de cada gráfico já enviado, com as renderizações em andamento compartilhadas."""
+
+    def __init__(self, max_itens=MAX_GRAFICOS):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()  # chave -> file_id
+        self._em_andamento = {}  # chave -> Future do file_id
+        self.acertos = 0
+        self.coalescidos = 0
+        self.renderizacoes = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    async def obter(self, chave, gerar):
+        """(file_id, gerado) do cache, de uma geração em andamento ou de `await gerar()`.
+
+        `gerar` renderiza, envia a imagem e devolve o file_id; só quem a
+        chamou já recebeu o gráfico (gerado=True), os demais reenviam o
+        file_id. Uma falha em `gerar` chega a todos que esperavam por ela.
+        """
+        file_id = self._itens.get(chave)
+        if file_id is not None:
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return file_id, False
+        pendente = self._em_andamento.get(chave)
+        if pendente is not None:
+            self.coalescidos += 1
+            return await asyncio.shield(pendente), False
+
+        futuro = self._em_andamento[chave] = asyncio.get_running_loop().create_future()
+        try:
+            file_id = await gerar()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                futuro.cancel()
+            else:
+                futuro.set_exception(e)
+                futuro.exception()  # Marca como lida: pode não haver ninguém esperando
+            raise
+        finally:
+            del self._em_andamento[chave]
+        futuro.set_result(file_id)
+        self.renderizacoes += 1
+        self._itens[chave] = file_id
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+        return file_id, True
+
+    def estatisticas(self):
+        return {'itens': len(self._itens), 'acertos': self.acertos, 'coalescidos': self.coalescidos,
+                'renderizacoes': self.renderizacoes}
@@ -0,0 +1,136 @@
+"""Importação e exportação de alertas em lote (JSON e CSV), para a API HTTP do bot.
+
+Funções puras: leem o corpo da requisição, validam todos os registros de
+uma vez (devolvendo os erros de cada linha) e descartam duplicados com a
+mesma chave (chat_id, par, valor, tipo) usada pelo IndiceAlertas. Quem
+chama indexa e grava o lote inteiro de uma só vez. Os registros trocados
+são os dicts de `Alerta.para_dict` (criado_em em ISO).
+"""
+import csv
+import io
+import json
+import math
+import sys
+import time
+
+from alertas import TIPOS_ALERTA
+from cotacao import normalizar_par
+from modelos import Alerta, TipoAlerta, ms_de_iso
+
+CAMPOS_CSV = ('id', 'chat_id', 'par', 'valor', 'tipo', 'criado_em')
+MAX_ERROS = 100  # Erros de validação devolvidos na resposta
+
+
+def _e_csv(tipo_conteudo):
+    return 'csv' in (tipo_conteudo or '')
+
+
+def ler_registros(corpo, tipo_conteudo):
+    """Lista de dicts a partir de um corpo JSON (lista ou {"alertas": [...]}) ou CSV com cabeçalho."""
+    if _e_csv(tipo_conteudo):
+        texto = corpo.decode('utf-8-sig')
+        leitor = csv.DictReader(io.StringIO(texto))
+        if not leitor.fieldnames:
+            raise ValueError("CSV sem cabeçalho")
+        leitor.fieldnames = [nome.strip().lower() for nome in leitor.fieldnames]
+        return list(leitor)
+    dados = json.loads(corpo) if corpo else []
+    if isinstance(dados, dict):
+        dados = dados.get('alertas')
+    if not isinstance(dados, list):
+        raise ValueError("esperada uma lista de alertas ou {\"alertas\": [...]}")
+    return dados
+
+
+def ler_ids(corpo, tipo_conteudo):
+    """Ids a remover: JSON {"ids": [...]}, lista de ids ou de alertas, ou CSV com a coluna id."""
+    if not _e_csv(tipo_conteudo):
+        dados = json.loads(corpo) if corpo else []
+        if isinstance(dados, dict):
+            dados = dados.get('ids', [])
+        if not isinstance(dados, list):
+            raise ValueError("esperado {\"ids\": [...]}")
+    else:
+        dados = ler_registros(corpo, tipo_conteudo)
+    try:
+        return [int(item['id'] if isinstance(item, dict) else item) for item in dados]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("ids devem ser números inteiros")
+
+
+def validar(registros, pares, criado_ms=None):
+    """Valida os registros; devolve (Alertas sem id, erros).
+
+    Cada erro é {"linha": n, "erro": texto}, com n contado a partir de 1
+    (sem o cabeçalho, no CSV). Alertas sem par usam o primeiro de `pares`.
+    """
+    criado_ms = criado_ms or int(time.time() * 1000)
+    pares = list(pares)
+    permitidos = set(pares)
+    normalizados = {}  # Texto do par -> par normalizado
+    alertas, erros = [], []
+    for numero, registro in enumerate(registros, 1):
+        try:
+            if not isinstance(registro, dict):
+                raise ValueError("registro deve ser um objeto")
+            try:
+                chat_id = int(registro['chat_id'])
+            except (TypeError, ValueError):
+                raise ValueError("chat_id deve ser um número inteiro")
+            texto_par = registro.get('par') or pares[0]
+            par = normalizados.get(texto_par)
+            if par is None:
+                par = normalizados[texto_par] = sys.intern(normalizar_par(str(texto_par)))
+            if par not in permitidos:
+                raise ValueError(f"par {par} não monitorado")
+            try:
+                valor = float(str(registro['valor']).replace(',', '.'))
+            except ValueError:
+                raise ValueError("valor deve ser um número")
+            if not math.isfinite(valor) or valor <= 0:
+                raise ValueError("valor deve ser positivo")
+            tipo = str(registro['tipo']).strip().lower()
+            if tipo not in TIPOS_ALERTA:
+                raise ValueError(f"tipo deve ser {' ou '.join(TIPOS_ALERTA)}")
+            data = registro.get('criado_em')
+            criado = ms_de_iso(data) if data else criado_ms
+        except KeyError as e:
+            erros.append({'linha': numero, 'erro': f"campo {e.args[0]} ausente"})
+            continue
+        except (TypeError, ValueError) as e:
+            erros.append({'linha': numero, 'erro': str(e)})
+            continue
+        alertas.append(Alerta(None, chat_id, par, valor, TipoAlerta(tipo), criado))
+    return alertas, erros
+
+
+def deduplicar(alertas, existe):
+    """Separa os alertas novos; `existe(chat_id, par, valor, tipo)` consulta os já ativos.
+
+    Devolve (novos, quantidade de duplicados), contando também as
+    repetições dentro do próprio lote.
+    """
+    vistos = set()
+    novos = []
+    for alerta in alertas:
+        chave = alerta.chave
+        if chave in vistos or existe(*chave):
+            continue
+        vistos.add(chave)
+        novos.append(alerta)
+    return novos, len(alertas) - len(novos)
+
+
+def exportar_csv(alertas):
+    """Alertas em CSV com cabeçalho (mesmas colunas aceitas na importação)."""
+    saida = io.StringIO()
+    escritor = csv.DictWriter(saida, fieldnames=CAMPOS_CSV, extrasaction='ignore', lineterminator='\n')
+    escritor.writeheader()
+    escritor.writerows(alerta.para_dict() for alerta in alertas)
+    return saida.getvalue()
+
+
+def exportar_json(alertas):
+    """Alertas em JSON {"total": n, "alertas": [...]}, no formato aceito na importação."""
+    return json.dumps({'total': len(alertas), 'alertas': [alerta.para_dict() for alerta in alertas]},
+                      ensure_ascii=False)
@@ -1,17 +1,47 @@
-import requests
+import time
+_inicio_partida = time.perf_counter()  # Antes dos imports: o --profile-startup mede também eles
+
+import argparse
 import logging
 import asyncio
 import os
+import re
 import json
-import threading
+import secrets
+import hmac
+import functools
+import gc
 from datetime import datetime
+from urllib.parse import urlsplit
+from aiohttp import web
 from dotenv import load_dotenv
-from flask import Flask
-from threading import Thread
 
 # Importações da biblioteca do Telegram
-from telegram import Update, BotCommand
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import (Application, ApplicationHandlerStop, CallbackQueryHandler, CommandHandler,
+                          ContextTypes, TypeHandler)
+
+from agendador import AgendadorAdaptativo
+from alertas import IndiceAlertas, TIPOS_ALERTA, valor_valido
+from armazenamento import DiarioAlertas
+from cotacao import API_BASE_URL, ClienteCotacao, CacheCotacao, normalizar_par
+from envio import FilaEnvio
+from indicadores import Indicadores
+from limites import LimitadorTaxa
+from listagem import CachePaginas
+from metricas import PerfilPartida, Registro, cronometrar, TIPO_CONTEUDO
+from modelos import TIPOS_MOVEIS, Alerta, TipoAlerta
+from provedores import Provedor, ProvedoresCotacao
+import regras
+from regras import formatar_valor
+from serie_temporal import SerieTemporal, BUCKETS_MS, agora_ms
+from servidor_web import ServidorWeb, componente_web, componente_webhook
+from supervisor import Supervisor, componente_polling, componente_tarefas, executar_supervisionado
+
+# Tempos da partida (fases e marcos); no /status e, com --profile-startup, na saída
+perfil_partida = PerfilPartida(_inicio_partida)
+perfil_partida.registrar('importacoes', _inicio_partida)
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -19,8 +49,55 @@ load_dotenv()
 # --- CONFIGURAÇÕES ---
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 CHAT_ID = os.getenv('CHAT_ID')
-API_URL = 'https://economia.awesomeapi.com.br/last/USD-BRL'
-ALERTAS_FILE = 'alertas.json'
+ALERTAS_FILE = 'alertas.json'  # Snapshot em alertas.bin (JSON só de reserva); alterações em alertas.json.diario
+# Banco SQLite compartilhado por várias réplicas no mesmo host; sem ele, alertas.json
+ESTADO_DB = os.getenv('ESTADO_DB')
+LIDERANCA_DURACAO = float(os.getenv('LIDERANCA_DURACAO', 15))  # Segundos do arrendamento da réplica líder
+SINCRONIZACAO_INTERVALO = float(os.getenv('SINCRONIZACAO_INTERVALO', 1))  # Segundos entre sincronizações
+API_URL = os.getenv('API_URL', API_BASE_URL)  # Ex.: provedor falso local nos benchmarks
+# Fontes de cotação no formato da awesomeapi, em ordem de preferência (a primeira é a principal)
+API_URLS = [url.strip() for url in os.getenv('API_URLS', API_URL).split(',') if url.strip()]
+HEDGE_PERCENTIL = float(os.getenv('HEDGE_PERCENTIL', 90))  # Latência da fonte antes de consultar a próxima
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', 5))  # Segundos por requisição
+API_TENTATIVAS = int(os.getenv('API_TENTATIVAS', 3))  # Tentativas com backoff
+CACHE_TTL = float(os.getenv('CACHE_TTL', 30))  # Segundos que uma cotação é reaproveitada
+# Pares monitorados, buscados juntos em uma única requisição (o primeiro é o padrão)
+PARES = [normalizar_par(p) for p in os.getenv('PARES', 'USD-BRL').split(',') if p.strip()]
+# Verificação adaptativa: mais frequente perto dos limites dos alertas, dentro do orçamento
+INTERVALO_MIN = float(os.getenv('INTERVALO_MIN', 60))  # Segundos
+INTERVALO_MAX = float(os.getenv('INTERVALO_MAX', 1800))  # Segundos (30 minutos)
+ORCAMENTO_HORA = int(os.getenv('ORCAMENTO_HORA', 120))  # Requisições à API por hora
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL')  # Ex.: servidor falso da Bot API em testes
+ENVIO_CONCORRENCIA = int(os.getenv('ENVIO_CONCORRENCIA', 8))  # send_message simultâneos
+ENVIO_LIMITE_GLOBAL = int(os.getenv('ENVIO_LIMITE_GLOBAL', 30))  # Mensagens por segundo (limite do Telegram)
+HISTORICO_DIR = os.getenv('HISTORICO_DIR', 'historico')  # Um arquivo de série por par
+HISTORICO_CAPACIDADE = int(os.getenv('HISTORICO_CAPACIDADE', 500_000))  # Amostras por par (16 bytes cada)
+INDICADORES_JANELA = int(os.getenv('INDICADORES_JANELA', 20))  # Amostras da MMS, bandas e volatilidade
+ALERTAS_POR_PAGINA = int(os.getenv('ALERTAS_POR_PAGINA', 20))  # Alertas por página no /listar
+GRAFICO_PROCESSOS = int(os.getenv('GRAFICO_PROCESSOS', 1))  # Processos que renderizam o /grafico
+AQUECIMENTO_INDICADORES = 10_000  # Amostras do histórico usadas para iniciar os indicadores
+PORT = int(os.getenv('PORT', 8080))  # Porta do servidor web (status e webhook)
+# Reinício de um componente que caiu (polling, servidor web, tarefas): backoff com jitter
+REINICIO_BACKOFF_BASE = float(os.getenv('REINICIO_BACKOFF_BASE', 1))  # Segundos antes do 1º reinício
+REINICIO_BACKOFF_MAX = float(os.getenv('REINICIO_BACKOFF_MAX', 60))  # Maior espera entre reinícios
+# Modo webhook: URL pública (https) do servidor; sem ela o bot usa long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+CAMINHO_WEBHOOK = '/telegram'
+# API HTTP de alertas em lote (/api/alertas): desativada sem um token
+API_TOKEN = os.getenv('API_TOKEN')
+API_TAMANHO_MAXIMO = int(os.getenv('API_TAMANHO_MAXIMO', 64 * 1024 ** 2))  # Maior corpo aceito (bytes)
+# Limites de comandos (token bucket): comandos por segundo e rajada, por usuário e por conversa
+LIMITE_USUARIO_TAXA = float(os.getenv('LIMITE_USUARIO_TAXA', 0.2))
+LIMITE_USUARIO_RAJADA = int(os.getenv('LIMITE_USUARIO_RAJADA', 5))
+LIMITE_CONVERSA_TAXA = float(os.getenv('LIMITE_CONVERSA_TAXA', 1))
+LIMITE_CONVERSA_RAJADA = int(os.getenv('LIMITE_CONVERSA_RAJADA', 20))
+# Buscas na API por hora disparadas por comandos (/cotacao); esgotado, vale a última cotação
+ORCAMENTO_API_COMANDOS = int(os.getenv('ORCAMENTO_API_COMANDOS', 60))
+CONCORRENCIA_UPDATES = int(os.getenv('CONCORRENCIA_UPDATES', 32))  # Updates processados em paralelo
+# Mudança que gera notificação: percentual fixo ('0.1%') ou múltiplo da volatilidade recente ('2sigma')
+LIMIAR_MUDANCA = os.getenv('LIMIAR_MUDANCA', '0.1%')
+MUDANCA_SIGMAS, MUDANCA_PERCENTUAL = regras.interpretar_limiar(LIMIAR_MUDANCA)
 
 # Verifica se as variáveis de ambiente estão configuradas
 if not TELEGRAM_TOKEN:
@@ -28,203 +105,774 @@ if not TELEGRAM_TOKEN:
 if not CHAT_ID:
     raise ValueError("CHAT_ID não foi configurado. Verifique o arquivo .env")
 
+# Conversa padrão: recebe as notificações de mudança e os alertas do formato antigo
+CHAT_PADRAO = int(CHAT_ID) if CHAT_ID.lstrip('-').isdigit() else CHAT_ID
+
 # Configura o logging para ver o que está acontecendo
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
 
-# Variáveis globais para armazenar histórico
-historico_cotacoes = []
-alertas_ativos = []
+# Histórico de cotações de cada par (séries em disco, abertas sob demanda)
+historico_cotacoes = {}
+indicadores_por_par = {}  # par -> Indicadores, atualizados a cada cotação buscada
+alertas_ativos = IndiceAlertas()
+# Alertas disparados cuja notificação ainda não foi entregue (id -> alerta);
+# a remoção só vai para o diário depois da entrega
+alertas_em_envio = {}
+# Com ESTADO_DB as réplicas dividem os alertas e só a líder verifica as cotações;
+# o alertas.json existente é importado pela primeira réplica que subir
+if ESTADO_DB:
+    from replicas import EstadoCompartilhado  # sqlite3 só é importado com réplicas
+    diario_alertas = EstadoCompartilhado(ESTADO_DB, importar_de=ALERTAS_FILE)
+else:
+    diario_alertas = DiarioAlertas(ALERTAS_FILE)
+lider = False  # Liderança vista na última sincronização (só com ESTADO_DB)
+# Alertas e histórico são lidos do disco junto com a inicialização da Application:
+# até o fim da carga o servidor web já responde, mas a API de alertas devolve 503
+estado_carregado = False
+paginas_listar = CachePaginas(alertas_ativos, por_pagina=ALERTAS_POR_PAGINA)
+
+# Fontes de cotação, cada uma com seu pool de conexões; a mais lenta ganha uma
+# requisição de reserva na seguinte e as que falham são desligadas por um tempo.
+# Com mais de uma fonte, as novas tentativas são rodadas sobre as fontes, não na mesma
+_tentativas_fonte = API_TENTATIVAS if len(API_URLS) == 1 else 1
+_provedores = []
+for _url in API_URLS:
+    _nome = urlsplit(_url).netloc or _url
+    if any(p.nome == _nome for p in _provedores):
+        _nome = f"{_nome}#{len(_provedores) + 1}"
+    _provedores.append(Provedor(_nome, ClienteCotacao(_url, pares=PARES, timeout=API_TIMEOUT,
+                                                      tentativas=_tentativas_fonte)))
+provedores_cotacao = ProvedoresCotacao(_provedores, percentil=HEDGE_PERCENTIL,
+                                       tentativas=API_TENTATIVAS if len(API_URLS) > 1 else 1)
+
+# Decide quando consultar a API de novo (distância até os alertas + volatilidade)
+agendador = AgendadorAdaptativo(INTERVALO_MIN, INTERVALO_MAX, ORCAMENTO_HORA)
 
-# --- SERVIDOR WEB PARA MANTER ATIVO NO REPLIT ---
-app = Flask(__name__)
+# Limites por usuário e por conversa, aplicados antes dos handlers, e orçamento
+# global de buscas na API vindas de comandos
+limite_usuarios = LimitadorTaxa(LIMITE_USUARIO_TAXA, LIMITE_USUARIO_RAJADA)
+limite_conversas = LimitadorTaxa(LIMITE_CONVERSA_TAXA, LIMITE_CONVERSA_RAJADA)
+orcamento_api_comandos = LimitadorTaxa(ORCAMENTO_API_COMANDOS / 3600, max(1, min(10, ORCAMENTO_API_COMANDOS)))
+ultima_resposta_cotacao = {}  # pares -> texto do último /cotacao (resposta aos limitados)
 
-@app.route('/')
-def home():
-    return """
-    <h1>🤖 Bot de Cotação USD-BRL</h1>
+# Gráficos do /grafico: renderizados em processos separados (criados no início do
+# bot, antes das threads) e reenviados pelo file_id enquanto não chega cotação nova
+executor_graficos = None
+cache_graficos = None  # Criado com os processos (iniciar_graficos)
+
+# Fila de envio com limites do Telegram (criada quando o bot inicializa)
+fila_envio = None
+tarefa_menu = None  # set_my_commands da partida, em segundo plano
+servidor_web = None  # Criado em construir_aplicacao
+supervisor = None  # Vigia os componentes enquanto o bot roda (executar)
+ultima_verificacao = None  # Horário da última verificação completa (notificar_mudanca)
+
+# --- MÉTRICAS (expostas em /metrics no formato do Prometheus) ---
+registro = Registro()
+metrica_busca = registro.histograma('cotacao_busca_segundos', 'Duração das buscas na API de cotações, com as tentativas')
+metrica_erros_busca = registro.contador('cotacao_erros_total', 'Buscas na API de cotações que falharam')
+metrica_ultima_busca = registro.medidor('cotacao_ultima_busca_sucesso_timestamp_segundos',
+                                        'Horário (epoch) da última busca bem-sucedida na API')
+metrica_verificacao = registro.histograma('verificar_alertas_segundos', 'Duração da verificação dos alertas',
+                                          buckets=(1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+metrica_disparados = registro.contador('alertas_disparados_total', 'Alertas atingidos pela cotação')
+metrica_devolvidos = registro.contador('alertas_devolvidos_total',
+                                       'Alertas devolvidos ao índice porque a notificação não foi entregue')
+metrica_importados = registro.contador('api_alertas_importados_total', 'Alertas criados pela API em lote')
+metrica_envio = registro.histograma('telegram_envio_segundos', 'Latência do send_message das notificações')
+registro.funcao('telegram_respostas_429_total', 'Respostas 429 (Too Many Requests) do Telegram',
+                lambda: fila_envio.estatisticas()['respostas_429'] if fila_envio else 0)
+registro.funcao('alertas_ativos', 'Alertas ativos', lambda: len(alertas_ativos), tipo='gauge')
+for _provedor in provedores_cotacao.provedores:
+    registro.funcao('cotacao_fonte_disponivel', 'Fonte de cotação liberada pelo disjuntor (1) ou desligada (0)',
+                    lambda p=_provedor: int(p.disjuntor.estado != 'aberto'), tipo='gauge',
+                    rotulos={'fonte': _provedor.nome})
+registro.funcao('replica_lider', 'Esta réplica é a líder que verifica as cotações (1) ou não (0)',
+                lambda: int(sou_lider()), tipo='gauge')
+registro.funcao('alertas_em_envio', 'Alertas disparados aguardando a entrega da notificação',
+                lambda: len(alertas_em_envio), tipo='gauge')
+metrica_grafico = registro.histograma('grafico_renderizacao_segundos', 'Renderização dos gráficos do /grafico',
+                                      buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+for _resultado, _campo in (('cache', 'acertos'), ('coalescido', 'coalescidos'), ('renderizado', 'renderizacoes')):
+    registro.funcao('grafico_pedidos_total', 'Pedidos do /grafico por origem da imagem',
+                    lambda campo=_campo: cache_graficos.estatisticas()[campo] if cache_graficos else 0,
+                    rotulos={'resultado': _resultado})
+
+# --- SERVIDOR WEB (STATUS E WEBHOOK, NO EVENT LOOP DO BOT) ---
+
+async def home(request):
+    return web.Response(content_type='text/html', text="""
+    <h1>🤖 Bot de Cotação {}</h1>
     <p><strong>Status:</strong> ✅ Online e funcionando!</p>
     <p><strong>Alertas ativos:</strong> {}</p>
     <p><strong>Última verificação:</strong> {}</p>
     <p><strong>Bot do Telegram:</strong> @rateNotificator3000_bot</p>
     """.format(
+        ', '.join(PARES),
         len(alertas_ativos),
-        datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    )
+        ultima_verificacao.strftime("%d/%m/%Y %H:%M:%S") if ultima_verificacao else "ainda não houve"
+    ))
+
+async def health(request):
+    return web.json_response({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
-@app.route('/status')
-def status():
-    return {
+async def status(request):
+    return web.json_response({
         "status": "online",
+        "modo": "webhook" if WEBHOOK_URL else "polling",
         "alertas_ativos": len(alertas_ativos),
-        "ultima_verificacao": datetime.now().isoformat(),
-        "historico_cotacoes": len(historico_cotacoes)
-    }
+        "ultima_verificacao": ultima_verificacao.isoformat() if ultima_verificacao else None,
+        "ultima_busca": datetime.fromtimestamp(metrica_ultima_busca.valor).isoformat() if metrica_ultima_busca.valor else None,
+        "historico_cotacoes": {par: len(serie) for par, serie in historico_cotacoes.items()} if estado_carregado else None,
+        "cache_cotacao": cache_cotacao.estatisticas(),
+        "limites": {"usuarios": limite_usuarios.estatisticas(), "conversas": limite_conversas.estatisticas(),
+                    "api_comandos": orcamento_api_comandos.estatisticas()},
+        "fontes_cotacao": provedores_cotacao.estatisticas(),
+        "envio": fila_envio.estatisticas() if fila_envio else None,
+        "graficos": cache_graficos.estatisticas() if cache_graficos else None,
+        "componentes": supervisor.estatisticas() if supervisor else None,
+        "partida": perfil_partida.relatorio(),
+        "replica": {
+            "id": diario_alertas.replica,
+            "lider": sou_lider(),
+            "lider_atual": diario_alertas.lider_atual(),
+            "ultimo_evento": diario_alertas.ultimo_evento,
+        } if ESTADO_DB and estado_carregado else None
+    })
+
+async def metrics(request):
+    return web.Response(body=registro.exportar().encode(), headers={'Content-Type': TIPO_CONTEUDO})
 
-def run_flask():
-    """Executa o servidor Flask em uma thread separada."""
-    app.run(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
+# --- API DE ALERTAS EM LOTE ---
+
+def autorizado(request):
+    """Confere o cabeçalho Authorization: Bearer <API_TOKEN>."""
+    recebido = request.headers.get('Authorization', '')
+    return hmac.compare_digest(recebido.encode(), f"Bearer {API_TOKEN}".encode())
+
+def erro_api(status, mensagem, **extras):
+    return web.json_response({'erro': mensagem, **extras}, status=status)
+
+def recusar_api(request):
+    """Resposta de erro se a requisição não pode ser atendida (token inválido ou alertas carregando)."""
+    if not autorizado(request):
+        return erro_api(401, 'não autorizado')
+    if not estado_carregado:
+        return erro_api(503, 'alertas ainda carregando; tente novamente em instantes')
+    return None
+
+def chat_da_consulta(request):
+    """chat_id da query string (None se ausente); ValueError se não for um número."""
+    chat_id = request.query.get('chat_id')
+    return int(chat_id) if chat_id else None
+
+async def api_exportar(request):
+    """GET /api/alertas[?chat_id=&formato=csv]: alertas ativos em JSON ou CSV."""
+    import importacao  # Só a API em lote usa (csv); fica fora da partida
+    recusa = recusar_api(request)
+    if recusa is not None:
+        return recusa
+    try:
+        chat_id = chat_da_consulta(request)
+    except ValueError:
+        return erro_api(400, 'chat_id inválido')
+    # Só a lista é copiada no loop; a conversão para dicts e a serialização rodam em uma thread
+    alertas = list(alertas_ativos if chat_id is None else alertas_ativos.do_chat(chat_id))
+    if request.query.get('formato') == 'csv' or 'csv' in request.headers.get('Accept', ''):
+        corpo = await asyncio.to_thread(importacao.exportar_csv, alertas)
+        return web.Response(text=corpo, content_type='text/csv')
+    corpo = await asyncio.to_thread(importacao.exportar_json, alertas)
+    return web.Response(text=corpo, content_type='application/json')
+
+async def api_importar(job_queue, request):
+    """POST /api/alertas: cria alertas em lote (JSON ou CSV), com uma única gravação.
+
+    Com algum registro inválido nada é importado (422), a menos que a
+    query tenha parcial=1; duplicados (já ativos ou repetidos no lote) são
+    ignorados e contados.
+    """
+    import importacao
+    recusa = recusar_api(request)
+    if recusa is not None:
+        return recusa
+    corpo = await request.read()
+    try:
+        # Leitura e validação fora do event loop: lotes de dezenas de milhares de linhas
+        registros = await asyncio.to_thread(importacao.ler_registros, corpo, request.content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        return erro_api(400, f'corpo inválido: {e}')
+    alertas, erros = await asyncio.to_thread(importacao.validar, registros, PARES)
+    invalidos = {'invalidos': len(erros), 'erros': erros[:importacao.MAX_ERROS]}
+    if erros and request.query.get('parcial') not in ('1', 'true'):
+        return erro_api(422, 'alertas inválidos; nada foi importado', **invalidos)
+
+    novos, duplicados = importacao.deduplicar(alertas, alertas_ativos.existe)
+    try:
+        if ESTADO_DB and novos:
+            for alerta, alerta_id in zip(novos, diario_alertas.novos_ids(len(novos))):
+                alerta.id = alerta_id
+        alertas_ativos.adicionar_varios(novos)
+        # Uma entrada no diário para o lote inteiro, em vez de uma por alerta
+        diario_alertas.registrar_adicoes(novos)
+    except Exception as e:
+        logging.error(f"Erro ao importar alertas: {e}")
+        for alerta in novos:
+            if alerta.id is not None:
+                alertas_ativos.remover(alerta.id)
+        return erro_api(500, 'erro ao gravar os alertas; nada foi importado')
+    metrica_importados.inc(len(novos))
+    if novos:
+        logging.info(f"{len(novos)} alertas importados pela API ({duplicados} duplicados, {len(erros)} inválidos)")
+        antecipar_verificacao(job_queue)
+    return web.json_response({'importados': len(novos), 'duplicados': duplicados, **invalidos,
+                              'ids': [a.id for a in novos]})
+
+async def api_remover(request):
+    """DELETE /api/alertas: remove os ids do corpo (JSON ou CSV) ou todos de ?chat_id=."""
+    import importacao
+    recusa = recusar_api(request)
+    if recusa is not None:
+        return recusa
+    try:
+        chat_id = chat_da_consulta(request)
+        ids = None if chat_id is not None else importacao.ler_ids(await request.read(), request.content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        return erro_api(400, f'requisição inválida: {e}')
+    if chat_id is not None:
+        removidos = alertas_ativos.limpar_chat(chat_id)
+        descartar_em_envio(chat_id)
+        if removidos:
+            salvar_alteracao(diario_alertas.registrar_limpeza_chat, chat_id)
+        return web.json_response({'removidos': removidos})
+    encontrados = [alerta_id for alerta_id in ids
+                   if alertas_ativos.remover(alerta_id) is not None or alertas_em_envio.pop(alerta_id, None)]
+    # Uma entrada no diário para todos os ids
+    salvar_alteracao(diario_alertas.registrar_remocao, encontrados)
+    return web.json_response({'removidos': len(encontrados), 'nao_encontrados': len(ids) - len(encontrados)})
 
 # --- FUNÇÕES AUXILIARES ---
 
 def carregar_alertas():
-    """Carrega os alertas salvos do arquivo JSON."""
-    global alertas_ativos
+    """Carrega os alertas do snapshot e reaplica o diário de alterações."""
     try:
-        if os.path.exists(ALERTAS_FILE):
-            with open(ALERTAS_FILE, 'r') as f:
-                alertas_ativos = json.load(f)
-        else:
-            alertas_ativos = []
+        alertas, proximo_id = diario_alertas.carregar()
+        # Indexação sem o GC: os milhões de tuplas e dicts do índice disparariam coletas completas
+        gc.disable()
+        try:
+            # Alertas sem par são do formato antigo, que só conhecia o USD-BRL
+            alertas_ativos.carregar(alertas, chat_padrao=CHAT_PADRAO, proximo_id=proximo_id, par_padrao='USD-BRL')
+        finally:
+            gc.enable()
+        if diario_alertas.migracao_pendente:
+            # Snapshot JSON (formatos antigos): regrava no binário, com os ids e chat_ids atribuídos
+            diario_alertas.compactar_agora(list(alertas_ativos), alertas_ativos.proximo_id)
+        # Disparados aguardando entrega continuam fora do índice (recarga das réplicas)
+        for alerta_id in alertas_em_envio:
+            alertas_ativos.remover(alerta_id)
+        aquecer_alertas_moveis()
+        # O índice vive até o fim do processo: congelado, as coletas completas do GC
+        # deixam de percorrer todos os alertas a cada vez (pausas no event loop)
+        gc.freeze()
         logging.info(f"Alertas carregados: {len(alertas_ativos)} alertas ativos")
     except Exception as e:
+        # Não zera os alertas em silêncio: sem eles o bot não deve seguir gravando por cima
         logging.error(f"Erro ao carregar alertas: {e}")
-        alertas_ativos = []
+        raise
 
-def salvar_alertas():
-    """Salva os alertas no arquivo JSON."""
+def carregar_estado():
+    """Alertas e histórico do disco (uma vez: os reinícios de componentes não recarregam nada).
+
+    Roda em uma thread enquanto a Application se inicializa; só o servidor
+    web já está no ar, e a API de alertas espera `estado_carregado`.
+    """
+    global estado_carregado
+    with perfil_partida.fase('alertas'):
+        carregar_alertas()
+    with perfil_partida.fase('historico'):
+        for par in PARES:
+            logging.info(f"Histórico de {par}: {len(serie_do_par(par))} cotações")
+            indicadores_do_par(par)
+    estado_carregado = True
+
+def aquecer_alertas_moveis():
+    """Refaz picos, fundos e janelas dos alertas móveis repassando o histórico em disco."""
+    fim = agora_ms() + 1
+    for par in PARES:
+        inicio = alertas_ativos.inicio_moveis(par)
+        if inicio is not None:
+            alertas_ativos.reconstruir_moveis(par, serie_do_par(par).intervalo(inicio, fim))
+
+def salvar_alteracao(registrar, *args):
+    """Grava uma alteração no diário: O(1), sem reescrever todos os alertas."""
     try:
-        with open(ALERTAS_FILE, 'w') as f:
-            json.dump(alertas_ativos, f, indent=2)
-        logging.info(f"Alertas salvos: {len(alertas_ativos)} alertas ativos")
+        registrar(*args)
     except Exception as e:
         logging.error(f"Erro ao salvar alertas: {e}")
 
-def obter_tendencia(cotacao_atual):
-    """Analisa a tendência baseada no histórico de cotações."""
-    if len(historico_cotacoes) < 2:
-        return "🔄", "Coletando dados"
-    
-    cotacao_anterior = historico_cotacoes[-2]['valor']
-    diferenca = cotacao_atual - cotacao_anterior
-    percentual = (diferenca / cotacao_anterior) * 100
+async def compactar_alertas(context: ContextTypes.DEFAULT_TYPE):
+    """Job periódico: compacta o diário em um novo snapshot, fora do event loop."""
+    if not diario_alertas.precisa_compactar(len(alertas_ativos)):
+        return
+    try:
+        # Só a lista é copiada no loop (os campos gravados não mudam depois de indexados);
+        # a gravação do snapshot roda em uma thread. Alertas em envio ainda não foram
+        # confirmados: continuam no snapshot. Picos e fundos dos alertas móveis vão
+        # junto, para sobreviver a um reinício
+        alertas_ativos.sincronizar_moveis()
+        alertas = list(alertas_ativos) + list(alertas_em_envio.values())
+        await diario_alertas.compactar(alertas, alertas_ativos.proximo_id)
+    except Exception as e:
+        logging.error(f"Erro ao compactar alertas: {e}")
+
+def sou_lider():
+    """Indica se esta réplica deve buscar as cotações periodicamente e notificar."""
+    return not ESTADO_DB or diario_alertas.e_lider
+
+def descartar_em_envio(chat_id=None):
+    """Esquece os alertas aguardando entrega (de uma conversa ou todos): não voltam ao índice."""
+    for alerta_id in [i for i, a in alertas_em_envio.items() if chat_id is None or a.chat_id == chat_id]:
+        del alertas_em_envio[alerta_id]
+
+def aplicar_evento(entrada):
+    """Aplica no índice local uma alteração feita por outra réplica."""
+    op = entrada['op']
+    if op == 'adicionar':
+        alerta = Alerta.de_dict(entrada['alerta'])
+        if alertas_ativos.obter(alerta.id) is None and alerta.id not in alertas_em_envio:
+            alertas_ativos.adicionar(alerta)
+    elif op == 'adicionar_lote':
+        alertas_ativos.adicionar_varios([a for a in map(Alerta.de_dict, entrada['alertas'])
+                                         if alertas_ativos.obter(a.id) is None and a.id not in alertas_em_envio])
+    elif op == 'remover':
+        for alerta_id in entrada['ids']:
+            alertas_ativos.remover(alerta_id)
+            alertas_em_envio.pop(alerta_id, None)
+    elif op == 'limpar_chat':
+        alertas_ativos.limpar_chat(entrada['chat_id'])
+        descartar_em_envio(entrada['chat_id'])
+    elif op == 'limpar':
+        alertas_ativos.limpar()
+        descartar_em_envio()
+
+async def sincronizar_replica(context: ContextTypes.DEFAULT_TYPE):
+    """Job das réplicas (ESTADO_DB): renova a liderança e aplica as alterações das outras."""
+    global lider
+    era_lider = lider
+    lider = diario_alertas.renovar_lideranca(LIDERANCA_DURACAO)
+    try:
+        eventos = diario_alertas.novos_eventos()
+        if eventos is None:
+            logging.warning("Réplica atrasada em relação aos eventos compactados: recarregando os alertas")
+            carregar_alertas()
+        else:
+            for entrada in eventos:
+                aplicar_evento(entrada)
+            if lider and any(e['op'] in ('adicionar', 'adicionar_lote') for e in eventos):
+                antecipar_verificacao(context.job_queue)
+    except Exception as e:
+        logging.error(f"Erro ao sincronizar alertas entre réplicas: {e}")
     
-    if diferenca > 0:
-        return "📈", f"Subindo (+{diferenca:.4f} | +{percentual:.2f}%)"
-    elif diferenca < 0:
-        return "📉", f"Descendo ({diferenca:.4f} | {percentual:.2f}%)"
-    else:
-        return "➡️", "Estável (0.00%)"
+    if lider and not era_lider:
+        # A líder anterior gravou o histórico: relê as séries e recomeça os indicadores por elas
+        for serie in historico_cotacoes.values():
+            serie.recarregar()
+        indicadores_por_par.clear()
+        aquecer_alertas_moveis()
+        logging.info(f"Esta réplica assumiu a verificação das cotações (mandato {diario_alertas.mandato})")
+        context.job_queue.run_once(ciclo_verificacao, when=0, name='verificacao')
+    elif not lider:
+        if era_lider:
+            logging.warning("Esta réplica perdeu a liderança: verificação suspensa")
+            for job in context.job_queue.get_jobs_by_name('verificacao'):
+                job.schedule_removal()
+        # Amostras gravadas pela líder ficam visíveis no /historico desta réplica
+        for serie in historico_cotacoes.values():
+            serie.recarregar()
+
+def serie_do_par(par):
+    """Série temporal do par, aberta (ou criada) na primeira vez que é usada."""
+    serie = historico_cotacoes.get(par)
+    if serie is None:
+        caminho = os.path.join(HISTORICO_DIR, f"{par}.serie")
+        serie = historico_cotacoes[par] = SerieTemporal(caminho, HISTORICO_CAPACIDADE)
+    return serie
 
-def verificar_alertas(cotacao_atual):
-    """Verifica se algum alerta foi atingido."""
+def indicadores_do_par(par):
+    """Indicadores do par, iniciados com o histórico em disco na primeira vez."""
+    indicadores = indicadores_por_par.get(par)
+    if indicadores is None:
+        indicadores = indicadores_por_par[par] = Indicadores(INDICADORES_JANELA)
+        # Cálculo em lote (vetorizado com NumPy, se instalado) sobre o histórico recente
+        indicadores.aquecer(serie_do_par(par).valores(AQUECIMENTO_INDICADORES))
+    return indicadores
+
+def obter_tendencia(par, cotacao_atual):
+    """Tendência pela MME contra a MMS, com a variação desde a amostra anterior."""
+    return regras.descrever_tendencia(indicadores_do_par(par), cotacao_atual)
+
+def resumo_indicadores(par):
+    """Linha com médias, bandas de Bollinger e faixa da janela (vazia sem dados)."""
+    return regras.resumo_indicadores(indicadores_do_par(par))
+
+def mudanca_relevante(par, cotacao_atual):
+    """Indica se a cotação mudou o suficiente desde a amostra anterior para notificar."""
+    return regras.mudanca_relevante(indicadores_do_par(par), cotacao_atual, MUDANCA_PERCENTUAL, MUDANCA_SIGMAS)
+
+def verificar_alertas(cotacoes):
+    """Verifica se algum alerta foi atingido ({par: cotação})."""
+    # Busca binária nos limites ordenados de cada par; os alertas atingidos saem do índice
+    inicio = time.perf_counter()
     alertas_disparados = []
-    for alerta in alertas_ativos[:]:  # Cria uma cópia da lista
-        valor_alerta = alerta['valor']
-        tipo = alerta['tipo']
-        
-        if (tipo == 'acima' and cotacao_atual >= valor_alerta) or \
-           (tipo == 'abaixo' and cotacao_atual <= valor_alerta):
-            alertas_disparados.append(alerta)
-            alertas_ativos.remove(alerta)  # Remove o alerta após disparar
+    for par, cotacao_atual in cotacoes.items():
+        alertas_disparados.extend(alertas_ativos.disparar(par, cotacao_atual))
+    metrica_verificacao.observar(time.perf_counter() - inicio)
     
     if alertas_disparados:
-        salvar_alertas()  # Salva após remover alertas disparados
+        metrica_disparados.inc(len(alertas_disparados))
+        # Saem do índice já (não disparam de novo no próximo tick), mas só são
+        # gravados como disparados quando a notificação for entregue
+        for alerta in alertas_disparados:
+            alertas_em_envio[alerta.id] = alerta
     
     return alertas_disparados
 
 # --- FUNÇÕES DO BOT ---
 
-def buscar_cotacao_atual():
-    """Busca a cotação mais recente na API e a retorna como um float."""
+async def _buscar_e_registrar():
+    """Busca todos os pares em uma requisição e registra as amostras no histórico."""
+    agendador.registrar_requisicao()
+    inicio = time.perf_counter()
     try:
-        response = requests.get(API_URL)
-        response.raise_for_status()
-        dados = response.json()
-        cotacao_str = dados['USDBRL']['bid']
-        cotacao = float(cotacao_str)
-        
-        # Adiciona ao histórico
-        historico_cotacoes.append({
-            'valor': cotacao,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # Mantém apenas as últimas 10 cotações no histórico
-        if len(historico_cotacoes) > 10:
-            historico_cotacoes.pop(0)
-        
-        return cotacao
+        resposta = await provedores_cotacao.buscar()
+    except Exception:
+        metrica_erros_busca.inc()
+        raise
+    finally:
+        metrica_busca.observar(time.perf_counter() - inicio)
+    cotacoes = resposta.cotacoes
+    registro.contador('cotacao_fonte_total', 'Buscas respondidas por cada fonte de cotação',
+                      rotulos={'fonte': resposta.fonte}).inc()
+    if resposta.consultadas > 1:
+        logging.info(f"Cotação obtida de {resposta.fonte} após consultar {resposta.consultadas} fontes "
+                     f"({resposta.duracao * 1000:.0f} ms)")
+    timestamp = agora_ms()
+    metrica_ultima_busca.definir(timestamp / 1000)
+    
+    # Adiciona ao histórico (apenas buscas reais, nunca acertos do cache);
+    # o buffer circular descarta a amostra mais antiga em O(1) quando enche.
+    # Com réplicas, só a líder grava: as séries são arquivos compartilhados
+    gravar = sou_lider()
+    for par, cotacao in cotacoes.items():
+        agendador.registrar_cotacao(par, cotacao)
+        # Indicadores antes da série: na primeira vez eles se iniciam pelo histórico anterior
+        indicadores_do_par(par).atualizar(cotacao)
+        if gravar:
+            serie_do_par(par).adicionar(cotacao, timestamp)
+            # Picos e janelas dos alertas móveis veem as mesmas amostras do histórico
+            alertas_ativos.observar(par, cotacao, timestamp)
+    
+    return cotacoes
+
+# Cache compartilhado: rajadas de /cotacao aguardam uma única busca na API
+cache_cotacao = CacheCotacao(_buscar_e_registrar, ttl=CACHE_TTL, permitir=orcamento_api_comandos.permitir)
+for _resultado, _campo in (('acerto', 'acertos'), ('falta', 'faltas'), ('coalescida', 'coalescidas'),
+                           ('contida', 'contidas')):
+    registro.funcao('cache_cotacao_consultas_total', 'Consultas ao cache de cotações por resultado',
+                    lambda campo=_campo: cache_cotacao.estatisticas()[campo], rotulos={'resultado': _resultado})
+
+async def buscar_cotacoes_atuais(forcar=False):
+    """Busca as cotações mais recentes (via cache com TTL) como {par: float}."""
+    try:
+        return await cache_cotacao.obter(forcar=forcar)
     except Exception as e:
         logging.error(f"Erro ao buscar cotação: {e}")
         return None
 
+def resolver_par(texto):
+    """Converte o argumento do usuário ('EUR', 'eur-brl') em um par configurado, ou None."""
+    par = normalizar_par(texto)
+    return par if par in PARES else None
+
 async def comando_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Responde ao comando /start."""
-    mensagem = """🤖 *Bot de Cotação USD-BRL*
+    moedas = ', '.join(par.split('-')[0] for par in PARES)
+    mensagem = f"""🤖 *Bot de Cotação {', '.join(PARES)}*
 
 Comandos disponíveis:
 
-💰 `/cotacao` - Ver cotação atual com tendência
-🔔 `/alerta <valor> <tipo>` - Criar alerta (ex: /alerta 5.20 acima)
-📋 `/listar` - Ver todos os alertas ativos
-🗑️ `/remover <número>` - Remover alerta por número
-❌ `/limpar` - Remover todos os alertas
+💰 `/cotacao [moeda]` - Ver cotação atual com tendência
+📊 `/historico [moeda] <periodo>` - Abertura, máxima, mínima e fechamento (ex: /historico 24h)
+📈 `/grafico [moeda] <periodo>` - Gráfico da cotação com médias e tendência (ex: /grafico 7d)
+🔔 `/alerta [moeda] <valor> <tipo> [janela]` - Criar alerta (ex: /alerta 5.20 acima)
+📋 `/listar` - Ver seus alertas ativos (com o id de cada um)
+🗑️ `/remover <id>` - Remover alerta pelo id (ex: /remover 12)
+❌ `/limpar` - Remover todos os seus alertas
+
+*Moedas:* {moedas} (padrão: {PARES[0].split('-')[0]})
 
 *Tipos de alerta:*
 • `acima` - Alerta quando cotação subir acima do valor
 • `abaixo` - Alerta quando cotação descer abaixo do valor
+• `recuo` - Alerta quando cotação cair a % desde o pico após a criação (ex: /alerta 1% recuo)
+• `variacao` - Alerta quando cotação subir ou cair a % dentro da janela (ex: /alerta 0.5% variacao 1h)
 
-O bot também envia notificações automáticas a cada 30 minutos quando há mudanças! 📈📉"""
+O bot também envia notificações automáticas quando há mudanças nos pares dos seus alertas, verificando com mais frequência quando a cotação se aproxima dos seus alertas! 📈📉"""
     
     await update.message.reply_text(mensagem, parse_mode='Markdown')
 
 async def comando_cotacao(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Busca e envia a cotação atual quando o comando /cotacao é enviado."""
     logging.info("Comando /cotacao recebido.")
-    cotacao = buscar_cotacao_atual()
-    if cotacao:
-        emoji_tendencia, texto_tendencia = obter_tendencia(cotacao)
+    if context.args:
+        par = resolver_par(context.args[0])
+        if par is None:
+            await update.message.reply_text(f"❌ Moeda não monitorada. Use uma de: {', '.join(PARES)}")
+            return
+        pares = [par]
+    else:
+        pares = PARES
+    
+    cotacoes = await buscar_cotacoes_atuais()
+    if cotacoes and any(par in cotacoes for par in pares):
         timestamp = datetime.now().strftime("%H:%M:%S")
         
-        mensagem = f"""💵 *Cotação USD-BRL Atual*
+        mensagem = ""
+        for par in pares:
+            if par not in cotacoes:
+                continue
+            emoji_tendencia, texto_tendencia = obter_tendencia(par, cotacoes[par])
+            mensagem += f"""💵 *Cotação {par} Atual*
 
-{emoji_tendencia} *R$ {cotacao:.4f}*
+{emoji_tendencia} *{formatar_valor(par, cotacoes[par])}*
 📊 {texto_tendencia}
-🕒 Atualizado às {timestamp}"""
+{resumo_indicadores(par)}
+"""
+        mensagem += f"🕒 Atualizado às {timestamp}"
+        ultima_resposta_cotacao[tuple(pares)] = mensagem
         
         await update.message.reply_text(mensagem, parse_mode='Markdown')
     else:
         await update.message.reply_text('Desculpe, não consegui buscar a cotação no momento.')
 
+UNIDADES_PERIODO = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000}
+MAX_VELAS = 40  # Velas por mensagem (mantém a resposta bem abaixo de 4096 caracteres)
+
+def interpretar_periodo(texto):
+    """Converte '30m', '24h' ou '7d' em milissegundos (None se inválido)."""
+    correspondencia = re.fullmatch(r'(\d+)([mhd])', texto.strip().lower())
+    if not correspondencia or int(correspondencia.group(1)) == 0:
+        return None
+    return int(correspondencia.group(1)) * UNIDADES_PERIODO[correspondencia.group(2)]
+
+def escolher_bucket(periodo_ms):
+    """Tamanho de vela para o período: 1m até 1 hora, 1h até 2 dias, senão 1d."""
+    if periodo_ms <= BUCKETS_MS['1h']:
+        return '1m'
+    if periodo_ms <= 2 * BUCKETS_MS['1d']:
+        return '1h'
+    return '1d'
+
+async def comando_historico(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra velas OHLC do período pedido, calculadas a partir da série em disco."""
+    if len(context.args) not in (1, 2):
+        await update.message.reply_text(
+            "❌ Uso correto: `/historico [moeda] <periodo>`\n"
+            "Exemplo: `/historico 24h` ou `/historico EUR 7d`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    if len(context.args) == 2:
+        par = resolver_par(context.args[0])
+        if par is None:
+            await update.message.reply_text(f"❌ Moeda não monitorada. Use uma de: {', '.join(PARES)}")
+            return
+    else:
+        par = PARES[0]
+    
+    periodo_ms = interpretar_periodo(context.args[-1])
+    if periodo_ms is None:
+        await update.message.reply_text("❌ Período inválido. Use minutos, horas ou dias: 30m, 24h, 7d")
+        return
+    
+    bucket = escolher_bucket(periodo_ms)
+    fim = agora_ms()
+    # Busca binária nos timestamps + max/min por fatia: não percorre a série inteira
+    velas = serie_do_par(par).velas(fim - periodo_ms, fim + 1, BUCKETS_MS[bucket])
+    if not velas:
+        await update.message.reply_text(f"📋 Sem cotações de {par} nesse período.")
+        return
+    
+    formato = {'1m': "%H:%M", '1h': "%d/%m %H:%M", '1d': "%d/%m/%Y"}[bucket]
+    mensagem = f"📊 *Histórico {par} - {context.args[-1]}* (velas de {bucket})\n_A = abertura, F = fechamento_\n\n"
+    if len(velas) > MAX_VELAS:
+        mensagem += f"_Mostrando as últimas {MAX_VELAS} de {len(velas)} velas_\n"
+        velas = velas[-MAX_VELAS:]
+    for vela in velas:
+        horario = datetime.fromtimestamp(vela.inicio_ms / 1000).strftime(formato)
+        mensagem += (f"`{horario}` A {vela.abertura:.4f} · Máx {vela.maxima:.4f} · "
+                     f"Mín {vela.minima:.4f} · F {vela.fechamento:.4f}\n")
+    
+    variacao = (velas[-1].fechamento / velas[0].abertura - 1) * 100
+    mensagem += f"\nVariação: {variacao:+.2f}% | Máx {max(v.maxima for v in velas):.4f} | Mín {min(v.minima for v in velas):.4f}"
+    await update.message.reply_text(mensagem, parse_mode='Markdown')
+
+def iniciar_graficos():
+    """Cria os processos de renderização do /grafico (se o matplotlib estiver instalado).
+
+    Com o método fork, todos os processos nascem no primeiro submit: feito
+    aqui, antes de o bot abrir threads, e já importando o matplotlib neles.
+    """
+    global executor_graficos, cache_graficos
+    import graficos  # Só o /grafico usa: fora dos imports do módulo (benchmarks e backtest não pagam)
+    if executor_graficos is not None or not graficos.disponivel():
+        return
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    cache_graficos = graficos.CacheGraficos()
+    executor_graficos = ProcessPoolExecutor(GRAFICO_PROCESSOS, mp_context=multiprocessing.get_context('fork'))
+    executor_graficos.submit(graficos.aquecer)
+
+async def renderizar_grafico(par, titulo, velas):
+    """PNG do gráfico, renderizado em um processo do pool sem bloquear o event loop."""
+    import graficos
+    inicio = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor_graficos, graficos.renderizar_png, titulo,
+            [v.inicio_ms for v in velas], [v.fechamento for v in velas], INDICADORES_JANELA)
+    finally:
+        metrica_grafico.observar(time.perf_counter() - inicio)
+
+async def comando_grafico(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Envia o gráfico PNG do período pedido, do cache de file_ids quando possível."""
+    import graficos
+    if len(context.args) not in (1, 2):
+        await update.message.reply_text(
+            "❌ Uso correto: `/grafico [moeda] <periodo>`\n"
+            "Exemplo: `/grafico 24h` ou `/grafico EUR 7d`",
+            parse_mode='Markdown'
+        )
+        return
+    if executor_graficos is None:
+        await update.message.reply_text("❌ Gráficos indisponíveis neste servidor (matplotlib não instalado).")
+        return
+    
+    if len(context.args) == 2:
+        par = resolver_par(context.args[0])
+        if par is None:
+            await update.message.reply_text(f"❌ Moeda não monitorada. Use uma de: {', '.join(PARES)}")
+            return
+    else:
+        par = PARES[0]
+    
+    periodo_ms = interpretar_periodo(context.args[-1])
+    if periodo_ms is None:
+        await update.message.reply_text("❌ Período inválido. Use minutos, horas ou dias: 30m, 24h, 7d")
+        return
+    
+    serie = serie_do_par(par)
+    fim = agora_ms()
+    # Até MAX_PONTOS velas do período; o fechamento de cada uma vira um ponto do gráfico
+    velas = serie.velas(fim - periodo_ms, fim + 1, max(1, periodo_ms // graficos.MAX_PONTOS))
+    if len(velas) < 2:
+        await update.message.reply_text(f"📋 Cotações insuficientes de {par} nesse período.")
+        return
+    
+    variacao = (velas[-1].fechamento / velas[0].abertura - 1) * 100
+    legenda = (f"📈 *{par} - {context.args[-1]}*\nVariação: {variacao:+.2f}% | "
+               f"Máx {max(v.maxima for v in velas):.4f} | Mín {min(v.minima for v in velas):.4f}")
+    
+    async def gerar():
+        png = await renderizar_grafico(par, f"{par} - {context.args[-1]}", velas)
+        mensagem = await update.message.reply_photo(photo=png, caption=legenda, parse_mode='Markdown')
+        return mensagem.photo[-1].file_id
+    
+    try:
+        # Mesmo par, período e última amostra: a imagem já enviada serve
+        file_id, enviado = await cache_graficos.obter((par, periodo_ms, serie[-1].timestamp_ms), gerar)
+        if not enviado:
+            await update.message.reply_photo(photo=file_id, caption=legenda, parse_mode='Markdown')
+    except Exception as e:
+        logging.error(f"Erro no comando grafico: {e}")
+        await update.message.reply_text("❌ Erro ao gerar o gráfico. Tente novamente.")
+
+USO_ALERTA = ("❌ Uso correto: `/alerta [moeda] <valor> <tipo> [janela]`\n"
+              "Exemplo: `/alerta 5.20 acima`, `/alerta EUR 6.10 abaixo`, "
+              "`/alerta 1% recuo` ou `/alerta 0.5% variacao 1h`")
+
 async def comando_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Cria um novo alerta de preço."""
+    """Cria um novo alerta de preço (limite fixo, recuo desde o pico ou variação na janela)."""
     try:
-        if len(context.args) != 2:
-            await update.message.reply_text(
-                "❌ Uso correto: `/alerta <valor> <tipo>`\n"
-                "Exemplo: `/alerta 5.20 acima` ou `/alerta 5.10 abaixo`",
-                parse_mode='Markdown'
-            )
+        args = context.args
+        # O tipo fica depois de [moeda] <valor>; a janela só existe na variação
+        posicao = next((i for i, arg in enumerate(args) if arg.lower() in TIPOS_ALERTA + TIPOS_MOVEIS), None)
+        tipo = TipoAlerta(args[posicao].lower()) if posicao is not None else None
+        if posicao not in (1, 2) or len(args) != posicao + 1 + (tipo == 'variacao'):
+            await update.message.reply_text(USO_ALERTA, parse_mode='Markdown')
             return
         
-        valor_str, tipo = context.args
-        valor = float(valor_str.replace(',', '.'))
+        if posicao == 2:
+            par = resolver_par(args[0])
+            if par is None:
+                await update.message.reply_text(f"❌ Moeda não monitorada. Use uma de: {', '.join(PARES)}")
+                return
+        else:
+            par = PARES[0]
         
-        if tipo not in ['acima', 'abaixo']:
-            await update.message.reply_text("❌ Tipo deve ser 'acima' ou 'abaixo'")
+        valor = float(args[posicao - 1].rstrip('%').replace(',', '.'))
+        janela_ms = None
+        if tipo in TIPOS_MOVEIS:
+            if not valor_valido(tipo, valor):
+                await update.message.reply_text("❌ Percentual deve estar entre 0 e 100 (ex: 1% ou 0,5%)")
+                return
+            if tipo == 'variacao':
+                janela_ms = interpretar_periodo(args[-1])
+                if janela_ms is None:
+                    await update.message.reply_text("❌ Janela inválida. Use m, h ou d (ex: 30m, 1h, 1d)")
+                    return
+        elif not valor_valido(tipo, valor):
+            # nan, inf e negativos passam pelo float(), mas não são limites
+            await update.message.reply_text("❌ Valor inválido. Use um número maior que zero, como 5.20 ou 5,15")
             return
         
-        # Verifica se já existe um alerta igual
-        for alerta in alertas_ativos:
-            if alerta['valor'] == valor and alerta['tipo'] == tipo:
-                await update.message.reply_text(f"⚠️ Já existe um alerta para R$ {valor:.4f} {tipo}")
-                return
+        chat_id = update.effective_chat.id
+        
+        # Verifica se já existe um alerta igual nesta conversa
+        if alertas_ativos.existe(chat_id, par, valor, tipo, janela_ms):
+            _, descricao = regras.descrever_alerta(Alerta(None, chat_id, par, valor, tipo, janela_ms=janela_ms))
+            await update.message.reply_text(f"⚠️ Já existe um alerta para {descricao}")
+            return
         
-        # Adiciona o novo alerta
-        novo_alerta = {
-            'valor': valor,
-            'tipo': tipo,
-            'criado_em': datetime.now().isoformat()
-        }
-        alertas_ativos.append(novo_alerta)
-        salvar_alertas()
+        # Adiciona o novo alerta (com réplicas, o id vem do banco compartilhado)
+        novo_alerta = Alerta(None, chat_id, par, valor, tipo, agora_ms())
+        if tipo in TIPOS_MOVEIS:
+            # Recuo e variação partem da cotação no momento da criação
+            cotacoes = await buscar_cotacoes_atuais()
+            if not cotacoes or par not in cotacoes:
+                await update.message.reply_text("❌ Não consegui buscar a cotação atual para criar o alerta. Tente novamente.")
+                return
+            novo_alerta.referencia = cotacoes[par]
+            novo_alerta.janela_ms = janela_ms
+        if ESTADO_DB:
+            novo_alerta.id = diario_alertas.novo_id()
+        alertas_ativos.adicionar(novo_alerta)
+        salvar_alteracao(diario_alertas.registrar_adicao, novo_alerta)
+        antecipar_verificacao(context.job_queue)
         
-        emoji = "📈" if tipo == "acima" else "📉"
+        if tipo == 'recuo':
+            condicao = (f"cair *{valor:g}%* desde o pico (a partir de "
+                        f"{formatar_valor(par, novo_alerta.referencia)})")
+        elif tipo == 'variacao':
+            condicao = f"subir ou cair *{valor:g}%* em até *{regras.formatar_janela(janela_ms)}*"
+        else:
+            condicao = f"ficar *{tipo} de {formatar_valor(par, valor)}*"
+        emoji, _ = regras.descrever_alerta(novo_alerta)
         await update.message.reply_text(
-            f"✅ Alerta criado!\n{emoji} Você será notificado quando a cotação ficar *{tipo} de R$ {valor:.4f}*",
+            f"✅ Alerta #{novo_alerta.id} criado!\n{emoji} Você será notificado quando a cotação {par} {condicao}",
             parse_mode='Markdown'
         )
         
@@ -234,179 +882,448 @@ async def comando_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logging.error(f"Erro no comando alerta: {e}")
         await update.message.reply_text("❌ Erro ao criar alerta. Tente novamente.")
 
+def teclado_paginas(numero, total):
+    """Botões de página anterior/seguinte do /listar (None com uma página só)."""
+    if total <= 1:
+        return None
+    botoes = []
+    if numero > 1:
+        botoes.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"listar:{numero - 1}"))
+    if numero < total:
+        botoes.append(InlineKeyboardButton("Próxima ▶️", callback_data=f"listar:{numero + 1}"))
+    return InlineKeyboardMarkup([botoes])
+
 async def comando_listar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Lista todos os alertas ativos."""
-    if not alertas_ativos:
+    """Lista os alertas ativos da conversa, uma página por vez."""
+    texto, numero, total = paginas_listar.pagina(update.effective_chat.id, 1)
+    if texto is None:
         await update.message.reply_text("📋 Nenhum alerta ativo no momento.")
         return
-    
-    mensagem = "📋 *Seus Alertas Ativos:*\n\n"
-    for i, alerta in enumerate(alertas_ativos, 1):
-        emoji = "📈" if alerta['tipo'] == "acima" else "📉"
-        data_criacao = datetime.fromisoformat(alerta['criado_em']).strftime("%d/%m %H:%M")
-        mensagem += f"{i}. {emoji} R$ {alerta['valor']:.4f} ({alerta['tipo']}) - {data_criacao}\n"
-    
-    mensagem += f"\nTotal: {len(alertas_ativos)} alertas"
-    await update.message.reply_text(mensagem, parse_mode='Markdown')
+    await update.message.reply_text(texto, parse_mode='Markdown', reply_markup=teclado_paginas(numero, total))
+
+async def pagina_listar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Troca a página de uma mensagem do /listar (botões anterior/seguinte)."""
+    consulta = update.callback_query
+    try:
+        numero = int(consulta.data.split(':', 1)[1])
+    except (IndexError, ValueError):
+        await consulta.answer()
+        return
+    texto, numero, total = paginas_listar.pagina(consulta.message.chat.id, numero)
+    await consulta.answer()
+    try:
+        if texto is None:
+            await consulta.edit_message_text("📋 Nenhum alerta ativo no momento.")
+        else:
+            await consulta.edit_message_text(texto, parse_mode='Markdown',
+                                             reply_markup=teclado_paginas(numero, total))
+    except BadRequest as e:
+        # "Message is not modified": a página pedida é igual à que já está na tela
+        if 'not modified' not in str(e).lower():
+            logging.error(f"Erro ao trocar página do /listar: {e}")
 
 async def comando_remover(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Remove um alerta específico pelo número."""
+    """Remove um alerta específico pelo id mostrado no /listar."""
     try:
         if len(context.args) != 1:
-            await update.message.reply_text("❌ Uso: `/remover <número>`\nUse `/listar` para ver os números", parse_mode='Markdown')
+            await update.message.reply_text("❌ Uso: `/remover <id>`\nUse `/listar` para ver os ids", parse_mode='Markdown')
             return
         
-        numero = int(context.args[0])
+        alerta_id = int(context.args[0].lstrip('#'))
         
-        if numero < 1 or numero > len(alertas_ativos):
-            await update.message.reply_text(f"❌ Número inválido. Use um número entre 1 e {len(alertas_ativos)}")
+        chat_id = update.effective_chat.id
+        alerta = alertas_ativos.obter(alerta_id)
+        if alerta is None or alerta.chat_id != chat_id:
+            await update.message.reply_text(f"❌ Alerta #{alerta_id} não encontrado. Use /listar para ver os ids")
             return
         
-        alerta_removido = alertas_ativos.pop(numero - 1)
-        salvar_alertas()
+        alerta_removido = alertas_ativos.remover(alerta_id)
+        salvar_alteracao(diario_alertas.registrar_remocao, [alerta_removido.id])
         
-        emoji = "📈" if alerta_removido['tipo'] == "acima" else "📉"
-        await update.message.reply_text(
-            f"🗑️ Alerta removido!\n{emoji} R$ {alerta_removido['valor']:.4f} ({alerta_removido['tipo']})"
-        )
+        emoji, descricao = regras.descrever_alerta(alerta_removido)
+        await update.message.reply_text(f"🗑️ Alerta #{alerta_id} removido!\n{emoji} {descricao}")
         
     except ValueError:
-        await update.message.reply_text("❌ Digite um número válido")
+        await update.message.reply_text("❌ Digite um id válido (ex: /remover 12)")
     except Exception as e:
         logging.error(f"Erro no comando remover: {e}")
         await update.message.reply_text("❌ Erro ao remover alerta")
 
 async def comando_limpar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Remove todos os alertas."""
-    if not alertas_ativos:
+    """Remove todos os alertas da conversa."""
+    chat_id = update.effective_chat.id
+    quantidade = alertas_ativos.limpar_chat(chat_id)
+    # Alertas da conversa que aguardam entrega também não devem voltar ao índice
+    descartar_em_envio(chat_id)
+    if not quantidade:
         await update.message.reply_text("📋 Nenhum alerta para remover.")
         return
     
-    quantidade = len(alertas_ativos)
-    alertas_ativos.clear()
-    salvar_alertas()
+    salvar_alteracao(diario_alertas.registrar_limpeza_chat, chat_id)
     
     await update.message.reply_text(f"🗑️ Todos os {quantidade} alertas foram removidos!")
 
 async def notificar_mudanca(context: ContextTypes.DEFAULT_TYPE):
     """Função que roda em segundo plano para checar e notificar mudanças."""
-    cotacao_atual = buscar_cotacao_atual()
+    global ultima_verificacao
+    
+    # Uma única requisição traz todos os pares configurados
+    cotacoes = await buscar_cotacoes_atuais(forcar=True)
     
-    if not cotacao_atual:
+    if not cotacoes:
         logging.error("Não foi possível buscar cotação para verificação")
         return
+    if not sou_lider():
+        return  # A liderança venceu durante a busca: outra réplica verifica agora
+    ultima_verificacao = datetime.now()
     
-    # Verifica se houve mudança significativa na cotação
-    mudanca_detectada = False
-    if len(historico_cotacoes) >= 2:
-        cotacao_anterior = historico_cotacoes[-2]['valor']
-        diferenca_percentual = abs((cotacao_atual - cotacao_anterior) / cotacao_anterior) * 100
-        
-        # Só notifica se a mudança for maior que 0.1%
-        if diferenca_percentual >= 0.1:
-            mudanca_detectada = True
+    # Verifica se houve mudança significativa na cotação de cada par
+    # (percentual fixo ou relativo à volatilidade, conforme LIMIAR_MUDANCA)
+    pares_com_mudanca = {par for par, cotacao_atual in cotacoes.items() if mudanca_relevante(par, cotacao_atual)}
     
     # Verifica alertas personalizados
-    alertas_disparados = verificar_alertas(cotacao_atual)
+    alertas_disparados = verificar_alertas(cotacoes)
     
     # Envia notificações se necessário
-    if mudanca_detectada or alertas_disparados:
-        emoji_tendencia, texto_tendencia = obter_tendencia(cotacao_atual)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        mensagem = f"⚠️ *Alerta de Câmbio USD-BRL*\n\n"
-        mensagem += f"{emoji_tendencia} *R$ {cotacao_atual:.4f}*\n"
-        mensagem += f"📊 {texto_tendencia}\n"
-        mensagem += f"🕒 {timestamp}\n"
-        
-        if alertas_disparados:
-            mensagem += f"\n🔔 *Alertas Ativados:*\n"
-            for alerta in alertas_disparados:
-                emoji = "📈" if alerta['tipo'] == "acima" else "📉"
-                mensagem += f"{emoji} R$ {alerta['valor']:.4f} ({alerta['tipo']})\n"
+    if pares_com_mudanca or alertas_disparados:
+        # Mudança relevante: avisa também a conversa padrão e as conversas com alertas nos pares que mudaram
+        conversas = alertas_ativos.chats_dos_pares(pares_com_mudanca) | {CHAT_PADRAO} if pares_com_mudanca else ()
+        # Mensagens de até 4096 caracteres; muitos alertas da mesma conversa viram várias
+        notificacoes = regras.montar_notificacoes(cotacoes, indicadores_do_par, pares_com_mudanca,
+                                                  alertas_disparados, conversas,
+                                                  datetime.now().strftime("%H:%M:%S"), PARES)
+        for notificacao in notificacoes:
+            # A fila respeita os limites do Telegram e repete falhas de rede; não espera a entrega aqui
+            futuro = fila_envio.enviar(notificacao.chat_id, notificacao.texto, parse_mode='Markdown')
+            if notificacao.alertas:
+                futuro.add_done_callback(functools.partial(confirmar_entrega, notificacao))
         
-        await context.bot.send_message(chat_id=CHAT_ID, text=mensagem, parse_mode='Markdown')
-        logging.info(f"Notificação enviada - Cotação: R$ {cotacao_atual:.4f}")
+        conversas_notificadas = len({n.chat_id for n in notificacoes})
+        logging.info(f"{len(notificacoes)} mensagens enfileiradas para {conversas_notificadas} conversas - "
+                     f"Cotações: {cotacoes}")
     else:
-        logging.info(f"Cotação estável: R$ {cotacao_atual:.4f} - Nenhuma notificação enviada")
+        logging.info(f"Cotações estáveis: {cotacoes} - Nenhuma notificação enviada")
 
-def main():
-    """Inicia o bot e configura os handlers."""
-    # Carrega os alertas salvos
-    carregar_alertas()
-    
-    # Inicia o servidor Flask em uma thread separada (para Replit)
-    flask_thread = Thread(target=run_flask)
-    flask_thread.daemon = True
-    flask_thread.start()
-    logging.info("🌐 Servidor web iniciado na porta 8080")
+def recusa_definitiva(erro):
+    """Conversa bloqueou o bot, saiu do grupo ou não existe: reenviar não adianta."""
+    return isinstance(erro, Forbidden) or (isinstance(erro, BadRequest)
+                                           and 'chat not found' in str(erro).lower())
+
+def confirmar_entrega(notificacao, futuro, formatada=True):
+    """Ao fim do envio de uma notificação: grava os alertas como disparados ou os devolve ao índice."""
+    erro = None if futuro.cancelled() else futuro.exception()
+    if formatada and isinstance(erro, BadRequest) and not recusa_definitiva(erro):
+        # Provável erro de Markdown no texto: reenvia uma vez sem formatação
+        # (os alertas continuam em alertas_em_envio até a nova tentativa terminar)
+        logging.warning(f"Notificação para {notificacao.chat_id} recusada ({erro}); reenviando sem formatação")
+        fila_envio.enviar(notificacao.chat_id, notificacao.texto).add_done_callback(
+            functools.partial(confirmar_entrega, notificacao, formatada=False))
+        return
+    # Alertas que saíram de alertas_em_envio foram removidos pelo usuário (/limpar) nesse meio tempo
+    alertas = [a for a in notificacao.alertas if alertas_em_envio.pop(a.id, None) is not None]
+    if not alertas:
+        return
+    if not futuro.cancelled() and (erro is None or recusa_definitiva(erro)):
+        if erro is not None:
+            # Conversa bloqueada ou inexistente: tentar de novo não adianta
+            logging.error(f"Alertas {[a.id for a in alertas]} descartados: notificação recusada ({erro})")
+        # Uma única entrada no diário para os alertas da mensagem
+        salvar_alteracao(diario_alertas.registrar_remocao, [a.id for a in alertas])
+        return
+    # Falha transitória (rede, 429 persistente) ou mensagem recusada mesmo sem formatação:
+    # voltam e disparam de novo na próxima verificação
+    duplicados = []
+    for alerta in alertas:
+        if alertas_ativos.existe(*alerta.chave):
+            duplicados.append(alerta.id)  # A conversa criou o mesmo alerta de novo nesse meio tempo
+        else:
+            alertas_ativos.adicionar(alerta)
+    if duplicados:
+        salvar_alteracao(diario_alertas.registrar_remocao, duplicados)
+    metrica_devolvidos.inc(len(alertas))
+    logging.warning(f"{len(alertas)} alertas devolvidos ao índice: notificação não entregue ({erro or 'cancelada'})")
+
+def calcular_proximo_intervalo():
+    """Intervalo até a próxima verificação, a partir das últimas cotações conhecidas."""
+    distancias = {}
+    for par, historico in historico_cotacoes.items():
+        if historico:
+            distancias[par] = alertas_ativos.distancia_limite(par, historico[-1].valor)
+    return agendador.proximo_intervalo(distancias)
+
+async def ciclo_verificacao(context: ContextTypes.DEFAULT_TYPE):
+    """Job de verificação: checa as cotações e agenda a próxima rodada."""
+    global lider
+    try:
+        if sou_lider():
+            await notificar_mudanca(context)
+    finally:
+        if sou_lider():
+            intervalo = calcular_proximo_intervalo()
+            context.job_queue.run_once(ciclo_verificacao, when=intervalo, name='verificacao')
+            logging.info(f"Próxima verificação em {intervalo:.0f}s")
+        else:
+            # Liderança vencida: sincronizar_replica reinicia o ciclo se esta réplica for eleita de novo
+            lider = False
+
+def antecipar_verificacao(job_queue):
+    """Antecipa a próxima verificação se um alerta novo ficou perto da cotação."""
+    if job_queue is None:
+        return
+    intervalo = calcular_proximo_intervalo()
+    for job in job_queue.get_jobs_by_name('verificacao'):
+        if job.next_t is None:
+            continue
+        restante = (job.next_t - datetime.now(job.next_t.tzinfo)).total_seconds()
+        if restante > intervalo:
+            job.schedule_removal()
+            job_queue.run_once(ciclo_verificacao, when=intervalo, name='verificacao')
+            logging.info(f"Verificação antecipada para daqui a {intervalo:.0f}s")
+        break
+
+def nome_comando(texto):
+    """'/cotacao@bot eur' -> 'cotacao' (None se não for comando)."""
+    if not texto or not texto.startswith('/'):
+        return None
+    return texto.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+
+async def limitar_comandos(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Antes de qualquer handler: barra quem passou do limite, com uma resposta pronta.
+
+    O(1) por update. Quem é barrado recebe um único aviso por rajada (o
+    /cotacao recebe a última cotação já montada) e nenhum trabalho novo é
+    feito: sem API, sem gravação em disco.
+    """
+    consulta = update.callback_query
+    mensagem = update.message
+    comando_recebido = nome_comando(mensagem.text) if mensagem else None
+    if consulta is None and comando_recebido is None:
+        return  # Mensagens comuns não disparam handlers
+    usuario = update.effective_user.id if update.effective_user else None
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    if usuario is not None and not limite_usuarios.permitir(usuario):
+        limitador, chave, motivo = limite_usuarios, usuario, 'usuario'
+    elif chat_id is not None and not limite_conversas.permitir(chat_id):
+        if usuario is not None:
+            # O update é descartado: a ficha do usuário volta (num grupo cheio ele não perde a própria cota)
+            limite_usuarios.devolver(usuario)
+        limitador, chave, motivo = limite_conversas, chat_id, 'conversa'
+    else:
+        return
+    registro.contador('comandos_limitados_total', 'Updates descartados pelos limites de taxa',
+                      rotulos={'motivo': motivo}).inc()
+    try:
+        if consulta is not None:
+            await consulta.answer(f"⏳ Muitos pedidos seguidos. Tente de novo em {limitador.espera(chave):.0f}s.")
+        elif limitador.avisar(chave):
+            pronta = None
+            if comando_recebido == 'cotacao':
+                argumentos = mensagem.text.split()[1:]
+                par = resolver_par(argumentos[0]) if argumentos else None
+                pronta = ultima_resposta_cotacao.get((par,) if par else tuple(PARES))
+            if pronta:
+                await mensagem.reply_text(pronta, parse_mode='Markdown')
+            else:
+                await mensagem.reply_text(f"⏳ Muitos comandos seguidos. Tente de novo em "
+                                          f"{limitador.espera(chave):.0f}s.")
+    except Exception as e:
+        logging.error(f"Erro ao avisar limite de comandos: {e}")
+    raise ApplicationHandlerStop
+
+def comando(nome, handler):
+    """CommandHandler que registra a duração do handler em comando_segundos."""
+    histograma = registro.histograma('comando_segundos', 'Duração dos handlers de comando',
+                                     rotulos={'comando': nome})
+    return CommandHandler(nome, cronometrar(histograma)(handler))
+
+def botao(nome, padrao, handler):
+    """CallbackQueryHandler (botões inline) com a duração registrada em comando_segundos."""
+    histograma = registro.histograma('comando_segundos', 'Duração dos handlers de comando',
+                                     rotulos={'comando': nome})
+    return CallbackQueryHandler(cronometrar(histograma)(handler), pattern=padrao)
+
+def construir_aplicacao():
+    """Cria a Application com handlers, servidor web e ganchos de início/fim."""
+    global servidor_web
+    # Cria a aplicação do bot (updates de conversas diferentes são processados em paralelo)
+    builder = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(CONCORRENCIA_UPDATES)
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    application = builder.build()
     
-    # Cria a aplicação do bot
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Um único servidor assíncrono para as páginas de status e, no modo webhook, os updates
+    servidor_web = ServidorWeb(application, porta=PORT,
+                               caminho_webhook=CAMINHO_WEBHOOK if WEBHOOK_URL else None,
+                               segredo=WEBHOOK_SECRET, tamanho_maximo=API_TAMANHO_MAXIMO)
+    servidor_web.rota('/', home)
+    servidor_web.rota('/status', status)
+    servidor_web.rota('/health', health)
+    servidor_web.rota('/metrics', metrics)
+    if API_TOKEN:
+        servidor_web.rota('/api/alertas', api_exportar)
+        servidor_web.rota('/api/alertas', functools.partial(api_importar, application.job_queue), metodo='POST')
+        servidor_web.rota('/api/alertas', api_remover, metodo='DELETE')
 
-    # Adiciona os handlers para os comandos
-    application.add_handler(CommandHandler("start", comando_start))
-    application.add_handler(CommandHandler("cotacao", comando_cotacao))
-    application.add_handler(CommandHandler("alerta", comando_alerta))
-    application.add_handler(CommandHandler("listar", comando_listar))
-    application.add_handler(CommandHandler("remover", comando_remover))
-    application.add_handler(CommandHandler("limpar", comando_limpar))
+    # Limites por usuário e conversa antes de todos os handlers (grupo -1)
+    application.add_handler(TypeHandler(Update, limitar_comandos), group=-1)
+    
+    # Adiciona os handlers para os comandos (cada um com a duração medida)
+    application.add_handler(comando("start", comando_start))
+    application.add_handler(comando("cotacao", comando_cotacao))
+    application.add_handler(comando("historico", comando_historico))
+    application.add_handler(comando("grafico", comando_grafico))
+    application.add_handler(comando("alerta", comando_alerta))
+    application.add_handler(comando("listar", comando_listar))
+    application.add_handler(comando("remover", comando_remover))
+    application.add_handler(comando("limpar", comando_limpar))
+    application.add_handler(botao("listar_pagina", r'^listar:', pagina_listar))
 
     # Configura o menu de comandos do Telegram
     comandos = [
         BotCommand("start", "Ver lista de comandos"),
         BotCommand("cotacao", "Ver cotação atual com tendência"),
+        BotCommand("historico", "Ver histórico da cotação (ex: 24h, 7d)"),
+        BotCommand("grafico", "Ver gráfico da cotação (ex: 24h, 7d)"),
         BotCommand("alerta", "Criar alerta personalizado"),
         BotCommand("listar", "Ver alertas ativos"),
-        BotCommand("remover", "Remover alerta específico"),
+        BotCommand("remover", "Remover alerta pelo id"),
         BotCommand("limpar", "Remover todos os alertas")
     ]
     
-    async def configurar_comandos(app):
+    async def configurar_menu(bot):
         try:
-            # Remove webhooks que podem estar ativos
-            await app.bot.delete_webhook(drop_pending_updates=True)
-            logging.info("Webhooks removidos")
-            
-            # Configura os comandos do menu
-            await app.bot.set_my_commands(comandos)
+            await bot.set_my_commands(comandos)
             logging.info("Menu de comandos configurado no Telegram")
         except Exception as e:
             logging.error(f"Erro ao configurar comandos: {e}")
+
+    async def configurar_comandos(app):
+        global fila_envio, tarefa_menu
+        
+        # Menu de comandos em segundo plano: a primeira resposta não espera por ele. O
+        # webhook antigo é removido pelo próprio polling ao subir (drop_pending_updates)
+        tarefa_menu = asyncio.create_task(configurar_menu(app.bot))
+
+        # Abre o pool de conexões da API de cotações (o servidor web sobe pelo supervisor)
+        await provedores_cotacao.iniciar()
+        
+        # Fila de envio das notificações (limites global e por conversa)
+        fila_envio = FilaEnvio(cronometrar(metrica_envio)(app.bot.send_message),
+                               limite_global=ENVIO_LIMITE_GLOBAL, concorrencia=ENVIO_CONCORRENCIA)
+        fila_envio.iniciar()
+
+    async def encerrar(app):
+        if tarefa_menu is not None:
+            tarefa_menu.cancel()
+        # Entrega o que ainda estiver na fila, sem travar o desligamento
+        if fila_envio is not None:
+            try:
+                await asyncio.wait_for(fila_envio.fechar(), timeout=30)
+            except asyncio.TimeoutError:
+                # Alertas dessas mensagens não foram gravados como disparados: voltam no próximo início
+                logging.warning("Mensagens pendentes descartadas no desligamento")
+        
+        # Com a fila entregue, outra réplica pode assumir sem esperar o prazo da liderança
+        if ESTADO_DB:
+            diario_alertas.renunciar()
+        
+        # Fecha as conexões keep-alive com a API de cotações
+        await provedores_cotacao.fechar()
+        if executor_graficos is not None:
+            executor_graficos.shutdown(wait=False, cancel_futures=True)
+        diario_alertas.fechar()
+        for serie in historico_cotacoes.values():
+            serie.sincronizar()
     
     # Configura os comandos após inicializar
     application.post_init = configurar_comandos
+    application.post_shutdown = encerrar
+    return application
 
-    # Configura a tarefa repetitiva para as notificações (a cada 30 minutos)
-    job_queue = application.job_queue
-    job_queue.run_repeating(notificar_mudanca, interval=1800, first=10)  # 1800s = 30min
+def agendar_tarefas(job_queue):
+    """Agenda as tarefas que faltarem: na partida e a cada reinício da JobQueue pelo supervisor."""
+    if ESTADO_DB and not job_queue.get_jobs_by_name('sincronizacao'):
+        # Réplicas: a verificação só roda na líder e é iniciada quando ela é eleita
+        job_queue.run_repeating(sincronizar_replica, interval=SINCRONIZACAO_INTERVALO, first=0, name='sincronizacao')
+    # Configura a verificação das cotações (o intervalo se ajusta a cada rodada)
+    if sou_lider() and not job_queue.get_jobs_by_name('verificacao'):
+        job_queue.run_once(ciclo_verificacao, when=10, name='verificacao')
+    if not job_queue.get_jobs_by_name('compactacao'):
+        # Compacta o diário se cresceu
+        job_queue.run_repeating(compactar_alertas, interval=300, first=300, name='compactacao')
 
-    # Inicia o bot com tratamento de erro
-    logging.info("🤖 Bot de Cotação USD-BRL iniciado!")
-    logging.info(f"📊 {len(alertas_ativos)} alertas carregados")
-    
-    try:
-        application.run_polling(
-            drop_pending_updates=True,  # Remove updates pendentes
+async def executar(application, parar=None, agendar=agendar_tarefas, preparar=None, perfilar=False):
+    """Roda o bot até `parar` (ou SIGTERM/SIGINT), com cada componente sob o supervisor.
+
+    Uma falha no polling (ou no registro do webhook), no servidor web ou nas
+    tarefas agendadas reinicia só aquele componente; alertas, histórico e
+    a própria Application continuam os mesmos. `agendar` põe as tarefas
+    periódicas na JobQueue (None: nenhuma, como nos benchmarks) e `preparar`
+    (função síncrona, ex.: carregar_estado) roda em uma thread junto com a
+    inicialização. Com `perfilar`, o bot para assim que fica pronto e
+    imprime os tempos da partida.
+    """
+    global supervisor
+    parar = parar or asyncio.Event()
+    componentes = [componente_web(servidor_web)]
+    if WEBHOOK_URL:
+        # Telegram entrega os updates por POST no servidor web, sem a latência do polling
+        componentes.append(componente_webhook(application, WEBHOOK_URL.rstrip('/') + CAMINHO_WEBHOOK,
+                                              WEBHOOK_SECRET))
+    else:
+        componentes.append(componente_polling(
+            application,
+            drop_pending_updates=True,  # Remove updates pendentes (só na primeira vez)
             timeout=60,  # Timeout para requests
             poll_interval=2  # Intervalo entre polls
-        )
-    except Exception as e:
-        logging.error(f"Erro ao executar o bot: {e}")
-        # Tenta reiniciar após erro
-        import time
-        time.sleep(5)
-        main()
+        ))
+    componentes.append(componente_tarefas(application.job_queue, agendar))
+
+    def ao_subir(nome):
+        perfil_partida.marcar(f"{nome}_no_ar")
+        if 'pronto' in perfil_partida.marcos or not all(supervisor.no_ar(c.nome) for c in componentes):
+            return
+        perfil_partida.marcar('pronto')
+        logging.info(f"🤖 Bot pronto em {perfil_partida.marcos['pronto']:.2f}s ({perfil_partida.resumo()})")
+        if perfilar:
+            print(json.dumps(perfil_partida.relatorio(), indent=2))
+            parar.set()
+
+    supervisor = Supervisor(componentes, backoff_base=REINICIO_BACKOFF_BASE, backoff_max=REINICIO_BACKOFF_MAX,
+                            ao_subir=ao_subir)
+    for componente in componentes:
+        registro.funcao('componente_reinicios_total', 'Reinícios de cada componente pelo supervisor',
+                        lambda nome=componente.nome: supervisor.reinicios(nome), rotulos={'componente': componente.nome})
+    # O servidor web (health check da plataforma) sobe antes de tudo
+    await executar_supervisionado(application, supervisor, parar,
+                                  preparar=(lambda: asyncio.to_thread(preparar)) if preparar else None,
+                                  antecipados=('web',), perfil=perfil_partida)
+
+def main(perfilar=False):
+    """Inicia o bot e configura os handlers."""
+    perfil_partida.marcar('main')
+    # Processos do /grafico antes de qualquer thread (fork) e com o processo ainda pequeno
+    with perfil_partida.fase('graficos'):
+        iniciar_graficos()
+    with perfil_partida.fase('aplicacao'):
+        application = construir_aplicacao()
+
+    logging.info(f"🤖 Bot de Cotação {', '.join(PARES)} iniciando")
+    # Alertas e histórico carregam em uma thread enquanto a Application consulta a Bot API
+    asyncio.run(executar(application, preparar=carregar_estado, perfilar=perfilar))
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bot de cotações e alertas no Telegram")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='sobe o bot, imprime o tempo de cada fase da partida (JSON) e sai')
+    argumentos = parser.parse_args()
     try:
-        main()
+        main(perfilar=argumentos.profile_startup)
     except KeyboardInterrupt:
         logging.info("Bot interrompido pelo usuário")
     except Exception as e:
-        logging.error(f"Erro crítico: {e}")
-        # Em caso de erro crítico, espera um pouco antes de tentar novamente
-        import time
-        time.sleep(10)
-        logging.info("Tentando reiniciar...")
-        main()
\ No newline at end of file
+        # Falhas de rede são tratadas pelo supervisor, sem sair daqui; chegar aqui é erro
+        # de inicialização (ex.: alertas ilegíveis): o processo sai com erro e a
+        # plataforma decide se o reinicia
+        logging.critical(f"Erro crítico: {e}")
+        raise SystemExit(1)
@@ -0,0 +1,279 @@
+"""Indicadores técnicos incrementais para a tendência das cotações.
+
+`Indicadores` mantém média móvel simples (MMS), média móvel exponencial
+(MME), desvio padrão, volatilidade dos log-retornos, mínimo/máximo e
+bandas de Bollinger de uma janela deslizante, com custo O(1) por amostra:
+somas acumuladas para média e variância e deques monotônicas para
+mínimo/máximo. `calcular_em_lote` recalcula as mesmas séries sobre um
+histórico longo de uma vez, vetorizado com NumPy quando ele está instalado.
+"""
+import math
+from collections import deque, namedtuple
+
+Leitura = namedtuple('Leitura', 'valor mms mme desvio volatilidade minimo maximo '
+                                'banda_inferior banda_superior amostras')
+
+
+def _importar_numpy():
+    """NumPy é opcional: sem ele o cálculo em lote usa o caminho incremental."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class JanelaMovel:
+    """Soma, soma dos quadrados, mínimo e máximo das últimas `tamanho` amostras."""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._valores = deque()
+        self._soma = 0.0
+        self._soma_quadrados = 0.0
+        self._maximos = deque()  # (posição, valor) com valores decrescentes
+        self._minimos = deque()  # (posição, valor) com valores crescentes
+        self._posicao = 0
+
+    def __len__(self):
+        return len(self._valores)
+
+    def adicionar(self, valor):
+        posicao = self._posicao
+        self._posicao += 1
+        self._valores.append(valor)
+        self._soma += valor
+        self._soma_quadrados += valor * valor
+        if len(self._valores) > self.tamanho:
+            antigo = self._valores.popleft()
+            self._soma -= antigo
+            self._soma_quadrados -= antigo * antigo
+        if posicao % self.tamanho == self.tamanho - 1:
+            # Recalcula as somas a cada janela para não acumular erro de arredondamento
+            self._soma = math.fsum(self._valores)
+            self._soma_quadrados = math.fsum(v * v for v in self._valores)
+
+        while self._maximos and self._maximos[-1][1] <= valor:
+            self._maximos.pop()
+        self._maximos.append((posicao, valor))
+        if self._maximos[0][0] <= posicao - self.tamanho:
+            self._maximos.popleft()
+        while self._minimos and self._minimos[-1][1] >= valor:
+            self._minimos.pop()
+        self._minimos.append((posicao, valor))
+        if self._minimos[0][0] <= posicao - self.tamanho:
+            self._minimos.popleft()
+
+    def media(self):
+        return self._soma / len(self._valores) if self._valores else None
+
+    def desvio(self):
+        """Desvio padrão amostral (None com menos de duas amostras)."""
+        n = len(self._valores)
+        if n < 2:
+            return None
+        variancia = (self._soma_quadrados - self._soma * self._soma / n) / (n - 1)
+        return math.sqrt(max(variancia, 0.0))
+
+    def minimo(self):
+        return self._minimos[0][1] if self._minimos else None
+
+    def maximo(self):
+        return self._maximos[0][1] if self._maximos else None
+
+
+class Indicadores:
+    """Indicadores de um par, atualizados a cada cotação."""
+
+    def __init__(self, janela=20, periodo_mme=None, k_bollinger=2.0):
+        self.janela = janela
+        self.alfa = 2 / ((periodo_mme or janela) + 1)
+        self.k_bollinger = k_bollinger
+        self._precos = JanelaMovel(janela)
+        self._retornos = JanelaMovel(janela)  # Log-retornos entre amostras consecutivas
+        self.mme = None
+        self.ultimo = None
+        self.anterior = None
+
+    @property
+    def amostras(self):
+        return len(self._precos)
+
+    def _atualizar_janelas(self, valor):
+        if self.ultimo is not None and self.ultimo > 0 and valor > 0:
+            self._retornos.adicionar(math.log(valor / self.ultimo))
+        self._precos.adicionar(valor)
+        self.anterior, self.ultimo = self.ultimo, valor
+
+    def atualizar(self, valor):
+        """Acrescenta uma cotação em O(1)."""
+        self.mme = valor if self.mme is None else self.mme + self.alfa * (valor - self.mme)
+        self._atualizar_janelas(valor)
+
+    def aquecer(self, valores):
+        """Inicializa a partir de um histórico (ex.: o gravado em disco).
+
+        A MME depende de toda a série e sai do cálculo em lote; as janelas
+        só precisam das últimas amostras.
+        """
+        if not len(valores):
+            return
+        self.mme = float(mme_em_lote(valores, self.alfa)[-1])
+        self._precos = JanelaMovel(self.janela)
+        self._retornos = JanelaMovel(self.janela)
+        self.ultimo = self.anterior = None
+        for valor in valores[-(self.janela + 1):]:
+            self._atualizar_janelas(float(valor))
+
+    @property
+    def mms(self):
+        return self._precos.media()
+
+    @property
+    def desvio(self):
+        return self._precos.desvio()
+
+    @property
+    def volatilidade(self):
+        """Desvio padrão dos log-retornos da janela, por amostra."""
+        return self._retornos.desvio()
+
+    @property
+    def minimo(self):
+        return self._precos.minimo()
+
+    @property
+    def maximo(self):
+        return self._precos.maximo()
+
+    def bandas(self):
+        """(inferior, média, superior) das bandas de Bollinger, ou None."""
+        mms, desvio = self.mms, self.desvio
+        if desvio is None:
+            return None
+        return mms - self.k_bollinger * desvio, mms, mms + self.k_bollinger * desvio
+
+    def tendencia(self, tolerancia=0.25):
+        """'alta', 'baixa' ou 'estavel' pela MME contra a MMS (None sem dados).
+
+        Diferenças menores que `tolerancia` desvios padrão contam como
+        estabilidade, para o texto não trocar a cada oscilação.
+        """
+        desvio = self.desvio
+        if desvio is None:
+            return None
+        diferenca = self.mme - self.mms
+        if abs(diferenca) <= tolerancia * desvio:
+            return 'estavel'
+        return 'alta' if diferenca > 0 else 'baixa'
+
+    def leitura(self):
+        bandas = self.bandas() or (None, None, None)
+        return Leitura(self.ultimo, self.mms, self.mme, self.desvio, self.volatilidade,
+                       self.minimo, self.maximo, bandas[0], bandas[2], self.amostras)
+
+
+# --- Cálculo em lote ---
+
+def mme_em_lote(valores, alfa):
+    """MME de toda a série (mesma semente do incremental: a primeira amostra)."""
+    np = _importar_numpy()
+    if np is None:
+        saida, mme = [], None
+        for valor in valores:
+            mme = valor if mme is None else mme + alfa * (valor - mme)
+            saida.append(mme)
+        return saida
+
+    x = np.asarray(valores, dtype=float)
+    saida = np.empty_like(x)
+    if not len(x):
+        return saida
+    beta = 1 - alfa
+    # Em blocos, para beta**-m não estourar: mme_j = beta**(j+1) * (e + alfa * Σ x_i * beta**-(i+1))
+    bloco = max(1, int(30 / -math.log(beta)))
+    potencias = beta ** -np.arange(1, bloco + 1)
+    saida[0] = mme = x[0]
+    for inicio in range(1, len(x), bloco):
+        trecho = x[inicio:inicio + bloco]
+        m = len(trecho)
+        acumulado = mme + alfa * np.cumsum(trecho * potencias[:m])
+        saida[inicio:inicio + m] = acumulado / potencias[:m]
+        mme = saida[inicio + m - 1]
+    return saida
+
+
+def _janelas_em_lote(np, x, janela, bloco=65536):
+    """(média, desvio, mínimo, máximo) móveis; no início, janelas parciais como no incremental."""
+    n = len(x)
+    media, desvio = np.empty(n), np.full(n, np.nan)
+    minimo, maximo = np.empty(n), np.empty(n)
+
+    parcial = min(janela - 1, n)
+    if parcial:
+        # Poucas posições: somas acumuladas deslocadas pela primeira amostra bastam
+        trecho = x[:parcial] - x[0]
+        contagem = np.arange(1, parcial + 1)
+        soma, soma_quadrados = np.cumsum(trecho), np.cumsum(trecho * trecho)
+        media[:parcial] = soma / contagem + x[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variancia = (soma_quadrados - soma * soma / contagem) / (contagem - 1)
+        desvio[1:parcial] = np.sqrt(np.maximum(variancia[1:], 0.0))
+        minimo[:parcial] = np.minimum.accumulate(x[:parcial])
+        maximo[:parcial] = np.maximum.accumulate(x[:parcial])
+
+    if n >= janela:
+        # Janelas completas vetorizadas, em blocos para limitar a memória temporária
+        janelas = np.lib.stride_tricks.sliding_window_view(x, janela)
+        for inicio in range(0, len(janelas), bloco):
+            trecho = janelas[inicio:inicio + bloco]
+            destino = slice(janela - 1 + inicio, janela - 1 + inicio + len(trecho))
+            media[destino] = trecho.mean(axis=1)
+            if janela > 1:
+                desvio[destino] = trecho.std(axis=1, ddof=1)
+            minimo[destino] = trecho.min(axis=1)
+            maximo[destino] = trecho.max(axis=1)
+    return media, desvio, minimo, maximo
+
+
+def calcular_em_lote(valores, janela=20, periodo_mme=None, k_bollinger=2.0):
+    """Séries completas dos indicadores, alinhadas com `valores`.
+
+    Devolve {nome: série} com os campos de `Leitura` (exceto valor e
+    amostras); posições sem dados suficientes ficam com NaN. Com NumPy usa
+    janelas deslizantes vetorizadas; sem ele, o mesmo resultado sai de uma
+    passada do `Indicadores`.
+    """
+    alfa = 2 / ((periodo_mme or janela) + 1)
+    np = _importar_numpy()
+    if np is None:
+        indicadores = Indicadores(janela, periodo_mme, k_bollinger)
+        series = {campo: [] for campo in Leitura._fields if campo not in ('valor', 'amostras')}
+        for valor in valores:
+            indicadores.atualizar(valor)
+            leitura = indicadores.leitura()._asdict()
+            for campo, serie in series.items():
+                serie.append(math.nan if leitura[campo] is None else leitura[campo])
+        return series
+
+    x = np.asarray(valores, dtype=float)
+    if not len(x):
+        vazio = np.empty(0)
+        return {campo: vazio for campo in Leitura._fields if campo not in ('valor', 'amostras')}
+
+    mms, desvio, minimo, maximo = _janelas_em_lote(np, x, janela)
+    # Volatilidade: a posição i usa os últimos `janela` log-retornos até ela
+    volatilidade = np.full(len(x), np.nan)
+    if len(x) > 1:
+        volatilidade[1:] = _janelas_em_lote(np, np.diff(np.log(x)), janela)[1]
+
+    return {
+        'mms': mms,
+        'mme': mme_em_lote(x, alfa),
+        'desvio': desvio,
+        'volatilidade': volatilidade,
+        'minimo': minimo,
+        'maximo': maximo,
+        'banda_inferior': mms - k_bollinger * desvio,
+        'banda_superior': mms + k_bollinger * desvio,
+    }
@@ -0,0 +1,97 @@
+"""Limites de taxa por token bucket, com memória limitada.
+
+Cada chave (usuário, conversa ou uma chave única para um orçamento
+global) tem um balde de `capacidade` fichas reabastecido a `taxa` fichas
+por segundo. O reabastecimento é calculado na hora da consulta, então
+cada pedido custa O(1) e não há tarefas em segundo plano.
+
+Os baldes ficam em ordem de último uso (OrderedDict). Um balde parado há
+mais de capacidade/taxa segundos já está cheio, igual a um balde novo, e
+é descartado sem mudar nenhuma decisão; acima de `max_chaves` os menos
+usados saem mesmo assim (ficam mais permissivos, nunca mais restritos).
+"""
+import time
+from collections import OrderedDict
+
+
+class _Balde:
+    __slots__ = ('fichas', 'atualizado', 'avisado')
+
+    def __init__(self, fichas, agora):
+        self.fichas = fichas
+        self.atualizado = agora
+        self.avisado = False  # Já recebeu o aviso de limite desde o último pedido aceito
+
+
+class LimitadorTaxa:
+    """Token buckets por chave, com despejo dos baldes ociosos."""
+
+    def __init__(self, taxa, capacidade, max_chaves=100_000, relogio=time.monotonic):
+        self.taxa = taxa  # Fichas por segundo
+        self.capacidade = capacidade  # Rajada máxima
+        self.max_chaves = max_chaves
+        self._relogio = relogio
+        self._baldes = OrderedDict()
+        self._tempo_cheio = capacidade / taxa if taxa > 0 else float('inf')
+        self.aceitos = 0
+        self.recusados = 0
+
+    def __len__(self):
+        return len(self._baldes)
+
+    def _balde(self, chave, agora):
+        balde = self._baldes.get(chave)
+        if balde is None:
+            balde = self._baldes[chave] = _Balde(float(self.capacidade), agora)
+        else:
+            balde.fichas = min(self.capacidade, balde.fichas + (agora - balde.atualizado) * self.taxa)
+            balde.atualizado = agora
+            self._baldes.move_to_end(chave)
+        self._despejar(agora)
+        return balde
+
+    def _despejar(self, agora):
+        # Os mais antigos ficam no início: para no primeiro que ainda não encheu
+        while self._baldes:
+            chave, balde = next(iter(self._baldes.items()))
+            if agora - balde.atualizado < self._tempo_cheio and len(self._baldes) <= self.max_chaves:
+                break
+            del self._baldes[chave]
+
+    def permitir(self, chave=None, custo=1.0):
+        """Consome `custo` fichas da chave; indica se havia saldo."""
+        balde = self._balde(chave, self._relogio())
+        if balde.fichas >= custo:
+            balde.fichas -= custo
+            balde.avisado = False
+            self.aceitos += 1
+            return True
+        self.recusados += 1
+        return False
+
+    def devolver(self, chave=None, custo=1.0):
+        """Desfaz um `permitir` aceito (ex.: outro limite barrou o mesmo pedido)."""
+        balde = self._baldes.get(chave)
+        if balde is None:
+            return
+        balde.fichas = min(self.capacidade, balde.fichas + custo)
+        self.aceitos -= 1
+
+    def avisar(self, chave=None):
+        """True só na primeira recusa desde o último pedido aceito (um aviso por rajada)."""
+        balde = self._baldes.get(chave)
+        if balde is None or balde.avisado:
+            return False
+        balde.avisado = True
+        return True
+
+    def espera(self, chave=None, custo=1.0):
+        """Segundos até a chave ter `custo` fichas."""
+        balde = self._baldes.get(chave)
+        if balde is None:
+            return 0.0
+        falta = custo - min(self.capacidade, balde.fichas + (self._relogio() - balde.atualizado) * self.taxa)
+        return max(0.0, falta / self.taxa) if self.taxa > 0 else float('inf')
+
+    def estatisticas(self):
+        return {'chaves': len(self._baldes), 'aceitos': self.aceitos, 'recusados': self.recusados}
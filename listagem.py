@@ -0,0 +1,71 @@
+"""Páginas do /listar, renderizadas sob demanda e guardadas até os alertas da conversa mudarem.
+
+Cada página mostra até `por_pagina` alertas com o id estável deles (o
+mesmo usado no /remover), então a numeração não muda quando outro alerta
+dispara ou é removido. O cache usa a versão dos alertas da conversa
+(IndiceAlertas.versao_chat): qualquer adição ou remoção invalida as
+páginas daquela conversa, sem varrer as demais.
+"""
+import time
+from collections import OrderedDict
+
+from regras import descrever_alerta
+
+POR_PAGINA = 20
+MAX_CONVERSAS = 1000  # Conversas com páginas em cache (as menos usadas saem primeiro)
+
+
+def data_curta(criado_ms):
+    """Epoch em ms -> '01/05 14:30' na hora local."""
+    if criado_ms is None:
+        return "-"
+    return time.strftime("%d/%m %H:%M", time.localtime(criado_ms / 1000))
+
+
+def linha_listagem(alerta):
+    emoji, descricao = descrever_alerta(alerta)
+    return f"`#{alerta.id}` {emoji} {descricao} - {data_curta(alerta.criado_ms)}\n"
+
+
+class CachePaginas:
+    """Páginas do /listar por conversa, válidas enquanto a versão dos alertas não mudar."""
+
+    def __init__(self, indice, por_pagina=POR_PAGINA, max_conversas=MAX_CONVERSAS):
+        self.indice = indice
+        self.por_pagina = por_pagina
+        self.max_conversas = max_conversas
+        self._conversas = OrderedDict()  # chat_id -> (versão, alertas, {página: texto})
+        self.acertos = 0
+        self.renderizacoes = 0
+
+    def _entrada(self, chat_id):
+        versao = self.indice.versao_chat(chat_id)
+        entrada = self._conversas.get(chat_id)
+        if entrada is None or entrada[0] != versao:
+            entrada = self._conversas[chat_id] = (versao, self.indice.do_chat(chat_id), {})
+        self._conversas.move_to_end(chat_id)
+        if len(self._conversas) > self.max_conversas:
+            self._conversas.popitem(last=False)
+        return entrada
+
+    def pagina(self, chat_id, numero):
+        """(texto, número da página, total de páginas); a página é ajustada ao intervalo válido.
+
+        Sem alertas devolve (None, 1, 0).
+        """
+        _, alertas, paginas = self._entrada(chat_id)
+        if not alertas:
+            return None, 1, 0
+        total = (len(alertas) + self.por_pagina - 1) // self.por_pagina
+        numero = min(max(numero, 1), total)
+        texto = paginas.get(numero)
+        if texto is None:
+            inicio = (numero - 1) * self.por_pagina
+            linhas = ''.join(linha_listagem(a) for a in alertas[inicio:inicio + self.por_pagina])
+            pagina = f" (página {numero}/{total})" if total > 1 else ""
+            texto = paginas[numero] = (f"📋 *Seus Alertas Ativos{pagina}:*\n\n{linhas}"
+                                       f"\nTotal: {len(alertas)} alertas")
+            self.renderizacoes += 1
+        else:
+            self.acertos += 1
+        return texto, numero, total
@@ -0,0 +1,206 @@
+"""Métricas no formato de texto do Prometheus, com custo mínimo no caminho quente.
+
+Tudo roda no event loop do bot, então não há locks: um contador é um
+inteiro somado, uma observação de histograma é uma busca binária em uma
+tupla de limites e dois incrementos. O acúmulo por faixa (buckets
+cumulativos) e a formatação só acontecem quando `/metrics` é lido.
+Valores que outras classes já contam (ex.: acertos do cache) entram como
+funções lidas na exportação, sem nenhum custo extra por evento.
+"""
+import contextlib
+import functools
+import time
+from bisect import bisect_left
+
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites padrão (segundos): de 1 ms a 10 s
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_rotulos(rotulos, extra=None):
+    pares = list(rotulos.items()) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in pares) + '}'
+
+
+def _formatar_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Valor que só cresce (sufixo _total por convenção)."""
+
+    tipo = 'counter'
+
+    def __init__(self, rotulos=None):
+        self.rotulos = rotulos or {}
+        self.valor = 0
+
+    def inc(self, quantidade=1):
+        self.valor += quantidade
+
+    def amostras(self, nome):
+        yield nome + _formatar_rotulos(self.rotulos), self.valor
+
+
+class Medidor:
+    """Valor que sobe e desce (gauge), definido diretamente."""
+
+    tipo = 'gauge'
+
+    def __init__(self, rotulos=None):
+        self.rotulos = rotulos or {}
+        self.valor = 0
+
+    def definir(self, valor):
+        self.valor = valor
+
+    def amostras(self, nome):
+        yield nome + _formatar_rotulos(self.rotulos), self.valor
+
+
+class Funcao:
+    """Contador ou gauge lido de uma função só na exportação."""
+
+    def __init__(self, funcao, tipo='counter', rotulos=None):
+        self.funcao = funcao
+        self.tipo = tipo
+        self.rotulos = rotulos or {}
+
+    def amostras(self, nome):
+        valor = self.funcao()
+        if valor is not None:
+            yield nome + _formatar_rotulos(self.rotulos), valor
+
+
+class Histograma:
+    """Distribuição de durações em faixas fixas."""
+
+    tipo = 'histogram'
+
+    def __init__(self, buckets=BUCKETS_PADRAO, rotulos=None):
+        self.buckets = tuple(buckets)
+        self.rotulos = rotulos or {}
+        self._contagens = [0] * (len(self.buckets) + 1)  # Última faixa: acima do maior limite
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self._contagens[bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def amostras(self, nome):
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float('inf'),), self._contagens):
+            acumulado += contagem
+            yield nome + '_bucket' + _formatar_rotulos(self.rotulos, ('le', _formatar_numero(limite))), acumulado
+        yield nome + '_sum' + _formatar_rotulos(self.rotulos), self.soma
+        yield nome + '_count' + _formatar_rotulos(self.rotulos), self.total
+
+
+class Registro:
+    """Conjunto de métricas exportado em `/metrics`.
+
+    Métricas com o mesmo nome e rótulos diferentes formam uma família
+    (HELP/TYPE aparecem uma vez só).
+    """
+
+    def __init__(self):
+        self._familias = {}  # nome -> (ajuda, {rótulos: métrica})
+
+    def _obter(self, nome, ajuda, rotulos, criar):
+        _, metricas = self._familias.setdefault(nome, (ajuda, {}))
+        chave = tuple(sorted((rotulos or {}).items()))
+        metrica = metricas.get(chave)
+        if metrica is None:
+            metrica = metricas[chave] = criar()
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=None):
+        return self._obter(nome, ajuda, rotulos, lambda: Contador(rotulos))
+
+    def medidor(self, nome, ajuda, rotulos=None):
+        return self._obter(nome, ajuda, rotulos, lambda: Medidor(rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=None, buckets=BUCKETS_PADRAO):
+        return self._obter(nome, ajuda, rotulos, lambda: Histograma(buckets, rotulos))
+
+    def funcao(self, nome, ajuda, funcao, tipo='counter', rotulos=None):
+        return self._obter(nome, ajuda, rotulos, lambda: Funcao(funcao, tipo, rotulos))
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for nome, (ajuda, metricas) in self._familias.items():
+            if not metricas:
+                continue
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {next(iter(metricas.values())).tipo}')
+            for metrica in metricas.values():
+                for amostra, valor in metrica.amostras(nome):
+                    linhas.append(f'{amostra} {_formatar_numero(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+def cronometrar(histograma):
+    """Decorador de corrotina que registra a duração de cada chamada no histograma."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        async def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await funcao(*args, **kwargs)
+            finally:
+                histograma.observar(time.perf_counter() - inicio)
+        return medida
+    return decorador
+
+
+class PerfilPartida:
+    """Tempos da partida do processo: fases (que podem correr juntas) e marcos.
+
+    Tudo é medido desde `inicio` (o primeiro instante do processo, antes
+    dos imports) com o mesmo relógio monotônico.
+    """
+
+    def __init__(self, inicio=None, relogio=time.perf_counter):
+        self._relogio = relogio
+        self.inicio = relogio() if inicio is None else inicio
+        self.fases = {}  # nome -> (início, duração) em segundos desde `inicio`
+        self.marcos = {}  # nome -> segundos desde `inicio`
+
+    def registrar(self, nome, desde, ate=None):
+        ate = self._relogio() if ate is None else ate
+        self.fases[nome] = (desde - self.inicio, ate - desde)
+
+    @contextlib.contextmanager
+    def fase(self, nome):
+        desde = self._relogio()
+        try:
+            yield
+        finally:
+            self.registrar(nome, desde)
+
+    def marcar(self, nome):
+        """Marca o instante de `nome` (só a primeira vez: reinícios não contam)."""
+        self.marcos.setdefault(nome, self._relogio() - self.inicio)
+
+    def relatorio(self):
+        return {
+            'fases': {nome: {'inicio_ms': round(inicio * 1000, 1), 'duracao_ms': round(duracao * 1000, 1)}
+                      for nome, (inicio, duracao) in sorted(self.fases.items(), key=lambda item: item[1][0])},
+            'marcos_ms': {nome: round(t * 1000, 1) for nome, t in sorted(self.marcos.items(), key=lambda item: item[1])},
+        }
+
+    def resumo(self):
+        """Uma linha para o log: a duração de cada fase, na ordem em que começaram."""
+        return ', '.join(f"{nome} {fase['duracao_ms']:.0f} ms" for nome, fase in self.relatorio()['fases'].items())
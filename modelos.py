@@ -0,0 +1,87 @@
+"""Registro compacto de um alerta: __slots__, criação em epoch e tipo enumerado.
+
+Um dict por alerta custava centenas de bytes (tabela de hash, string ISO
+da criação, uma string de tipo por alerta). `Alerta` guarda os mesmos
+campos em __slots__, a criação em milissegundos desde a epoch e o tipo
+como `TipoAlerta` (um único objeto por tipo, igual à string do tipo em
+comparações e no JSON).
+
+O formato dict/JSON, com `criado_em` em ISO, continua sendo o de troca:
+diário, API, SQLite e importação passam por `para_dict` e `Alerta.de_dict`.
+"""
+import sys
+from datetime import datetime
+from enum import StrEnum
+from operator import attrgetter
+
+
+class TipoAlerta(StrEnum):
+    ACIMA = 'acima'
+    ABAIXO = 'abaixo'
+    RECUO = 'recuo'  # Recuo e variação acompanham o movimento da cotação (alertas_moveis.py)
+    VARIACAO = 'variacao'
+
+
+TIPOS_FIXOS = (TipoAlerta.ACIMA, TipoAlerta.ABAIXO)
+TIPOS_MOVEIS = (TipoAlerta.RECUO, TipoAlerta.VARIACAO)
+
+
+def ms_de_iso(texto):
+    """'2024-05-01T14:30:00' (hora local, como o datetime.now().isoformat()) -> epoch em ms."""
+    return int(datetime.fromisoformat(texto).timestamp() * 1000)
+
+
+def iso_de_ms(criado_ms):
+    return datetime.fromtimestamp(criado_ms / 1000).isoformat()
+
+
+class Alerta:
+    """Um alerta de preço; `referencia`, `janela_ms`, `pico` e `fundo` só nos móveis."""
+
+    __slots__ = ('id', 'chat_id', 'par', 'valor', 'tipo', 'criado_ms', 'referencia', 'janela_ms', 'pico', 'fundo')
+
+    def __init__(self, id, chat_id, par, valor, tipo, criado_ms=None, referencia=None, janela_ms=None,
+                 pico=None, fundo=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.par = par
+        self.valor = valor
+        self.tipo = tipo
+        self.criado_ms = criado_ms
+        self.referencia = referencia
+        self.janela_ms = janela_ms
+        self.pico = pico
+        self.fundo = fundo
+
+    def __repr__(self):
+        return f"Alerta(#{self.id} {self.chat_id} {self.par} {self.valor} {self.tipo})"
+
+    @property
+    def criado_em(self):
+        """Criação em ISO na hora local (None se desconhecida)."""
+        return iso_de_ms(self.criado_ms) if self.criado_ms is not None else None
+
+    # (chat_id, par, valor, tipo, janela_ms): alertas iguais na mesma conversa são duplicados.
+    # O attrgetter monta a tupla em C, sem uma chamada Python por alerta na carga em lote
+    chave = property(attrgetter('chat_id', 'par', 'valor', 'tipo', 'janela_ms'))
+
+    @classmethod
+    def de_dict(cls, dados, chat_padrao=None, par_padrao=None):
+        """Alerta a partir do dict do JSON (diário, API, formato antigo sem id, chat_id ou par)."""
+        criado_ms = dados.get('criado_ms')
+        if criado_ms is None and dados.get('criado_em'):
+            criado_ms = ms_de_iso(dados['criado_em'])
+        par = dados.get('par', par_padrao)
+        return cls(dados.get('id'), dados.get('chat_id', chat_padrao), sys.intern(par) if par else par,
+                   dados['valor'], TipoAlerta(dados['tipo']), criado_ms, dados.get('referencia'),
+                   dados.get('janela_ms'), dados.get('pico'), dados.get('fundo'))
+
+    def para_dict(self):
+        """Dict para JSON, com `criado_em` ISO como no formato antigo; omite os campos vazios."""
+        dados = {'id': self.id, 'chat_id': self.chat_id, 'par': self.par, 'valor': self.valor,
+                 'tipo': str(self.tipo), 'criado_em': self.criado_em}
+        for campo in ('referencia', 'janela_ms', 'pico', 'fundo'):
+            valor = getattr(self, campo)
+            if valor is not None:
+                dados[campo] = valor
+        return dados
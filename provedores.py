@@ -0,0 +1,214 @@
+"""Várias fontes de cotação com requisições de reserva (hedging) e disjuntor.
+
+A busca começa pela primeira fonte disponível, na ordem configurada. Se
+ela não responder dentro de um percentil da latência recente dela (p90
+por padrão), a próxima fonte é consultada em paralelo e vale a primeira
+resposta válida; as demais são canceladas. Uma falha passa direto para a
+fonte seguinte, sem esperar. Fontes que falham seguidamente são
+desligadas por um disjuntor (circuit breaker) e voltam a ser testadas,
+com uma única requisição, depois de um tempo. Se todas as fontes
+consultadas falharem, a rodada se repete (`tentativas`) com backoff.
+
+Qualquer objeto com `async buscar_cotacoes() -> {par: valor}` serve de
+fonte (ClienteCotacao, servidores falsos nos benchmarks...); `iniciar` e
+`fechar`, se existirem, são chamados junto com os do conjunto.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque, namedtuple
+
+from cotacao import ErroCotacao
+
+# Resultado de uma busca: cotações, fonte que respondeu primeiro, duração
+# total e quantas fontes chegaram a ser consultadas
+Resposta = namedtuple('Resposta', 'cotacoes fonte duracao consultadas')
+
+
+class Disjuntor:
+    """Circuit breaker: abre após `limite_falhas` falhas seguidas, por `tempo_aberto` segundos."""
+
+    def __init__(self, limite_falhas=5, tempo_aberto=30.0, relogio=time.monotonic):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self._relogio = relogio
+        self.falhas_seguidas = 0
+        self._aberto_ate = None
+        self._testando = False  # Meio-aberto: uma requisição de teste em andamento
+
+    @property
+    def estado(self):
+        if self._aberto_ate is None:
+            return 'fechado'
+        return 'meio_aberto' if self._relogio() >= self._aberto_ate else 'aberto'
+
+    def permitir(self):
+        """Indica se a fonte pode ser consultada agora (reserva a requisição de teste)."""
+        if self._aberto_ate is None:
+            return True
+        if self._relogio() >= self._aberto_ate and not self._testando:
+            self._testando = True
+            return True
+        return False
+
+    def sucesso(self):
+        self.falhas_seguidas = 0
+        self._aberto_ate = None
+        self._testando = False
+
+    def falha(self):
+        self.falhas_seguidas += 1
+        # No meio-aberto basta uma falha para abrir de novo
+        if self._testando or self.falhas_seguidas >= self.limite_falhas:
+            self._aberto_ate = self._relogio() + self.tempo_aberto
+        self._testando = False
+
+    def liberar(self):
+        """Requisição cancelada (outra fonte respondeu antes): não conta como falha nem sucesso."""
+        self._testando = False
+
+
+class Provedor:
+    """Uma fonte de cotações com as latências recentes e o disjuntor dela."""
+
+    def __init__(self, nome, fonte, disjuntor=None, janela=200):
+        self.nome = nome
+        self.fonte = fonte
+        self.disjuntor = disjuntor or Disjuntor()
+        self._latencias = deque(maxlen=janela)
+        self.requisicoes = 0
+        self.vitorias = 0
+        self.falhas = 0
+        self.canceladas = 0
+
+    def registrar_latencia(self, segundos):
+        self._latencias.append(segundos)
+
+    def percentil(self, p):
+        """Percentil p (0-100) das latências recentes, ou None sem amostras suficientes."""
+        if len(self._latencias) < 10:
+            return None
+        ordenadas = sorted(self._latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+    def estatisticas(self):
+        p50, p95 = self.percentil(50), self.percentil(95)
+        return {
+            'estado': self.disjuntor.estado,
+            'requisicoes': self.requisicoes,
+            'vitorias': self.vitorias,
+            'falhas': self.falhas,
+            'canceladas': self.canceladas,
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class ProvedoresCotacao:
+    """Busca as cotações na primeira fonte que responder, com hedging e failover."""
+
+    def __init__(self, provedores, percentil=90, atraso_minimo=0.05, atraso_padrao=1.0,
+                 tentativas=1, backoff_base=0.5):
+        self.provedores = list(provedores)
+        self.tentativas = max(1, tentativas)  # Rodadas sobre as fontes liberadas
+        self.backoff_base = backoff_base
+        self.percentil = percentil  # Espera por este percentil da fonte antes da reserva
+        self.atraso_minimo = atraso_minimo  # Evita reservas imediatas quando a fonte é muito rápida
+        self.atraso_padrao = atraso_padrao  # Antes de haver amostras de latência
+        self.ultima_fonte = None
+        self.reservas = 0  # Buscas em que uma segunda fonte chegou a ser consultada
+
+    async def iniciar(self):
+        for provedor in self.provedores:
+            if hasattr(provedor.fonte, 'iniciar'):
+                await provedor.fonte.iniciar()
+
+    async def fechar(self):
+        for provedor in self.provedores:
+            if hasattr(provedor.fonte, 'fechar'):
+                await provedor.fonte.fechar()
+
+    def _atraso_reserva(self, provedor):
+        atraso = provedor.percentil(self.percentil)
+        return self.atraso_padrao if atraso is None else max(self.atraso_minimo, atraso)
+
+    async def _consultar(self, provedor):
+        provedor.requisicoes += 1
+        inicio = time.perf_counter()
+        try:
+            cotacoes = await provedor.fonte.buscar_cotacoes()
+        except asyncio.CancelledError:
+            # Perdeu a corrida: a duração até aqui é um limite inferior da latência dela
+            provedor.canceladas += 1
+            provedor.registrar_latencia(time.perf_counter() - inicio)
+            provedor.disjuntor.liberar()
+            raise
+        except Exception:
+            provedor.falhas += 1
+            provedor.disjuntor.falha()
+            if provedor.disjuntor.estado != 'fechado':
+                logging.warning(f"Fonte de cotação {provedor.nome} desligada após falhas seguidas")
+            raise
+        provedor.registrar_latencia(time.perf_counter() - inicio)
+        provedor.disjuntor.sucesso()
+        return cotacoes
+
+    async def buscar(self):
+        """Devolve uma Resposta com as cotações da primeira fonte que responder."""
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                return await self._rodada()
+            except ErroCotacao as e:
+                if tentativa == self.tentativas:
+                    raise
+                espera = random.uniform(0.5, 1.0) * self.backoff_base * 2 ** (tentativa - 1)
+                logging.warning(f"{e}; nova rodada em {espera:.2f}s")
+                await asyncio.sleep(espera)
+
+    async def _rodada(self):
+        """Uma passada pelas fontes liberadas, com reservas e failover."""
+        restantes = [p for p in self.provedores if p.disjuntor.permitir()]
+        if not restantes:
+            raise ErroCotacao("Nenhuma fonte de cotação disponível (todas desligadas pelo disjuntor)")
+        inicio = time.perf_counter()
+        pendentes = {}  # tarefa -> provedor
+        erros = []
+        consultadas = 0
+        try:
+            while restantes or pendentes:
+                # Lança a próxima fonte: no início, após uma falha ou quando a anterior passou do percentil
+                limite = None
+                if restantes:
+                    provedor = restantes.pop(0)
+                    pendentes[asyncio.ensure_future(self._consultar(provedor))] = provedor
+                    consultadas += 1
+                    if consultadas == 2:
+                        self.reservas += 1
+                    if restantes:
+                        limite = self._atraso_reserva(provedor)
+                feitas, _ = await asyncio.wait(pendentes, timeout=limite, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in feitas:
+                    provedor = pendentes.pop(tarefa)
+                    if tarefa.exception() is None:
+                        provedor.vitorias += 1
+                        self.ultima_fonte = provedor.nome
+                        return Resposta(tarefa.result(), provedor.nome, time.perf_counter() - inicio, consultadas)
+                    erros.append(f"{provedor.nome}: {tarefa.exception()!r}")
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+            for provedor in restantes:
+                provedor.disjuntor.liberar()  # Não chegaram a ser consultadas
+        raise ErroCotacao(f"Todas as fontes falharam ({'; '.join(erros)})")
+
+    async def buscar_cotacoes(self):
+        """Mesma interface do ClienteCotacao: só o {par: valor}."""
+        return (await self.buscar()).cotacoes
+
+    def estatisticas(self):
+        return {
+            'ultima_fonte': self.ultima_fonte,
+            'reservas': self.reservas,
+            'fontes': {p.nome: p.estatisticas() for p in self.provedores},
+        }
@@ -0,0 +1,165 @@
+"""Regras de notificação: mudança relevante, tendência e texto das mensagens.
+
+Funções puras sobre os Indicadores de cada par, sem estado global nem
+rede. O `notificar_mudanca` do bot e o backtest (backtest.py) usam as
+mesmas funções, então o que o backtest mostra é o que o bot enviaria.
+"""
+import math
+from collections import namedtuple
+
+PERCENTUAL_PADRAO = 0.1  # Regra de mudança padrão (e fallback da regra por sigma)
+LIMITE_MENSAGEM = 4096  # Tamanho máximo de uma mensagem do Telegram (unidades UTF-16)
+TITULO_ALERTAS = "\n🔔 *Alertas Ativados:*\n"
+TITULO_CONTINUACAO = "🔔 *Alertas Ativados (continuação):*\n"
+
+# Uma mensagem a enviar e os alertas que ela confirma quando é entregue
+Notificacao = namedtuple('Notificacao', 'chat_id texto alertas')
+
+
+def interpretar_limiar(texto):
+    """Converte '0.1%' ou '2sigma' em (sigmas, percentual).
+
+    Na regra por volatilidade o percentual padrão vale enquanto a
+    volatilidade do par ainda não é conhecida.
+    """
+    texto = texto.strip().lower()
+    if texto.endswith(('sigma', 'σ')):
+        return float(texto.rstrip('sigmaσ ')), PERCENTUAL_PADRAO
+    return None, float(texto.rstrip('% '))
+
+
+def formatar_valor(par, valor):
+    """Valor com o símbolo da moeda de cotação (R$ para pares em BRL)."""
+    moeda = par.split('-')[-1]
+    simbolo = 'R$' if moeda == 'BRL' else moeda
+    return f"{simbolo} {valor:.4f}"
+
+
+def descrever_tendencia(indicadores, cotacao_atual):
+    """Tendência pela MME contra a MMS, com a variação desde a amostra anterior."""
+    tendencia = indicadores.tendencia()
+    if tendencia is None or indicadores.anterior is None:
+        return "🔄", "Coletando dados"
+
+    diferenca = cotacao_atual - indicadores.anterior
+    percentual = (diferenca / indicadores.anterior) * 100
+    variacao = f"{diferenca:+.4f} | {percentual:+.2f}%"
+
+    if tendencia == 'alta':
+        return "📈", f"Subindo ({variacao})"
+    elif tendencia == 'baixa':
+        return "📉", f"Descendo ({variacao})"
+    else:
+        return "➡️", f"Estável ({variacao})"
+
+
+def resumo_indicadores(indicadores):
+    """Linha com médias, bandas de Bollinger e faixa da janela (vazia sem dados)."""
+    bandas = indicadores.bandas()
+    if bandas is None:
+        return ""
+    linha = (f"📐 MMS {indicadores.mms:.4f} | MME {indicadores.mme:.4f}\n"
+             f"🎯 Bandas {bandas[0]:.4f} – {bandas[2]:.4f} | "
+             f"Mín/Máx {indicadores.minimo:.4f} – {indicadores.maximo:.4f}")
+    if indicadores.volatilidade is not None:
+        linha += f" | Vol. {indicadores.volatilidade * 100:.2f}%"
+    return linha + "\n"
+
+
+def mudanca_relevante(indicadores, cotacao_atual, percentual=PERCENTUAL_PADRAO, sigmas=None):
+    """Indica se a cotação mudou o suficiente desde a amostra anterior para notificar."""
+    cotacao_anterior = indicadores.anterior
+    if cotacao_anterior is None or cotacao_anterior <= 0:
+        return False
+    if sigmas is not None:
+        volatilidade = indicadores.volatilidade
+        if volatilidade:
+            # Relativo à volatilidade: ruído normal do par não gera notificação
+            return abs(math.log(cotacao_atual / cotacao_anterior)) >= sigmas * volatilidade
+    diferenca_percentual = abs((cotacao_atual - cotacao_anterior) / cotacao_anterior) * 100
+    return diferenca_percentual >= percentual
+
+
+def agrupar_destinos(pares_com_mudanca, disparados, conversas):
+    """Conversas que recebem mensagem, cada uma com os próprios alertas disparados."""
+    destinos = {chat_id: [] for chat_id in conversas} if pares_com_mudanca else {}
+    for alerta in disparados:
+        destinos.setdefault(alerta.chat_id, []).append(alerta)
+    return destinos
+
+
+def tamanho_telegram(texto):
+    """Tamanho como o Telegram conta: unidades UTF-16 (emojis valem 2)."""
+    return len(texto.encode('utf-16-le')) // 2
+
+
+def formatar_janela(janela_ms):
+    """60_000 -> '1m', 5_400_000 -> '90m', 86_400_000 -> '1d'."""
+    for sufixo, unidade in (('d', 86_400_000), ('h', 3_600_000), ('m', 60_000)):
+        if janela_ms % unidade == 0:
+            return f"{janela_ms // unidade}{sufixo}"
+    return f"{janela_ms / 1000:g}s"
+
+
+def descrever_alerta(alerta):
+    """Emoji e descrição do alerta, iguais no /listar, no /remover e nas notificações."""
+    par, valor, tipo = alerta.par, alerta.valor, alerta.tipo
+    if tipo == 'recuo':
+        return "🔻", f"{par} recuo de {valor:g}% desde o pico"
+    if tipo == 'variacao':
+        return "↕️", f"{par} variação de ±{valor:g}% em {formatar_janela(alerta.janela_ms)}"
+    return ("📈" if tipo == "acima" else "📉"), f"{par} {formatar_valor(par, valor)} ({tipo})"
+
+
+def linha_alerta(alerta):
+    emoji, descricao = descrever_alerta(alerta)
+    return f"{emoji} {descricao}\n"
+
+
+def dividir_alertas(chat_id, cabecalho, alertas, limite=LIMITE_MENSAGEM):
+    """Notificações com o cabeçalho e as linhas dos alertas, cada uma com até `limite`.
+
+    As linhas nunca são quebradas (a formatação Markdown de cada uma fica
+    inteira); as partes seguintes começam com o título de continuação.
+    """
+    partes = []
+    linhas, tamanho, incluidos = [cabecalho], tamanho_telegram(cabecalho), []
+    for alerta in alertas:
+        linha = linha_alerta(alerta)
+        tamanho_linha = tamanho_telegram(linha)
+        if incluidos and tamanho + tamanho_linha > limite:
+            partes.append(Notificacao(chat_id, ''.join(linhas), tuple(incluidos)))
+            linhas, tamanho, incluidos = [TITULO_CONTINUACAO], tamanho_telegram(TITULO_CONTINUACAO), []
+        linhas.append(linha)
+        tamanho += tamanho_linha
+        incluidos.append(alerta)
+    partes.append(Notificacao(chat_id, ''.join(linhas), tuple(incluidos)))
+    return partes
+
+
+def montar_notificacoes(cotacoes, indicadores, pares_com_mudanca, disparados, conversas, horario, pares,
+                        limite=LIMITE_MENSAGEM):
+    """Mensagens de uma verificação, como lista de Notificacao.
+
+    `indicadores(par)` devolve os Indicadores do par. Cada conversa recebe
+    apenas os próprios alertas disparados, em quantas mensagens de até
+    `limite` forem necessárias; havendo mudança relevante, todas as
+    `conversas` recebem também os blocos dos pares que mudaram.
+    """
+    # Bloco de cotação e tendência de cada par que aparece em alguma mensagem
+    blocos = {}
+    for par in pares_com_mudanca | {a.par for a in disparados}:
+        emoji_tendencia, texto_tendencia = descrever_tendencia(indicadores(par), cotacoes[par])
+        blocos[par] = (f"{emoji_tendencia} *{par}: {formatar_valor(par, cotacoes[par])}*\n📊 {texto_tendencia}\n"
+                       f"{resumo_indicadores(indicadores(par))}")
+
+    notificacoes = []
+    for chat_id, do_chat in agrupar_destinos(pares_com_mudanca, disparados, conversas).items():
+        pares_mensagem = pares_com_mudanca | {a.par for a in do_chat}
+        cabecalho = ("⚠️ *Alerta de Câmbio*\n\n" + ''.join(blocos[par] for par in pares if par in pares_mensagem)
+                     + f"🕒 {horario}\n")
+        if do_chat:
+            notificacoes.extend(dividir_alertas(chat_id, cabecalho + TITULO_ALERTAS, do_chat, limite))
+        else:
+            notificacoes.append(Notificacao(chat_id, cabecalho, ()))
+    return notificacoes
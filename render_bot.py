@@ -1,17 +1,20 @@
-import requests
 import logging
 import asyncio
 import os
-import json
-import time
 from datetime import datetime
+from aiohttp import web
 from dotenv import load_dotenv
-from flask import Flask
-from threading import Thread
 
 # Importações da biblioteca do Telegram
-from telegram import Update, BotCommand
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import Application
+
+from alertas import IndiceAlertas
+from armazenamento import DiarioAlertas
+from cotacao import ClienteCotacao, PAR_PADRAO
+from metricas import Registro, TIPO_CONTEUDO
+from serie_temporal import SerieTemporal
+from servidor_web import ServidorWeb, componente_web
+from supervisor import Supervisor, componente_polling, componente_tarefas, executar_supervisionado
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -19,9 +22,12 @@ load_dotenv()
 # --- CONFIGURAÇÕES ---
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 CHAT_ID = os.getenv('CHAT_ID')
-API_URL = 'https://economia.awesomeapi.com.br/last/USD-BRL'
 ALERTAS_FILE = 'alertas.json'
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', 10))
+API_TENTATIVAS = int(os.getenv('API_TENTATIVAS', 3))
 PORT = int(os.environ.get('PORT', 8080))  # Porta do Render
+HISTORICO_DIR = os.getenv('HISTORICO_DIR', 'historico')
+HISTORICO_CAPACIDADE = int(os.getenv('HISTORICO_CAPACIDADE', 500_000))
 
 # Verifica se as variáveis de ambiente estão configuradas
 if not TELEGRAM_TOKEN:
@@ -29,6 +35,8 @@ if not TELEGRAM_TOKEN:
 if not CHAT_ID:
     raise ValueError("CHAT_ID não foi configurado. Verifique as variáveis de ambiente")
 
+CHAT_PADRAO = int(CHAT_ID) if CHAT_ID.lstrip('-').isdigit() else CHAT_ID
+
 # Configura o logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -40,73 +48,67 @@ logging.basicConfig(
 )
 
 # Variáveis globais
-historico_cotacoes = []
-alertas_ativos = []
+historico_cotacoes = SerieTemporal(os.path.join(HISTORICO_DIR, f"{PAR_PADRAO}.serie"), HISTORICO_CAPACIDADE)
+alertas_ativos = IndiceAlertas()
+diario_alertas = DiarioAlertas(ALERTAS_FILE)
+cliente_cotacao = ClienteCotacao(pares=(PAR_PADRAO,), timeout=API_TIMEOUT, tentativas=API_TENTATIVAS)
+
+# Métricas (formato do Prometheus em /metrics)
+registro = Registro()
+metrica_ultima_busca = registro.medidor('cotacao_ultima_busca_sucesso_timestamp_segundos',
+                                        'Horário (epoch) da última busca bem-sucedida na API')
+registro.funcao('alertas_ativos', 'Alertas ativos', lambda: len(alertas_ativos), tipo='gauge')
+
+def ultima_busca():
+    valor = metrica_ultima_busca.valor
+    return datetime.fromtimestamp(valor) if valor else None
 
-# --- SERVIDOR WEB PARA RENDER ---
-app = Flask(__name__)
+# --- SERVIDOR WEB PARA RENDER (NO EVENT LOOP DO BOT) ---
 
-@app.route('/')
-def home():
-    return f"""
+async def home(request):
+    return web.Response(content_type='text/html', text=f"""
     <h1>🤖 Bot de Cotação USD-BRL</h1>
     <p><strong>Status:</strong> ✅ Online no Render!</p>
     <p><strong>Alertas ativos:</strong> {len(alertas_ativos)}</p>
-    <p><strong>Última verificação:</strong> {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}</p>
+    <p><strong>Última verificação:</strong> {ultima_busca().strftime("%d/%m/%Y %H:%M:%S") if ultima_busca() else "ainda não houve"}</p>
     <p><strong>Histórico de cotações:</strong> {len(historico_cotacoes)} entradas</p>
     <p><strong>Bot do Telegram:</strong> Ativo</p>
-    """
+    """)
 
-@app.route('/health')
-def health():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+async def health(request):
+    return web.json_response({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
-@app.route('/status')
-def status():
-    return {
+async def status(request):
+    return web.json_response({
         "status": "online",
         "alertas_ativos": len(alertas_ativos),
-        "ultima_verificacao": datetime.now().isoformat(),
+        "ultima_verificacao": ultima_busca().isoformat() if ultima_busca() else None,
         "historico_cotacoes": len(historico_cotacoes),
         "platform": "Render"
-    }
+    })
 
-def run_flask():
-    """Executa o servidor Flask."""
-    try:
-        app.run(host='0.0.0.0', port=PORT, debug=False, use_reloader=False)
-    except Exception as e:
-        logging.error(f"Erro no servidor Flask: {e}")
+async def metrics(request):
+    return web.Response(body=registro.exportar().encode(), headers={'Content-Type': TIPO_CONTEUDO})
 
 # [Resto das funções permanecem iguais...]
 # Copie todas as outras funções do arquivo original aqui
 
 def carregar_alertas():
-    global alertas_ativos
     try:
-        if os.path.exists(ALERTAS_FILE):
-            with open(ALERTAS_FILE, 'r') as f:
-                alertas_ativos = json.load(f)
-        else:
-            alertas_ativos = []
+        alertas, proximo_id = diario_alertas.carregar()
+        alertas_ativos.carregar(alertas, chat_padrao=CHAT_PADRAO, proximo_id=proximo_id)
+        if diario_alertas.migracao_pendente:
+            diario_alertas.compactar_agora(list(alertas_ativos), alertas_ativos.proximo_id)
         logging.info(f"Alertas carregados: {len(alertas_ativos)} alertas ativos")
     except Exception as e:
         logging.error(f"Erro ao carregar alertas: {e}")
-        alertas_ativos = []
-
-def salvar_alertas():
-    try:
-        with open(ALERTAS_FILE, 'w') as f:
-            json.dump(alertas_ativos, f, indent=2)
-        logging.info(f"Alertas salvos: {len(alertas_ativos)} alertas ativos")
-    except Exception as e:
-        logging.error(f"Erro ao salvar alertas: {e}")
+        raise
 
 def obter_tendencia(cotacao_atual):
     if len(historico_cotacoes) < 2:
         return "🔄", "Coletando dados"
     
-    cotacao_anterior = historico_cotacoes[-2]['valor']
+    cotacao_anterior = historico_cotacoes[-2].valor
     diferenca = cotacao_atual - cotacao_anterior
     percentual = (diferenca / cotacao_anterior) * 100
     
@@ -117,85 +119,40 @@ def obter_tendencia(cotacao_atual):
     else:
         return "➡️", "Estável (0.00%)"
 
-def verificar_alertas(cotacao_atual):
-    alertas_disparados = []
-    for alerta in alertas_ativos[:]:
-        valor_alerta = alerta['valor']
-        tipo = alerta['tipo']
-        
-        if (tipo == 'acima' and cotacao_atual >= valor_alerta) or \
-           (tipo == 'abaixo' and cotacao_atual <= valor_alerta):
-            alertas_disparados.append(alerta)
-            alertas_ativos.remove(alerta)
-    
-    if alertas_disparados:
-        salvar_alertas()
-    
-    return alertas_disparados
-
-def buscar_cotacao_atual():
-    try:
-        response = requests.get(API_URL, timeout=10)
-        response.raise_for_status()
-        dados = response.json()
-        cotacao_str = dados['USDBRL']['bid']
-        cotacao = float(cotacao_str)
-        
-        historico_cotacoes.append({
-            'valor': cotacao,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        if len(historico_cotacoes) > 10:
-            historico_cotacoes.pop(0)
-        
-        return cotacao
-    except Exception as e:
-        logging.error(f"Erro ao buscar cotação: {e}")
-        return None
-
 def main_bot():
-    """Função principal do bot com tratamento robusto de erros."""
-    carregar_alertas()
+    """Função principal do bot: cada componente que cair é reiniciado sozinho pelo supervisor."""
+    # Cria a aplicação do bot (uma vez só: os reinícios não a recriam)
+    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    servidor_web = ServidorWeb(application, porta=PORT)
+    servidor_web.rota('/', home)
+    servidor_web.rota('/status', status)
+    servidor_web.rota('/health', health)
+    servidor_web.rota('/metrics', metrics)
+
+    # [Adicionar todos os handlers aqui...]
     
-    while True:
-        try:
-            # Cria a aplicação do bot
-            application = Application.builder().token(TELEGRAM_TOKEN).build()
-
-            # [Adicionar todos os handlers aqui...]
-            
-            async def configurar_comandos(app):
-                try:
-                    await app.bot.delete_webhook(drop_pending_updates=True)
-                    logging.info("Webhooks limpos")
-                    time.sleep(2)  # Pausa para evitar conflitos
-                except Exception as e:
-                    logging.warning(f"Erro ao limpar webhooks: {e}")
-
-            application.post_init = configurar_comandos
-
-            logging.info("🤖 Bot iniciando no Render...")
-            application.run_polling(
-                drop_pending_updates=True,
-                timeout=30,
-                poll_interval=1,
-                read_timeout=30,
-                write_timeout=30,
-                connect_timeout=30
-            )
-            
-        except Exception as e:
-            logging.error(f"Erro no bot: {e}")
-            logging.info("Aguardando 30 segundos antes de reiniciar...")
-            time.sleep(30)
+    # Sem post_init: o componente de polling já remove o webhook antigo (drop_pending_updates),
+    # e uma pausa ali só atrasaria a primeira resposta
+    async def encerrar(app):
+        await cliente_cotacao.fechar()
+        historico_cotacoes.sincronizar()
+
+    application.post_shutdown = encerrar
+
+    # Os timeouts de leitura/escrita/conexão ficam com o HTTPXRequest da Application
+    # (o get_updates do polling usa os mesmos)
+    supervisor = Supervisor([
+        componente_web(servidor_web),
+        componente_polling(application, drop_pending_updates=True, timeout=30, poll_interval=1),
+        componente_tarefas(application.job_queue),
+    ], backoff_max=30)
+
+    logging.info("🤖 Bot iniciando no Render...")
+    # Os alertas carregam em uma thread enquanto a Application consulta a Bot API;
+    # o servidor web (health check do Render) sobe antes dos dois
+    asyncio.run(executar_supervisionado(application, supervisor, preparar=lambda: asyncio.to_thread(carregar_alertas),
+                                        antecipados=('web',)))
 
 if __name__ == '__main__':
-    # Inicia o servidor Flask em uma thread
-    flask_thread = Thread(target=run_flask)
-    flask_thread.daemon = True
-    flask_thread.start()
-    logging.info(f"🌐 Servidor web iniciado na porta {PORT}")
-    
-    # Inicia o bot
+    # Inicia o bot (o servidor web sobe junto, no mesmo event loop)
     main_bot()
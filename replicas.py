@@ -0,0 +1,244 @@
+"""Estado compartilhado entre réplicas do bot no mesmo host, em SQLite no modo WAL.
+
+Com mais de um processo do bot (Render e Replit podem subir outra
+instância, ou vários atrás de um balanceador no modo webhook), todos
+leem e gravam os alertas no mesmo banco:
+
+- `alertas`: os alertas ativos, com ids sequenciais do próprio banco
+  (nunca repetidos entre réplicas);
+- `eventos`: cada alteração (as mesmas entradas do diário do
+  DiarioAlertas), que as outras réplicas aplicam nos seus índices em
+  memória a cada sincronização;
+- `lideranca`: um arrendamento (lease) renovado pela réplica líder. Só
+  ela busca as cotações periodicamente e envia as notificações; se ela
+  parar de renovar, outra assume quando o prazo vence (ou na hora, se a
+  líder renunciar ao desligar).
+
+A classe tem a mesma interface do DiarioAlertas (carregar, registrar_*,
+compactar, fechar), então o bot usa um ou outro sem mudar o resto. No modo
+WAL leitores não bloqueiam o escritor; as escritas são transações curtas.
+"""
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import time
+
+from armazenamento import DiarioAlertas
+from modelos import Alerta
+
+PAPEL_VERIFICACAO = 'verificacao'
+RETENCAO_EVENTOS = 10_000  # Eventos mantidos depois da compactação
+MARGEM_LIDERANCA = 0.2  # Fração do prazo da liderança que a líder deixa de usar
+
+
+class EstadoCompartilhado:
+    """Alertas, eventos de alteração e liderança em um banco SQLite compartilhado."""
+
+    def __init__(self, caminho, replica=None, importar_de=None, retencao_eventos=RETENCAO_EVENTOS,
+                 relogio=time.time):
+        self.caminho = caminho
+        self.replica = replica or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.importar_de = importar_de  # alertas.json de antes do estado compartilhado
+        self.retencao_eventos = retencao_eventos
+        self._relogio = relogio  # Relógio de parede: o prazo da liderança vale entre processos
+        self.ultimo_evento = 0  # Último evento já aplicado nesta réplica
+        self.lider_ate = 0.0  # Prazo da liderança desta réplica (0 se não é a líder)
+        self.mandato = None
+        self.migracao_pendente = False  # Interface do DiarioAlertas: nada a migrar aqui
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        # Autocommit: as transações são abertas explicitamente com BEGIN IMMEDIATE. A carga
+        # inicial roda em outra thread (junto com a partida do bot), nunca ao mesmo tempo que o loop
+        self._conexao = sqlite3.connect(caminho, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._conexao.execute('PRAGMA synchronous=NORMAL')
+        self._conexao.executescript('''
+            CREATE TABLE IF NOT EXISTS alertas (id INTEGER PRIMARY KEY, chat_id, dados TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS alertas_chat ON alertas (chat_id);
+            CREATE TABLE IF NOT EXISTS eventos (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                                replica TEXT NOT NULL, entrada TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS lideranca (papel TEXT PRIMARY KEY, replica TEXT NOT NULL,
+                                                  expira_em REAL NOT NULL, mandato INTEGER NOT NULL);
+        ''')
+
+    def _transacao(self, funcao, *args):
+        """Executa funcao(cursor, *args) em uma transação de escrita."""
+        cursor = self._conexao.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            resultado = funcao(cursor, *args)
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+        return resultado
+
+    # --- Alertas (interface do DiarioAlertas) ---
+
+    def _importar(self, cursor):
+        """Copia os alertas locais antigos para o banco, uma única vez (a primeira réplica a subir)."""
+        if cursor.execute("SELECT 1 FROM contadores WHERE nome = 'importado'").fetchone():
+            return
+        cursor.execute("INSERT INTO contadores VALUES ('importado', 1)")
+        if not self.importar_de:
+            return
+        # Snapshot binário ou JSON e o diário ao lado; sem nenhum deles não há o que importar
+        alertas, proximo_id = DiarioAlertas(self.importar_de).carregar()
+        if not alertas:
+            return
+        for alerta in alertas:
+            if alerta.id is None:
+                alerta.id = proximo_id
+                proximo_id += 1
+            cursor.execute('INSERT OR REPLACE INTO alertas VALUES (?, ?, ?)',
+                           (alerta.id, alerta.chat_id, json.dumps(alerta.para_dict())))
+        cursor.execute("INSERT OR REPLACE INTO contadores VALUES ('alertas', ?)", (proximo_id - 1,))
+        logging.info(f"{len(alertas)} alertas importados de {self.importar_de} para {self.caminho}")
+
+    def _ler_tudo(self, cursor):
+        self._importar(cursor)
+        alertas = [Alerta.de_dict(json.loads(dados))
+                   for (dados,) in cursor.execute('SELECT dados FROM alertas ORDER BY id')]
+        linha = cursor.execute("SELECT valor FROM contadores WHERE nome = 'alertas'").fetchone()
+        ultimo = cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM eventos').fetchone()[0]
+        return alertas, (linha[0] if linha else 0) + 1, ultimo
+
+    def carregar(self):
+        """Alertas ativos e próximo id; as sincronizações seguintes partem daqui."""
+        alertas, proximo_id, self.ultimo_evento = self._transacao(self._ler_tudo)
+        return alertas, proximo_id
+
+    def novo_id(self):
+        """Id de alerta único entre as réplicas."""
+        def reservar(cursor):
+            cursor.execute("INSERT OR IGNORE INTO contadores VALUES ('alertas', 0)")
+            return cursor.execute("UPDATE contadores SET valor = valor + 1 WHERE nome = 'alertas' "
+                                  "RETURNING valor").fetchone()[0]
+        return self._transacao(reservar)
+
+    def novos_ids(self, quantidade):
+        """Faixa de `quantidade` ids reservada de uma vez (importação em lote)."""
+        def reservar(cursor):
+            cursor.execute("INSERT OR IGNORE INTO contadores VALUES ('alertas', 0)")
+            return cursor.execute("UPDATE contadores SET valor = valor + ? WHERE nome = 'alertas' "
+                                  "RETURNING valor", (quantidade,)).fetchone()[0]
+        ultimo = self._transacao(reservar)
+        return range(ultimo - quantidade + 1, ultimo + 1)
+
+    def _registrar(self, entrada, alterar):
+        def gravar(cursor):
+            alterar(cursor)
+            cursor.execute('INSERT INTO eventos (replica, entrada) VALUES (?, ?)',
+                           (self.replica, json.dumps(entrada, separators=(',', ':'))))
+        self._transacao(gravar)
+
+    def registrar_adicao(self, alerta):
+        dados = alerta.para_dict()
+        self._registrar({'op': 'adicionar', 'alerta': dados}, lambda c: c.execute(
+            'INSERT OR REPLACE INTO alertas VALUES (?, ?, ?)', (alerta.id, alerta.chat_id, json.dumps(dados))))
+
+    def registrar_adicoes(self, alertas):
+        if alertas:
+            alertas = [a.para_dict() for a in alertas]
+            self._registrar({'op': 'adicionar_lote', 'alertas': alertas}, lambda c: c.executemany(
+                'INSERT OR REPLACE INTO alertas VALUES (?, ?, ?)',
+                [(a['id'], a['chat_id'], json.dumps(a)) for a in alertas]))
+
+    def registrar_remocao(self, ids):
+        if ids:
+            ids = list(ids)
+            self._registrar({'op': 'remover', 'ids': ids},
+                            lambda c: c.executemany('DELETE FROM alertas WHERE id = ?', [(i,) for i in ids]))
+
+    def registrar_limpeza_chat(self, chat_id):
+        self._registrar({'op': 'limpar_chat', 'chat_id': chat_id},
+                        lambda c: c.execute('DELETE FROM alertas WHERE chat_id = ?', (chat_id,)))
+
+    def registrar_limpeza(self):
+        self._registrar({'op': 'limpar'}, lambda c: c.execute('DELETE FROM alertas'))
+
+    def novos_eventos(self):
+        """Alterações feitas pelas outras réplicas desde a última chamada.
+
+        Devolve None se esta réplica ficou para trás dos eventos já
+        descartados pela compactação: nesse caso é preciso recarregar tudo.
+        """
+        cursor = self._conexao.cursor()
+        cursor.execute('BEGIN')  # Leitura consistente: a compactação não apaga nada no meio
+        try:
+            primeiro = cursor.execute('SELECT MIN(seq) FROM eventos').fetchone()[0]
+            if primeiro is not None and primeiro > self.ultimo_evento + 1:
+                return None
+            linhas = cursor.execute('SELECT seq, replica, entrada FROM eventos WHERE seq > ? ORDER BY seq',
+                                    (self.ultimo_evento,)).fetchall()
+        finally:
+            cursor.execute('COMMIT')
+        if linhas:
+            self.ultimo_evento = linhas[-1][0]
+        return [json.loads(entrada) for _, replica, entrada in linhas if replica != self.replica]
+
+    def precisa_compactar(self, total_alertas):
+        primeiro = self._conexao.execute('SELECT MIN(seq) FROM eventos').fetchone()[0]
+        return primeiro is not None and self.ultimo_evento - primeiro >= 2 * self.retencao_eventos
+
+    async def compactar(self, alertas, proximo_id):
+        """Descarta os eventos antigos (os alertas já estão na tabela; não há snapshot)."""
+        apagados = self._transacao(lambda c: c.execute(
+            'DELETE FROM eventos WHERE seq <= ?', (self.ultimo_evento - self.retencao_eventos,)).rowcount)
+        if apagados:
+            logging.info(f"{apagados} eventos antigos descartados de {self.caminho}")
+        return True
+
+    def compactar_agora(self, alertas, proximo_id):
+        pass
+
+    # --- Liderança ---
+
+    def renovar_lideranca(self, duracao, papel=PAPEL_VERIFICACAO):
+        """Renova (ou assume, se vencido) o arrendamento do papel; indica se esta réplica é a líder."""
+        def tentar(cursor):
+            agora = self._relogio()
+            linha = cursor.execute('SELECT replica, expira_em, mandato FROM lideranca WHERE papel = ?',
+                                   (papel,)).fetchone()
+            if linha is not None and linha[0] != self.replica and linha[1] > agora:
+                return None, None
+            mandato = linha[2] if linha is not None and linha[0] == self.replica else (linha[2] + 1 if linha else 1)
+            cursor.execute('INSERT OR REPLACE INTO lideranca VALUES (?, ?, ?, ?)',
+                           (papel, self.replica, agora + duracao, mandato))
+            return agora + duracao, mandato
+        try:
+            prazo, mandato = self._transacao(tentar)
+        except sqlite3.Error as e:
+            # Banco ocupado ou indisponível: a liderança vale só até o prazo já obtido
+            logging.error(f"Erro ao renovar liderança: {e}")
+            return self.e_lider
+        # Margem de segurança: a líder para de agir um pouco antes de as outras poderem assumir
+        self.lider_ate = prazo - duracao * MARGEM_LIDERANCA if prazo else 0.0
+        self.mandato = mandato
+        return self.e_lider
+
+    @property
+    def e_lider(self):
+        return self._relogio() < self.lider_ate
+
+    def renunciar(self, papel=PAPEL_VERIFICACAO):
+        """Libera o arrendamento para outra réplica assumir sem esperar o prazo."""
+        if not self.lider_ate:
+            return
+        self.lider_ate = 0.0
+        try:
+            self._transacao(lambda c: c.execute('UPDATE lideranca SET expira_em = 0 WHERE papel = ? AND replica = ?',
+                                                (papel, self.replica)))
+        except sqlite3.Error as e:
+            logging.error(f"Erro ao renunciar à liderança: {e}")
+
+    def lider_atual(self, papel=PAPEL_VERIFICACAO):
+        """Réplica que detém o arrendamento em vigor (ou None)."""
+        linha = self._conexao.execute('SELECT replica, expira_em FROM lideranca WHERE papel = ?', (papel,)).fetchone()
+        return linha[0] if linha and linha[1] > self._relogio() else None
+
+    def fechar(self):
+        self._conexao.close()
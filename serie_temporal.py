@@ -0,0 +1,173 @@
+"""Série temporal compacta das cotações, em buffer circular mapeado em arquivo.
+
+Cada amostra ocupa 16 bytes (timestamp int64 em milissegundos + valor
+float64), contra centenas de bytes de um dict com string ISO. O arquivo é
+mapeado com mmap, então o histórico sobrevive a reinícios, e as consultas
+por intervalo usam busca binária nos timestamps (sempre crescentes) e
+agregações sobre fatias contíguas, sem percorrer a série inteira.
+
+Layout: cabeçalho de 64 bytes, depois `capacidade` timestamps e
+`capacidade` valores.
+"""
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections import namedtuple
+
+MAGICO = b'RBTS'
+VERSAO = 1
+CABECALHO = struct.Struct('<4sIQQQ')  # mágico, versão, capacidade, início, tamanho
+TAMANHO_CABECALHO = 64
+
+Amostra = namedtuple('Amostra', 'timestamp_ms valor')
+Vela = namedtuple('Vela', 'inicio_ms abertura maxima minima fechamento amostras')
+
+# Tamanhos de vela aceitos no /historico
+BUCKETS_MS = {'1m': 60_000, '1h': 3_600_000, '1d': 86_400_000}
+
+
+def agora_ms():
+    return int(time.time() * 1000)
+
+
+class SerieTemporal:
+    """Buffer circular de (timestamp, valor) persistido em um arquivo mapeado."""
+
+    def __init__(self, caminho, capacidade=500_000):
+        self.caminho = caminho
+        tamanho_arquivo = TAMANHO_CABECALHO + 16 * capacidade
+        novo = not os.path.exists(caminho)
+        if novo:
+            os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        self._arquivo = open(caminho, 'r+b' if not novo else 'w+b')
+        if novo:
+            self._arquivo.truncate(tamanho_arquivo)
+            self._arquivo.write(CABECALHO.pack(MAGICO, VERSAO, capacidade, 0, 0))
+            self._arquivo.flush()
+        self._mmap = mmap.mmap(self._arquivo.fileno(), 0)
+        magico, versao, capacidade_salva, self._inicio, self._tamanho = \
+            CABECALHO.unpack_from(self._mmap, 0)
+        if magico != MAGICO or versao != VERSAO:
+            raise ValueError(f"{caminho} não é uma série temporal válida")
+        # A capacidade gravada no arquivo prevalece sobre a configurada
+        self.capacidade = capacidade_salva
+        fim_ts = TAMANHO_CABECALHO + 8 * self.capacidade
+        self._memoria = memoryview(self._mmap)
+        self._timestamps = self._memoria[TAMANHO_CABECALHO:fim_ts].cast('q')
+        self._valores = self._memoria[fim_ts:fim_ts + 8 * self.capacidade].cast('d')
+
+    def __len__(self):
+        return self._tamanho
+
+    def _fisico(self, i):
+        return (self._inicio + i) % self.capacidade
+
+    def __getitem__(self, i):
+        """Amostra na posição lógica i (aceita índices negativos)."""
+        if i < 0:
+            i += self._tamanho
+        if not 0 <= i < self._tamanho:
+            raise IndexError('posição fora da série')
+        fisico = self._fisico(i)
+        return Amostra(self._timestamps[fisico], self._valores[fisico])
+
+    def _gravar_cabecalho(self):
+        CABECALHO.pack_into(self._mmap, 0, MAGICO, VERSAO, self.capacidade, self._inicio, self._tamanho)
+
+    def adicionar(self, valor, timestamp_ms=None):
+        """Acrescenta uma amostra em O(1); a mais antiga é descartada quando cheia."""
+        timestamp_ms = agora_ms() if timestamp_ms is None else int(timestamp_ms)
+        if self._tamanho:
+            # Mantém os timestamps crescentes, requisito da busca binária
+            timestamp_ms = max(timestamp_ms, self[-1].timestamp_ms)
+        fisico = self._fisico(self._tamanho)
+        self._timestamps[fisico] = timestamp_ms
+        self._valores[fisico] = valor
+        if self._tamanho < self.capacidade:
+            self._tamanho += 1
+        else:
+            self._inicio = (self._inicio + 1) % self.capacidade
+        self._gravar_cabecalho()
+
+    def ultimos(self, n):
+        """As n amostras mais recentes, da mais antiga para a mais nova."""
+        n = min(n, self._tamanho)
+        return [self[i] for i in range(self._tamanho - n, self._tamanho)]
+
+    def valores(self, n=None):
+        """Cópia compacta (array de float64) dos n valores mais recentes, em ordem."""
+        n = self._tamanho if n is None else min(n, self._tamanho)
+        resultado = array('d')
+        for fatia in self._fatias(self._tamanho - n, self._tamanho):
+            resultado.frombytes(fatia.cast('B'))
+        return resultado
+
+    def posicao(self, timestamp_ms):
+        """Primeira posição lógica com timestamp >= timestamp_ms (busca binária)."""
+        baixo, alto = 0, self._tamanho
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._timestamps[self._fisico(meio)] < timestamp_ms:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def _fatias(self, inicio, fim):
+        """Fatias físicas (sem cópia) que cobrem as posições lógicas [inicio, fim)."""
+        if inicio >= fim:
+            return []
+        a, b = self._fisico(inicio), self._fisico(fim - 1) + 1
+        if a < b:
+            return [self._valores[a:b]]
+        return [self._valores[a:], self._valores[:b]]
+
+    def intervalo(self, inicio_ms, fim_ms):
+        """Amostras com inicio_ms <= timestamp < fim_ms."""
+        return [self[i] for i in range(self.posicao(inicio_ms), self.posicao(fim_ms))]
+
+    def velas(self, inicio_ms, fim_ms, bucket_ms):
+        """Velas OHLC de `bucket_ms` entre inicio_ms e fim_ms (buckets vazios são omitidos).
+
+        Cada vela custa duas buscas binárias e um max/min sobre uma fatia
+        contígua da memória mapeada.
+        """
+        velas = []
+        bucket = inicio_ms - inicio_ms % bucket_ms
+        posicao = self.posicao(inicio_ms)
+        while bucket < fim_ms and posicao < self._tamanho:
+            proxima = self.posicao(min(bucket + bucket_ms, fim_ms))
+            if proxima > posicao:
+                fatias = self._fatias(posicao, proxima)
+                velas.append(Vela(
+                    inicio_ms=bucket,
+                    abertura=self[posicao].valor,
+                    maxima=max(max(f) for f in fatias),
+                    minima=min(min(f) for f in fatias),
+                    fechamento=self[proxima - 1].valor,
+                    amostras=proxima - posicao,
+                ))
+                posicao = proxima
+                bucket += bucket_ms
+            else:
+                # Pula direto para o bucket da próxima amostra
+                proximo_ts = self._timestamps[self._fisico(posicao)]
+                bucket = max(bucket + bucket_ms, proximo_ts - proximo_ts % bucket_ms)
+        return velas
+
+    def recarregar(self):
+        """Relê o cabeçalho: vê as amostras gravadas por outro processo no mesmo arquivo."""
+        _, _, _, self._inicio, self._tamanho = CABECALHO.unpack_from(self._mmap, 0)
+
+    def sincronizar(self):
+        """Força a gravação das páginas alteradas no disco."""
+        self._mmap.flush()
+
+    def fechar(self):
+        self._timestamps.release()
+        self._valores.release()
+        self._memoria.release()
+        self._mmap.close()
+        self._arquivo.close()
@@ -0,0 +1,94 @@
+"""Servidor HTTP assíncrono do bot: webhook do Telegram e páginas de status.
+
+Roda no mesmo event loop da Application (aiohttp), no lugar do Flask em
+uma thread separada. No modo webhook os updates chegam por POST e vão
+direto para a `update_queue`; no modo polling o servidor continua
+respondendo `/`, `/status` e `/health` para manter o host ativo.
+"""
+import hmac
+import logging
+
+from aiohttp import web
+from telegram import Update
+
+from supervisor import Componente
+
+
+class ServidorWeb:
+    """Servidor aiohttp compartilhado pelo webhook e pelas rotas de status."""
+
+    def __init__(self, application, porta=8080, host='0.0.0.0', caminho_webhook=None, segredo=None,
+                 tamanho_maximo=1024 ** 2):
+        self.application = application
+        self.porta = porta
+        self.host = host
+        self.caminho_webhook = caminho_webhook  # None: modo polling, sem rota de webhook
+        self.segredo = segredo
+        self.updates_recebidos = 0
+        self._app = web.Application(client_max_size=tamanho_maximo)  # Maior corpo aceito (bytes)
+        self._runner = None
+        self._site = None
+        if caminho_webhook:
+            self._app.router.add_post(caminho_webhook, self._receber_update)
+
+    def rota(self, caminho, handler, metodo='GET'):
+        """Registra uma rota; `handler(request)` devolve uma web.Response."""
+        self._app.router.add_route(metodo, caminho, handler)
+
+    async def _receber_update(self, request):
+        if self.segredo:
+            recebido = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(recebido, self.segredo):
+                return web.Response(status=403)
+        try:
+            dados = await request.json()
+            update = Update.de_json(dados, self.application.bot)
+        except Exception as e:
+            logging.error(f"Update inválido recebido no webhook: {e}")
+            return web.Response(status=400)
+        # Só enfileira: o processamento (concorrente) fica com a Application
+        await self.application.update_queue.put(update)
+        self.updates_recebidos += 1
+        return web.Response()
+
+    async def iniciar(self):
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, self.host, self.porta)
+        try:
+            await self._site.start()
+        except Exception:
+            # Porta ocupada, por exemplo: não deixa o runner pela metade para a próxima tentativa
+            await self.fechar()
+            raise
+        logging.info(f"🌐 Servidor web iniciado na porta {self.porta}")
+
+    @property
+    def ativo(self):
+        """Indica se o socket do servidor ainda aceita conexões."""
+        servidor = self._site._server if self._site is not None else None
+        return servidor is not None and servidor.is_serving()
+
+    async def fechar(self):
+        self._site = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def componente_web(servidor, nome='web'):
+    """O servidor web como componente do Supervisor."""
+    return Componente(nome, servidor.iniciar, servidor.fechar, lambda: servidor.ativo)
+
+
+def componente_webhook(application, url, segredo=None, nome='webhook'):
+    """Registro do webhook no Telegram como componente; só o primeiro descarta os updates pendentes."""
+    estado = {'descartar': True}
+
+    async def iniciar():
+        await application.bot.set_webhook(url=url, secret_token=segredo, drop_pending_updates=estado['descartar'],
+                                          allowed_updates=Update.ALL_TYPES)
+        estado['descartar'] = False
+        logging.info(f"Webhook registrado em {url}")
+
+    return Componente(nome, iniciar)
@@ -0,0 +1,323 @@
+"""Supervisão dos componentes do bot dentro do próprio processo.
+
+A Application, os alertas e o histórico são criados uma única vez; o que
+cai e volta são os componentes que dependem de rede: o polling (ou o
+registro do webhook), o servidor web e a fila de tarefas (JobQueue). Cada
+um é vigiado por uma tarefa própria e, ao falhar, só ele é reiniciado,
+com backoff exponencial e jitter (várias réplicas não voltam todas no
+mesmo instante). Um componente que ficou de pé por `estavel` segundos
+volta a contar as falhas do zero.
+"""
+import asyncio
+import contextlib
+import logging
+import random
+import signal
+import time
+
+from telegram.error import InvalidToken, TelegramError, TimedOut
+
+
+class Componente:
+    """Parte reiniciável do bot.
+
+    `iniciar` e `parar` são corrotinas sem argumentos; `ativo`, se
+    informada, é uma função chamada a cada vigia que devolve False quando
+    o componente caiu sozinho. Sem ela, só `Supervisor.falhou` (ou um erro
+    em `iniciar`) provoca um reinício.
+    """
+
+    def __init__(self, nome, iniciar, parar=None, ativo=None):
+        self.nome = nome
+        self.iniciar = iniciar
+        self.parar = parar
+        self.ativo = ativo
+
+
+class Supervisor:
+    """Inicia os componentes e reinicia cada um, isoladamente, quando falha."""
+
+    def __init__(self, componentes, backoff_base=1.0, backoff_max=60.0, estavel=60.0, intervalo=1.0,
+                 relogio=time.monotonic, ao_subir=None):
+        self.componentes = {c.nome: c for c in componentes}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.estavel = estavel  # Segundos no ar para zerar a sequência de falhas
+        self.intervalo = intervalo  # Segundos entre as consultas a `ativo`
+        self._relogio = relogio
+        self.ao_subir = ao_subir  # Chamada com o nome a cada vez que um componente fica no ar
+        self._no_ar = set()
+        self._falhas = {nome: 0 for nome in self.componentes}  # Falhas seguidas (define o backoff)
+        self._reinicios = {nome: 0 for nome in self.componentes}
+        self._ultimo_erro = {}
+        self._avisos = {nome: asyncio.Event() for nome in self.componentes}
+        self._parar = None
+        self._vigias = {}
+
+    def _espera_backoff(self, falhas):
+        """Backoff exponencial com jitter para a n-ésima falha seguida."""
+        espera = min(self.backoff_max, self.backoff_base * (2 ** (falhas - 1)))
+        return random.uniform(espera / 2, espera)
+
+    async def tentar(self, acao, parar, descricao):
+        """Repete a corrotina `acao()` com o mesmo backoff até dar certo; False se `parar` vier antes."""
+        falhas = 0
+        while True:
+            try:
+                await acao()
+                return True
+            except Exception as e:
+                falhas += 1
+                espera = self._espera_backoff(falhas)
+                logging.error(f"Erro ao {descricao}: {e}; nova tentativa em {espera:.1f}s")
+                if await self._aguardar(espera, parar):
+                    return False
+
+    def falhou(self, nome, erro=None):
+        """Avisa que o componente caiu (ex.: um callback de erro): ele será reiniciado."""
+        self._ultimo_erro[nome] = str(erro) if erro is not None else 'falha informada'
+        self._avisos[nome].set()
+
+    def no_ar(self, nome):
+        return nome in self._no_ar
+
+    def reinicios(self, nome):
+        return self._reinicios[nome]
+
+    def estatisticas(self):
+        return {nome: {'no_ar': nome in self._no_ar, 'reinicios': self._reinicios[nome],
+                       'falhas_seguidas': self._falhas[nome], 'ultimo_erro': self._ultimo_erro.get(nome)}
+                for nome in self.componentes}
+
+    async def _aguardar(self, segundos, *eventos):
+        """Dorme até `segundos` ou até um dos eventos; indica se algum foi acionado."""
+        esperas = [asyncio.ensure_future(e.wait()) for e in eventos]
+        try:
+            feitos, _ = await asyncio.wait(esperas, timeout=segundos, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for espera in esperas:
+                espera.cancel()
+        return bool(feitos)
+
+    async def _derrubar(self, componente):
+        self._no_ar.discard(componente.nome)
+        if componente.parar is None:
+            return
+        try:
+            await componente.parar()
+        except Exception as e:
+            logging.error(f"Erro ao parar o componente {componente.nome}: {e}")
+
+    async def _vigiar(self, componente):
+        nome = componente.nome
+        aviso = self._avisos[nome]
+        while not self._parar.is_set():
+            aviso.clear()
+            try:
+                await componente.iniciar()
+            except Exception as e:
+                self._ultimo_erro[nome] = str(e)
+                logging.error(f"Erro ao iniciar o componente {nome}: {e}")
+                await self._derrubar(componente)  # Limpa o que ficou pela metade
+                no_ar_desde = None
+            else:
+                self._no_ar.add(nome)
+                no_ar_desde = self._relogio()
+                logging.info(f"Componente {nome} no ar")
+                if self.ao_subir is not None:
+                    self.ao_subir(nome)
+                # Vigia até cair sozinho, ser dado como falho ou o bot parar
+                while not await self._aguardar(self.intervalo, aviso, self._parar):
+                    if componente.ativo is not None and not componente.ativo():
+                        self._ultimo_erro[nome] = 'parou sozinho'
+                        break
+                if self._parar.is_set():
+                    return
+                logging.error(f"Componente {nome} caiu: {self._ultimo_erro.get(nome)}")
+                await self._derrubar(componente)
+            if no_ar_desde is not None and self._relogio() - no_ar_desde >= self.estavel:
+                self._falhas[nome] = 0
+            self._falhas[nome] += 1
+            espera = self._espera_backoff(self._falhas[nome])
+            logging.info(f"Reiniciando o componente {nome} em {espera:.1f}s "
+                         f"({self._falhas[nome]}ª falha seguida)")
+            if await self._aguardar(espera, self._parar):
+                return
+            self._reinicios[nome] += 1
+
+    def iniciar(self, parar, nomes=None):
+        """Começa a vigiar os componentes `nomes` (todos os que faltam, se None), sem esperar que subam."""
+        self._parar = parar
+        for nome in self.componentes if nomes is None else nomes:
+            if nome not in self._vigias:
+                self._vigias[nome] = asyncio.create_task(self._vigiar(self.componentes[nome]),
+                                                         name=f"supervisor:{nome}")
+
+    async def encerrar(self):
+        """Para as vigias e os componentes no ar, na ordem inversa."""
+        if self._parar is None:
+            return
+        self._parar.set()
+        await asyncio.gather(*self._vigias.values(), return_exceptions=True)
+        for componente in reversed(list(self.componentes.values())):
+            if componente.nome in self._no_ar:
+                await self._derrubar(componente)
+
+    async def executar(self, parar):
+        """Mantém os componentes no ar até `parar` ser acionado; depois os para na ordem inversa."""
+        self.iniciar(parar)
+        try:
+            await parar.wait()
+        finally:
+            await self.encerrar()
+
+
+def componente_polling(application, nome='polling', error_callback=None, drop_pending_updates=None,
+                       timeout=10, poll_interval=0.0, allowed_updates=None):
+    """Long polling como componente: um laço próprio sobre bot.get_updates.
+
+    Os updates vão para a update_queue da Application, como no Updater, mas
+    o laço é uma tarefa nossa: se ela terminar (token inválido, erro fora da
+    Bot API), o supervisor vê pela própria tarefa e a reinicia. Erros de rede
+    passam por `error_callback` e são repetidos com espera crescente, sem
+    derrubar o componente. Só o primeiro início descarta os updates pendentes.
+    """
+    bot = application.bot
+    estado = {'tarefa': None, 'descartar': drop_pending_updates, 'offset': None}
+
+    async def laco():
+        espera = 0
+        while True:
+            try:
+                updates = await bot.get_updates(offset=estado['offset'], timeout=timeout,
+                                                allowed_updates=allowed_updates)
+            except TimedOut:
+                continue  # Long polling sem resposta a tempo: pede de novo na hora
+            except InvalidToken:
+                raise
+            except TelegramError as e:
+                if error_callback is not None:
+                    error_callback(e)
+                espera = min(30, max(1, espera * 1.5))
+                await asyncio.sleep(espera)
+                continue
+            espera = 0
+            for update in updates:
+                await application.update_queue.put(update)
+            if updates:
+                estado['offset'] = updates[-1].update_id + 1
+            if poll_interval:
+                await asyncio.sleep(poll_interval)
+
+    async def iniciar():
+        # Um webhook registrado impediria o getUpdates
+        await bot.delete_webhook(drop_pending_updates=estado['descartar'])
+        estado['descartar'] = None
+        estado['tarefa'] = asyncio.create_task(laco(), name=f"{nome}:get_updates")
+
+    async def parar():
+        tarefa, estado['tarefa'] = estado['tarefa'], None
+        if tarefa is None:
+            return
+        tarefa.cancel()
+        await asyncio.wait([tarefa])
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            logging.error(f"Polling abortado: {tarefa.exception()}")
+        if estado['offset'] is not None:
+            # Confirma ao Telegram os updates já entregues, para não voltarem no próximo início
+            try:
+                await bot.get_updates(offset=estado['offset'], timeout=0, limit=1, allowed_updates=allowed_updates)
+            except TelegramError as e:
+                logging.debug(f"Updates não confirmados ao parar o polling: {e}")
+
+    def ativo():
+        tarefa = estado['tarefa']
+        return tarefa is None or not tarefa.done()
+
+    return Componente(nome, iniciar, parar, ativo)
+
+
+def componente_tarefas(job_queue, agendar=None, nome='tarefas'):
+    """Agendador da JobQueue como componente.
+
+    Desligar o agendador descarta os jobs guardados nele: `agendar(job_queue)`
+    é chamada a cada início para agendar de novo os que faltarem.
+    """
+    async def iniciar():
+        await job_queue.start()
+        if agendar is not None:
+            agendar(job_queue)
+
+    return Componente(nome, iniciar, lambda: job_queue.stop(wait=False), lambda: job_queue.scheduler.running)
+
+
+def _fase(perfil, nome):
+    return perfil.fase(nome) if perfil is not None else contextlib.nullcontext()
+
+
+async def _inicializar(application, supervisor, parar, perfil):
+    """application.initialize (que consulta a Bot API) repetido com backoff; False se o bot parou antes."""
+    async def inicializar():
+        try:
+            await application.initialize()
+        except Exception:
+            # O Bot se dá por inicializado antes do get_me: sem isto a próxima
+            # tentativa passaria direto, sem os dados do bot
+            await application.bot.shutdown()
+            raise
+
+    with _fase(perfil, 'inicializacao'):
+        return await supervisor.tentar(inicializar, parar, 'inicializar o bot')
+
+
+async def executar_supervisionado(application, supervisor, parar=None, preparar=None, antecipados=(), perfil=None):
+    """Roda a Application com os componentes do supervisor até `parar` (SIGTERM/SIGINT por padrão).
+
+    A inicialização da Application é repetida com o mesmo backoff até dar
+    certo e corre junto com `preparar()` (corrotina opcional, ex.: carregar
+    o estado do disco); um erro em uma cancela a outra. Os componentes
+    `antecipados` (ex.: o servidor web do health check) sobem antes das
+    duas, os demais depois do start. post_init, post_stop e post_shutdown
+    rodam uma vez cada, como no run_polling. Com `perfil` (PerfilPartida),
+    cada etapa tem a duração registrada.
+    """
+    parar = parar or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows ou fora da thread principal
+
+    supervisor.iniciar(parar, antecipados)
+    try:
+        try:
+            tarefas = [asyncio.ensure_future(_inicializar(application, supervisor, parar, perfil))]
+            if preparar is not None:
+                tarefas.append(asyncio.ensure_future(preparar()))
+            try:
+                inicializada, *_ = await asyncio.gather(*tarefas)
+            except BaseException:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                raise
+            if not inicializada:
+                return
+            with _fase(perfil, 'post_init'):
+                if application.post_init:
+                    await application.post_init(application)
+            with _fase(perfil, 'start'):
+                await application.start()
+            try:
+                await supervisor.executar(parar)
+            finally:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+        finally:
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+    finally:
+        # Antecipados que subiram antes de uma partida interrompida
+        await supervisor.encerrar()